@@ -1,57 +1,34 @@
-import os
 from dotenv import load_dotenv
 import tkinter as tk
 from tkinter import ttk, messagebox
-import mysql.connector
+import database_connection as db
+import query_budget
 
 # load files variables from .env
 load_dotenv()
 
 
-# Access the environment variables
-db_host = os.getenv("MYSQL_HOST")
-db_port = os.getenv("MYSQL_PORT")
-db_name = os.getenv("MYSQL_DATABASE")
-db_user = os.getenv("MYSQL_USER")
-db_password = os.getenv("MYSQL_PASSWORD")
-
-def connect_db():
-    return mysql.connector.connect(
-        host=db_host,
-        port=db_port,
-        user=db_user,
-        password=db_password,
-        database=db_name
-    )
-
+# Fill a treeview and report in the status bar when rows were left out
+def show_rows(tree, rows, message):
+    tree.delete(*tree.get_children())
+    for row in rows:
+        tree.insert("", tk.END, values=row)
+    status_var.set(f"{message}{query_budget.truncation_note(rows)}")
 
 def fetch_data(tree, table):
     try:
-        conn = connect_db()
-        cursor = conn.cursor()
-        cursor.execute(f"SHOW COLUMNS FROM {table}")
-        cols = [col[0] for col in cursor.fetchall()]
+        cols = db.get_table_columns(table)
         if tree:
-            cursor.execute(f"SELECT * FROM {table}")
-            rows = cursor.fetchall()
-            tree.delete(*tree.get_children())
-            for row in rows:
-                tree.insert("", tk.END, values=row)
-        conn.close()
+            rows = db.fetch_all_data(table)
+            show_rows(tree, rows, f"{len(rows)} records loaded from {table}")
         return cols
     except Exception as e:
         messagebox.showerror("DB Error", str(e))
         return []
 def search_data(tree, table, column, value):
     try:
-        conn = connect_db()
-        cursor = conn.cursor()
-        cursor.execute(f"SELECT * FROM {table} WHERE {column} LIKE %s", (f"%{value}%",))
-        rows = cursor.fetchall()
-        tree.delete(*tree.get_children())
-        for row in rows:
-            tree.insert("", tk.END, values=row)
-        conn.close()
+        rows = db.search_data(table, column, value)
+        show_rows(tree, rows, f"Search complete - {len(rows)} matches found")
     except Exception as e:
         messagebox.showerror("Search Error", str(e))
 
@@ -83,11 +60,7 @@ def add_edit_form(table, columns, tree, data=None):
         label.pack(pady=2)
         
         if col == 'Vehicle_ID':  # Create dropdown for Vehicle selection
-            conn = connect_db()
-            cursor = conn.cursor()
-            cursor.execute("SELECT Vehicle_ID FROM Vehicle")
-            vehicle_ids = [str(vid[0]) for vid in cursor.fetchall()]
-            conn.close()
+            vehicle_ids = [str(item) for item in db.get_foreign_key_options("Vehicle", "Vehicle_ID")]
             
             var = tk.StringVar(value=data[idx] if data else "")
             combo = ttk.Combobox(scrollable_frame, values=vehicle_ids, textvariable=var)
@@ -95,11 +68,7 @@ def add_edit_form(table, columns, tree, data=None):
             entries.append((col, var))
             
         elif col == 'Service_Provider_ID':  # Create dropdown for Service Provider selection
-            conn = connect_db()
-            cursor = conn.cursor()
-            cursor.execute("SELECT Service_Provider_ID FROM Service_Provider")
-            provider_ids = [str(pid[0]) for pid in cursor.fetchall()]
-            conn.close()
+            provider_ids = [str(item) for item in db.get_foreign_key_options("Service_Provider", "Service_Provider_ID")]
             
             var = tk.StringVar(value=data[idx] if data else "")
             combo = ttk.Combobox(scrollable_frame, values=provider_ids, textvariable=var)
@@ -115,17 +84,10 @@ def add_edit_form(table, columns, tree, data=None):
     def save():
         values = [v.get() for _, v in entries]
         try:
-            conn = connect_db()
-            cursor = conn.cursor()
             if data:
-                set_clause = ", ".join([f"{col}=%s" for col, _ in entries[1:]])
-                cursor.execute(f"UPDATE {table} SET {set_clause} WHERE {entries[0][0]}=%s", values[1:] + [values[0]])
+                db.update_data(table, [col for col, _ in entries[1:]], values[1:], entries[0][0], values[0])
             else:
-                col_clause = ", ".join([col for col, _ in entries])
-                q_clause = ", ".join(["%s"] * len(entries))
-                cursor.execute(f"INSERT INTO {table} ({col_clause}) VALUES ({q_clause})", values)
-            conn.commit()
-            conn.close()
+                db.insert_data(table, [col for col, _ in entries], values)
             fetch_data(tree, table)
             form.destroy()
         except Exception as e:
@@ -144,13 +106,9 @@ def delete_selected(table, tree):
     
     if messagebox.askyesno("Confirm Delete", "Are you sure you want to delete this record?"):
         try:
-            conn = connect_db()
-            cursor = conn.cursor()
             item = tree.item(selected[0])
             record_id = item["values"][0]
-            cursor.execute(f"DELETE FROM {table} WHERE {tree['columns'][0]}=%s", (record_id,))
-            conn.commit()
-            conn.close()
+            db.delete_data(table, tree["columns"][0], record_id)
             fetch_data(tree, table)
         except Exception as e:
             messagebox.showerror("Delete Error", str(e))
@@ -164,6 +122,10 @@ root = tk.Tk()
 root.title("Service Management Portal")
 root.geometry("1200x800")
 
+# Status bar under the tabs
+status_var = tk.StringVar(value="Ready")
+tk.Label(root, textvariable=status_var, anchor="w", relief="sunken").pack(side="bottom", fill="x")
+
 notebook = ttk.Notebook(root)
 notebook.pack(expand=True, fill="both")
 
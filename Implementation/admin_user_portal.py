@@ -3,11 +3,14 @@ import return_to_admin
 
 import tkinter as tk
 from tkinter import ttk, messagebox
-import threading
 from dotenv import load_dotenv
 import logging
 import database_connection as db
 import form_utils
+import data_import
+import task_runner
+import global_search
+import search_predicates
 
 # Configure logging
 logging.basicConfig(
@@ -23,6 +26,9 @@ logger = logging.getLogger("admin_portal")
 # Load environment variables
 load_dotenv()
 
+# Rows per page of the advanced search results
+RESULTS_PAGE_SIZE = int(os.getenv("SEARCH_RESULTS_PAGE_SIZE", "200"))
+
 # Global variables for tracking loaded tabs
 loaded_tabs = {}
 
@@ -40,8 +46,12 @@ class AdminPortal:
         self.loading_label = tk.Label(root, text="Initializing...", font=("Arial", 16))
         self.loading_label.pack(expand=True)
         
-        # Create the UI in a separate thread to keep the window responsive
-        threading.Thread(target=self.setup_ui, daemon=True).start()
+        # Widget updates from background tasks are applied on this thread
+        task_runner.ui.attach(self.root)
+        
+        # Build the tabs once the loading message is on screen; Tk widgets
+        # must be created on the main thread
+        self.root.after_idle(self.setup_ui)
     
     def create_menu(self):
         """Create application menu"""
@@ -50,6 +60,7 @@ class AdminPortal:
         # File menu
         file_menu = tk.Menu(menubar, tearoff=0)
         file_menu.add_command(label="Export All Data", command=self.export_all_data)
+        file_menu.add_command(label="Import Data...", command=self.show_import_dialog)
         file_menu.add_separator()
         file_menu.add_command(label="Exit", command=self.root.quit)
         menubar.add_cascade(label="File", menu=file_menu)
@@ -58,6 +69,8 @@ class AdminPortal:
         tools_menu = tk.Menu(menubar, tearoff=0)
         tools_menu.add_command(label="Refresh All Data", command=self.refresh_all_data)
         tools_menu.add_command(label="Advanced Search", command=self.show_advanced_search)
+        tools_menu.add_command(label="Create Search Indexes", command=self.create_search_indexes)
+        tools_menu.add_command(label="Index Advisor", command=self.show_index_advisor)
         menubar.add_cascade(label="Tools", menu=tools_menu)
         
         # Help menu
@@ -70,6 +83,132 @@ class AdminPortal:
         # Add admin navigation
         return_to_admin.add_return_button(self.root, menubar)
     
+    def create_search_indexes(self):
+        """Add the FULLTEXT indexes used for ranked text searches"""
+        if not messagebox.askyesno(
+            "Create Search Indexes",
+            "Add FULLTEXT indexes to the name, address, description and instruction columns?\n"
+            "Each table is rebuilt while its index is created, which can take a while on large tables."
+        ):
+            return
+        
+        def created(names):
+            if names:
+                messagebox.showinfo("Search Indexes", "Created:\n" + "\n".join(names))
+            else:
+                messagebox.showinfo("Search Indexes", "All search indexes already exist")
+        
+        def failed(e):
+            logger.error(f"Error creating search indexes: {e}")
+            messagebox.showerror("Search Indexes", str(e))
+        
+        task_runner.submit(
+            db.create_fulltext_indexes, priority=task_runner.BULK, key="create_search_indexes",
+            on_success=created, on_error=failed
+        )
+    
+    def show_index_advisor(self):
+        """Proposed indexes for the queries run so far, and the managed
+        index migrations"""
+        window = tk.Toplevel(self.root)
+        window.title("Index Advisor")
+        window.geometry("1000x600")
+        
+        # Proposals from the recorded query fingerprints
+        proposals_frame = ttk.LabelFrame(window, text="Proposed Indexes (estimated from the queries run by this portal)")
+        proposals_frame.pack(fill="both", expand=True, padx=10, pady=5)
+        proposals_tree = ttk.Treeview(proposals_frame, columns=("table", "columns", "kind", "saving", "cost", "queries"),
+                                      show="headings", selectmode="extended")
+        for col, text, width in (("table", "Table", 160), ("columns", "Columns", 330), ("kind", "Kind", 80),
+                                 ("saving", "Est. Saving (ms)", 110), ("cost", "Write Cost (ms)", 110),
+                                 ("queries", "Queries", 70)):
+            proposals_tree.heading(col, text=text)
+            proposals_tree.column(col, width=width, anchor="w" if col in ("table", "columns") else "center")
+        proposals_tree.pack(fill="both", expand=True)
+        
+        # Managed indexes: seed set and accepted proposals
+        migrations_frame = ttk.LabelFrame(window, text="Managed Indexes (schema_migrations)")
+        migrations_frame.pack(fill="both", expand=True, padx=10, pady=5)
+        migrations_tree = ttk.Treeview(migrations_frame, columns=("version", "description", "status", "applied"),
+                                       show="headings", selectmode="browse")
+        for col, text, width in (("version", "Version", 300), ("description", "Description", 400),
+                                 ("status", "Status", 80), ("applied", "Applied At", 150)):
+            migrations_tree.heading(col, text=text)
+            migrations_tree.column(col, width=width, anchor="w" if col in ("version", "description") else "center")
+        migrations_tree.pack(fill="both", expand=True)
+        
+        status_var = tk.StringVar(value="Loading...")
+        ttk.Label(window, textvariable=status_var, relief="sunken", anchor="w").pack(fill="x", side="bottom")
+        
+        proposals = {}
+        
+        def load():
+            task_runner.submit(lambda: (db.get_index_advice(), db.get_index_migrations()),
+                               priority=task_runner.NORMAL, view=str(window),
+                               on_success=show, on_error=failed)
+        
+        def show(result):
+            advice, migrations = result
+            proposals.clear()
+            proposals_tree.delete(*proposals_tree.get_children())
+            for proposal in advice:
+                item = proposals_tree.insert("", "end", values=(
+                    proposal.table, ", ".join(proposal.columns), proposal.kind,
+                    f"{proposal.benefit_ms:.0f}", f"{proposal.write_cost_ms:.0f}", proposal.queries
+                ))
+                proposals[item] = proposal
+            migrations_tree.delete(*migrations_tree.get_children())
+            for migration in migrations:
+                migrations_tree.insert("", "end", iid=migration["version"], values=(
+                    migration["version"], migration["description"], migration["status"],
+                    migration["applied_at"] or ""
+                ))
+            pending = sum(1 for migration in migrations if migration["status"] == "pending")
+            status_var.set(f"{len(advice)} proposals, {pending} pending migrations")
+        
+        def failed(e):
+            logger.error(f"Index advisor error: {e}")
+            status_var.set(f"Error: {str(e)[:80]}")
+            messagebox.showerror("Index Advisor", str(e), parent=window)
+        
+        # Function to run index DDL in the background and reload
+        def run(description, func, *args):
+            if not messagebox.askyesno("Index Advisor", f"{description}?\n"
+                                       "Indexes are built online, but large tables take a while.", parent=window):
+                return
+            status_var.set(f"{description}...")
+            
+            def done(result):
+                if isinstance(result, tuple) and result[1]:
+                    messagebox.showwarning("Index Advisor", "Skipped (table or column missing):\n" + "\n".join(result[1]),
+                                           parent=window)
+                load()
+            
+            task_runner.submit(func, *args, priority=task_runner.BULK,
+                               on_success=done, on_error=failed)
+        
+        def apply_selected():
+            selected = [proposals[item] for item in proposals_tree.selection() if item in proposals]
+            if selected:
+                run(f"Create {len(selected)} index(es)", db.apply_index_migrations,
+                    [proposal.migration() for proposal in selected])
+        
+        def revert_selected():
+            selection = migrations_tree.selection()
+            if selection and migrations_tree.set(selection[0], "status") == "applied":
+                run(f"Drop the index of {selection[0]}", db.revert_index_migration, selection[0])
+        
+        button_frame = ttk.Frame(window)
+        button_frame.pack(fill="x", padx=10, pady=5)
+        ttk.Button(button_frame, text="Apply Selected Proposals", command=apply_selected).pack(side="left", padx=5)
+        ttk.Button(button_frame, text="Apply Pending Migrations",
+                   command=lambda: run("Apply the pending migrations", db.apply_index_migrations)).pack(side="left", padx=5)
+        ttk.Button(button_frame, text="Revert Selected Migration", command=revert_selected).pack(side="left", padx=5)
+        ttk.Button(button_frame, text="Refresh", command=load).pack(side="left", padx=5)
+        ttk.Button(button_frame, text="Close", command=window.destroy).pack(side="right", padx=5)
+        
+        load()
+    
     def export_all_data(self):
         """Export all data to CSV files"""
         from tkinter import filedialog
@@ -127,31 +266,133 @@ class AdminPortal:
             
             for i, table in enumerate(all_tables):
                 try:
-                    # Update progress
+                    # Update progress in main thread
                     progress = (i / total_tables) * 100
-                    progress_var.set(progress)
-                    status_var.set(f"Exporting {table}...")
+                    task_runner.ui.call(progress_var.set, progress)
+                    task_runner.ui.call(status_var.set, f"Exporting {table}...")
                     
                     # Create filename
                     filename = os.path.join(export_dir, f"{table}.csv")
                     
-                    # Export the data
-                    db.export_data_to_csv(table, filename)
-                    
-                    # Brief pause to update UI
-                    progress_window.update()
+                    # Export the data, streaming rows straight to the file
+                    db.export_data_to_csv(
+                        table, filename,
+                        progress_callback=lambda n, t=table: task_runner.ui.call(
+                            status_var.set, f"Exporting {t}... {n} rows"
+                        )
+                    )
                 except Exception as e:
                     logger.error(f"Error exporting {table}: {e}")
-            
-            # Complete
+        
+        # Function to finish up in main thread
+        def exported(result):
             progress_var.set(100)
             status_var.set("Export complete!")
             
             # Close after a delay
             progress_window.after(1500, progress_window.destroy)
         
-        # Run export in background thread
-        threading.Thread(target=do_export, daemon=True).start()
+        # Run export on the shared worker pool
+        task_runner.submit(do_export, priority=task_runner.BULK, key=("export_all", export_dir),
+                           on_success=exported)
+    
+    def show_import_dialog(self):
+        """Import a CSV or JSONL file into a table"""
+        from tkinter import filedialog
+        
+        import_window = tk.Toplevel(self.root)
+        import_window.title("Import Data")
+        import_window.geometry("500x330")
+        import_window.transient(self.root)
+        import_window.grab_set()
+        
+        # Table selection
+        ttk.Label(import_window, text="Import into table:").pack(anchor="w", padx=20, pady=(20, 5))
+        
+        tables = [table for tables in self.sections.values() for table in tables]
+        table_var = tk.StringVar(value=tables[0] if tables else "")
+        ttk.Combobox(import_window, textvariable=table_var, values=tables, state="readonly").pack(fill="x", padx=20)
+        
+        # File selection
+        ttk.Label(import_window, text="File (CSV or JSONL):").pack(anchor="w", padx=20, pady=(10, 5))
+        
+        file_frame = ttk.Frame(import_window)
+        file_frame.pack(fill="x", padx=20)
+        
+        file_var = tk.StringVar()
+        ttk.Entry(file_frame, textvariable=file_var).pack(side="left", fill="x", expand=True)
+        
+        def browse():
+            filename = filedialog.askopenfilename(
+                parent=import_window,
+                filetypes=[("CSV files", "*.csv"), ("JSON Lines", "*.jsonl"), ("All files", "*.*")]
+            )
+            if filename:
+                file_var.set(filename)
+                # Default the table to the file name, as written by Export All Data
+                name = os.path.splitext(os.path.basename(filename))[0]
+                if name in tables:
+                    table_var.set(name)
+        
+        ttk.Button(file_frame, text="Browse...", command=browse).pack(side="left", padx=5)
+        
+        dry_run_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(import_window, text="Dry run (check the file without writing)", 
+                        variable=dry_run_var).pack(anchor="w", padx=20, pady=10)
+        
+        progress_var = tk.DoubleVar()
+        ttk.Progressbar(import_window, variable=progress_var, maximum=100).pack(fill="x", padx=20)
+        
+        status_var = tk.StringVar(value="Select a table and a file")
+        ttk.Label(import_window, textvariable=status_var, wraplength=450).pack(pady=10)
+        
+        def do_import():
+            table = table_var.get()
+            filename = file_var.get()
+            if not table or not filename:
+                messagebox.showinfo("Import", "Please select a table and a file", parent=import_window)
+                return
+            
+            dry_run = dry_run_var.get()
+            reject_filename = f"{os.path.splitext(filename)[0]}_rejects.csv"
+            status_var.set("Importing..." if not dry_run else "Checking file...")
+            
+            def on_progress(processed, rejected, bytes_read, total_bytes):
+                def update():
+                    if total_bytes:
+                        progress_var.set(bytes_read / total_bytes * 100)
+                    status_var.set(f"{processed} rows read, {rejected} rejected")
+                task_runner.ui.call(update)
+            
+            def imported(summary):
+                message = (f"{'Would import' if dry_run else 'Imported'} {summary['imported']} rows "
+                           f"into {table}, {summary['rejected']} rejected "
+                           f"({summary['rows_per_second']:.0f} rows/s)")
+                if summary["rejected"] or summary["warnings"]:
+                    # LOAD DATA reports the server's warnings instead of the rows
+                    written = "Server warnings" if summary["method"] == "load_data" else "Rejected rows"
+                    message += f"\n{written} written to {reject_filename}"
+                progress_var.set(100)
+                status_var.set(message)
+            
+            def failed(e):
+                logger.error(f"Import error: {e}")
+                status_var.set(f"Import error: {e}")
+            
+            task_runner.submit(
+                data_import.import_file, table, filename,
+                dry_run=dry_run,
+                reject_filename=reject_filename,
+                progress_callback=on_progress,
+                priority=task_runner.BULK,
+                on_success=imported, on_error=failed
+            )
+        
+        button_frame = ttk.Frame(import_window)
+        button_frame.pack(fill="x", padx=20, pady=10)
+        
+        ttk.Button(button_frame, text="Import", command=do_import).pack(side="left", padx=5)
+        ttk.Button(button_frame, text="Close", command=import_window.destroy).pack(side="right", padx=5)
     
     def refresh_all_data(self):
         """Refresh all loaded treeviews"""
@@ -244,6 +485,15 @@ class AdminPortal:
         # Initially populate
         update_criteria_fields()
         
+        # How values are read, and whether any or all criteria must match
+        options_frame = ttk.Frame(search_window)
+        options_frame.pack(fill="x", padx=20)
+        ttk.Label(options_frame, text=search_predicates.SYNTAX_HELP, wraplength=640,
+                  foreground="gray").pack(side="top", anchor="w")
+        match_any_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(options_frame, text="Match any criterion (instead of all)",
+                        variable=match_any_var).pack(side="top", anchor="w", pady=2)
+        
         # Results frame
         results_frame = ttk.LabelFrame(search_window, text="Results")
         results_frame.pack(fill="both", expand=True, padx=20, pady=10)
@@ -256,7 +506,10 @@ class AdminPortal:
         button_frame = ttk.Frame(search_window)
         button_frame.pack(fill="x", padx=20, pady=15)
         
-        def do_search():
+        page_var = tk.StringVar()
+        current_page = [1]
+        
+        def do_search(page=1):
             # Get the selected table
             selected_table = table_var.get()
             if not selected_table:
@@ -269,11 +522,11 @@ class AdminPortal:
                     search_params.append((col, var.get()))
             
             try:
-                # Perform search
-                if search_params:
-                    rows, _ = db.advanced_search_data(selected_table, search_params)
-                else:
-                    rows, _ = db.fetch_data_paginated(selected_table)
+                # Perform search, one page at a time
+                rows, total = db.advanced_search_data(selected_table, search_params, page=page,
+                                                      page_size=RESULTS_PAGE_SIZE,
+                                                      match_any=match_any_var.get())
+                current_page[0] = page
                 
                 # Update treeview columns
                 columns = db.get_table_columns(selected_table)
@@ -291,10 +544,27 @@ class AdminPortal:
                 for row in rows:
                     results_tree.insert("", "end", values=row)
                 
+                first = (page - 1) * RESULTS_PAGE_SIZE
+                if rows:
+                    page_var.set(f"{first + 1}-{first + len(rows)} of {total} matches")
+                else:
+                    page_var.set("No matches" if not total else f"Page {page} is past the last of {total} matches")
+                prev_button.state(["!disabled"] if page > 1 else ["disabled"])
+                next_button.state(["!disabled"] if getattr(rows, "truncated", False) else ["disabled"])
+                
+            except search_predicates.PredicateError as e:
+                messagebox.showwarning("Search", str(e), parent=search_window)
             except Exception as e:
                 messagebox.showerror("Search Error", str(e))
         
         ttk.Button(button_frame, text="Search", command=do_search).pack(side="left", padx=5)
+        prev_button = ttk.Button(button_frame, text="< Prev", state="disabled",
+                                 command=lambda: do_search(current_page[0] - 1))
+        prev_button.pack(side="left", padx=5)
+        next_button = ttk.Button(button_frame, text="Next >", state="disabled",
+                                 command=lambda: do_search(current_page[0] + 1))
+        next_button.pack(side="left", padx=5)
+        ttk.Label(button_frame, textvariable=page_var).pack(side="left", padx=10)
         ttk.Button(button_frame, text="Export Results", 
                   command=lambda: form_utils.export_to_csv(search_window, results_tree, table_var.get())
                  ).pack(side="left", padx=5)
@@ -398,6 +668,9 @@ class AdminPortal:
     
     def setup_ui(self):
         """Setup the main UI structure"""
+        # Search box for every table, above the tabs
+        self.setup_global_search()
+        
         # Initialize main notebook
         self.notebook = ttk.Notebook(self.root)
         
@@ -444,6 +717,9 @@ class AdminPortal:
             ]
         }
         
+        # Tab of each table, for opening global search results
+        self.table_tabs = {}
+        
         # Setup tabs for each section
         for section_name, tables in self.sections.items():
             section_tab = ttk.Frame(self.notebook)
@@ -463,6 +739,7 @@ class AdminPortal:
                 
                 # Store the tab id for lazy loading
                 tab_id = sub_notebook.tabs()[-1]
+                self.table_tabs[table] = (section_tab, sub_notebook, tab)
                 
             # Add callback for tab selection to implement lazy loading
             sub_notebook.bind("<<NotebookTabChanged>>", 
@@ -478,6 +755,119 @@ class AdminPortal:
         self.root.after(0, self.loading_label.destroy)
         self.root.after(0, lambda: self.notebook.pack(expand=True, fill="both"))
     
+    def setup_global_search(self):
+        """Search box that looks for a term in every table at once"""
+        search_frame = ttk.Frame(self.root)
+        search_frame.pack(fill="x", padx=10, pady=(5, 0))
+        
+        ttk.Label(search_frame, text="Search all tables:").pack(side="left")
+        self.global_search_var = tk.StringVar()
+        search_entry = ttk.Entry(search_frame, textvariable=self.global_search_var, width=40)
+        search_entry.pack(side="left", padx=5)
+        search_entry.bind("<Return>", lambda event: self.run_global_search())
+        ttk.Button(search_frame, text="Search", command=self.run_global_search).pack(side="left")
+        
+        self.global_search = None
+        self.global_search_window = None
+    
+    def run_global_search(self):
+        """Search every table and stream the matches into the results window"""
+        term = self.global_search_var.get().strip()
+        if len(term) < 2:
+            messagebox.showinfo("Search", "Please enter at least two characters to search for")
+            return
+        
+        if self.global_search_window is None or not self.global_search_window.winfo_exists():
+            self.create_global_search_window()
+        window = self.global_search_window
+        results_tree = self.global_results_tree
+        window.title(f"Search Results - {term}")
+        window.lift()
+        
+        # Replace the results of the previous search
+        if self.global_search is not None:
+            self.global_search.cancel()
+        results_tree.delete(*results_tree.get_children())
+        self.global_hits = {}
+        
+        tables = [table for tables in self.sections.values() for table in tables]
+        self.global_status_var.set(f"Searching {len(tables)} tables for '{term}'...")
+        
+        # Function to add the matches of one table, keeping the groups
+        # ordered by their best match
+        def add_results(table, hits, truncated):
+            count = f"{len(hits)}+" if truncated else str(len(hits))
+            group = results_tree.insert(
+                "", "end", text=f"{table.replace('_', ' ')} ({count})", open=True,
+                values=("", "", hits[0]["score"])
+            )
+            for hit in hits:
+                key = ", ".join(str(value) for value in hit["key"])
+                item = results_tree.insert(group, "end", text=f"{table} #{key}",
+                                           values=(hit["column"], hit["value"], hit["score"]))
+                self.global_hits[item] = hit
+            groups = sorted(results_tree.get_children(""),
+                            key=lambda g: float(results_tree.set(g, "score")), reverse=True)
+            for index, g in enumerate(groups):
+                results_tree.move(g, "", index)
+            self.global_status_var.set(f"Searching... {len(self.global_hits)} matches so far")
+        
+        # Function to summarize once every table answered or time ran out
+        def finished(summary):
+            message = (f"{len(self.global_hits)} matches in {len(results_tree.get_children(''))} tables "
+                       f"({summary['seconds']:.1f}s)")
+            if summary["timed_out"]:
+                message += f" - timed out: {', '.join(summary['timed_out'])}"
+            if summary["failed"]:
+                message += f" - failed: {', '.join(summary['failed'])}"
+            self.global_status_var.set(message)
+        
+        self.global_search = global_search.GlobalSearch(window, tables, term, add_results, finished).start()
+    
+    def create_global_search_window(self):
+        """Window listing global search matches grouped by table"""
+        window = tk.Toplevel(self.root)
+        window.geometry("900x500")
+        
+        tree_frame = ttk.Frame(window)
+        tree_frame.pack(fill="both", expand=True, padx=10, pady=10)
+        results_tree = ttk.Treeview(tree_frame, columns=("column", "value", "score"), show="tree headings")
+        results_tree.heading("#0", text="Record")
+        results_tree.heading("column", text="Matched Column")
+        results_tree.heading("value", text="Match")
+        results_tree.heading("score", text="Score")
+        results_tree.column("#0", width=220)
+        results_tree.column("score", width=60, anchor="center")
+        vsb = ttk.Scrollbar(tree_frame, orient="vertical", command=results_tree.yview)
+        results_tree.configure(yscrollcommand=vsb.set)
+        results_tree.pack(side="left", fill="both", expand=True)
+        vsb.pack(side="right", fill="y")
+        results_tree.bind("<Double-1>", lambda event: self.open_global_search_hit())
+        
+        self.global_status_var = tk.StringVar()
+        ttk.Label(window, textvariable=self.global_status_var, relief="sunken", anchor="w").pack(fill="x", side="bottom")
+        
+        # Function to stop a running search with its window
+        def close():
+            if self.global_search is not None:
+                self.global_search.cancel()
+            window.destroy()
+        window.protocol("WM_DELETE_WINDOW", close)
+        
+        self.global_search_window = window
+        self.global_results_tree = results_tree
+    
+    def open_global_search_hit(self):
+        """Show the tab of the table of the selected match"""
+        selection = self.global_results_tree.selection()
+        hit = self.global_hits.get(selection[0]) if selection else None
+        if hit is None or hit["table"] not in self.table_tabs:
+            return
+        section_tab, sub_notebook, tab = self.table_tabs[hit["table"]]
+        self.notebook.select(section_tab)
+        sub_notebook.select(tab)
+        self.root.lift()
+    
     def tab_selected(self, event, notebook, tables):
         """Callback for when a tab is selected"""
         selected_tab = notebook.select()
@@ -504,34 +894,37 @@ class AdminPortal:
                     for subchild in child.winfo_children():
                         if isinstance(subchild, ttk.Treeview):
                             tree = subchild
-                            # Fetch data in a separate thread to avoid freezing UI
-                            threading.Thread(
-                                target=lambda: self.fetch_and_update_tree(tree, table),
-                                daemon=True
-                            ).start()
+                            # Fetch data in the background to avoid freezing UI
+                            self.fetch_and_update_tree(tree, table)
                             break
             # Mark tab as loaded
             loaded_tabs[tab_id] = True
     
     def fetch_and_update_tree(self, tree, table, search_params=None):
         """Fetch data and update treeview in a non-blocking way"""
-        try:
+        # Function to run on the shared worker pool
+        def fetch():
             if search_params:
                 column, value = search_params
-                rows = db.search_data(table, column, value)
-            else:
-                rows, _ = db.fetch_data_paginated(table)
-            
-            # Update UI in the main thread
-            tree.after(0, lambda: self.populate_tree(tree, rows))
-        except Exception as e:
-            tree.after(0, lambda: messagebox.showerror("Data Error", str(e)))
+                return db.search_data(table, column, value)
+            return form_utils.fetch_tree_page(tree, table)
+        
+        # The treeview is updated in the main thread
+        task_runner.submit(
+            fetch, priority=task_runner.INTERACTIVE, key=("load", str(tree)), view=str(tree),
+            on_success=lambda rows: self.populate_tree(tree, rows, bool(search_params)),
+            on_error=lambda e: messagebox.showerror("Data Error", str(e))
+        )
     
-    def populate_tree(self, tree, data):
+    def populate_tree(self, tree, data, is_search=False):
         """Populate treeview with data"""
         tree.delete(*tree.get_children())
         for row in data:
             tree.insert("", tk.END, values=row)
+        if is_search:
+            form_utils.update_search_label(tree, data)
+        else:
+            form_utils.update_page_label(tree)
 
 # Main application entry point
 def main():
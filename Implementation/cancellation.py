@@ -0,0 +1,83 @@
+import logging
+import threading
+import contextvars
+
+logger = logging.getLogger("cancellation")
+
+# Token of the task running on this thread; set by the task runner
+current_token = contextvars.ContextVar("current_token", default=None)
+
+class QueryCancelled(Exception):
+    """The work was cancelled, usually because a newer request replaced it"""
+
+class CancelToken:
+    """Cancellation flag shared by a background task and its requester
+
+    Code doing cancellable work registers a callback while it is blocked
+    (e.g. a running statement registers a KILL QUERY for its connection).
+    cancel() runs the callbacks on a helper thread so the Tk thread never
+    waits for the server; remove() waits for a callback that is already
+    running, so a connection is never handed back to the pool while a
+    KILL for it is still on its way.
+    """
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.cancelled = False
+        self.callbacks = []
+        self.running = set()
+
+    def cancel(self):
+        """Request cancellation; returns False if it was already cancelled"""
+        with self.cond:
+            if self.cancelled:
+                return False
+            self.cancelled = True
+            callbacks = list(self.callbacks)
+            self.running.update(callbacks)
+        if callbacks:
+            threading.Thread(target=self._run_callbacks, args=(callbacks,),
+                             name="cancel", daemon=True).start()
+        return True
+
+    def _run_callbacks(self, callbacks):
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"Error cancelling background work: {e}")
+            finally:
+                with self.cond:
+                    self.running.discard(callback)
+                    self.cond.notify_all()
+
+    def add_callback(self, callback):
+        """Register callback() to run on cancel(); raises QueryCancelled
+        if the token is already cancelled"""
+        with self.cond:
+            self.check()
+            self.callbacks.append(callback)
+            return callback
+
+    def remove_callback(self, callback):
+        """Unregister a callback, waiting for it if cancel() is running it"""
+        with self.cond:
+            if callback in self.callbacks:
+                self.callbacks.remove(callback)
+            while callback in self.running:
+                self.cond.wait()
+
+    def check(self):
+        """Raise QueryCancelled if the token was cancelled"""
+        if self.cancelled:
+            raise QueryCancelled("Cancelled by a newer request")
+
+def check():
+    """Raise QueryCancelled if the current task was cancelled"""
+    token = current_token.get()
+    if token is not None:
+        token.check()
+
+def is_cancelled():
+    token = current_token.get()
+    return token is not None and token.cancelled
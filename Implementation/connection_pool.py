@@ -0,0 +1,335 @@
+import time
+import logging
+import threading
+from collections import deque
+from mysql.connector.errors import PoolError
+
+logger = logging.getLogger("connection_pool")
+
+# Upper bounds (ms) of the wait-time histogram buckets
+WAIT_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+# Returned by _checkout when the caller should open a new connection
+OPEN_SLOT = (None, None, None)
+
+class PoolTimeoutError(PoolError):
+    """No connection became free within the pool timeout"""
+
+class PooledConnection:
+    """A borrowed connection; close() returns it to the pool
+
+    Everything else is passed through to the underlying connection, which
+    is also available as _cnx like mysql.connector's own pooled connections.
+    """
+
+    def __init__(self, pool, cnx, created, wait=0.0):
+        self._pool = pool
+        self._cnx = cnx
+        self._created = created
+        self._pool_wait = wait
+        self._cursors = []
+
+    def __getattr__(self, name):
+        cnx = self.__dict__.get("_cnx")
+        if cnx is None:
+            raise AttributeError(f"Connection already returned to the pool ({name})")
+        return getattr(cnx, name)
+
+    def cursor(self, *args, **kwargs):
+        cnx = self.__dict__.get("_cnx")
+        if cnx is None:
+            raise AttributeError("Connection already returned to the pool (cursor)")
+        cursor = cnx.cursor(*args, **kwargs)
+        # Prepared cursors outlive the borrow (they are cached per
+        # connection), so their caller records them instead
+        if self._pool.cursor_wrapper and not kwargs.get("prepared"):
+            cursor = self._pool.cursor_wrapper(cursor, self)
+            self._cursors.append(cursor)
+        return cursor
+
+    def close(self):
+        cnx, self._cnx = self._cnx, None
+        if cnx is not None:
+            # Let wrapped cursors record statements that are still open
+            for cursor in self._cursors:
+                try:
+                    cursor.finish()
+                except Exception:
+                    pass
+            self._cursors = []
+            self._pool._release(cnx, self._created)
+
+class ConnectionPool:
+    """Bounded MySQL connection pool with health checks and live statistics
+
+    Callers wait in line for a free connection instead of opening extra
+    ones. Idle connections are pinged before reuse and replaced after
+    max_lifetime. With adaptive sizing the pool grows (up to max_size)
+    while callers keep waiting longer than target_wait_ms, and shrinks
+    (down to min_size) while connections sit idle.
+    """
+
+    def __init__(self, connect, size=5, min_size=1, max_size=10, timeout=10.0,
+                 validate_idle=30.0, max_lifetime=1800.0, target_wait_ms=50.0,
+                 adaptive=True, cursor_wrapper=None):
+        """
+        Args:
+            connect: Callable opening a new database connection
+            size: Initial number of connections the pool may open
+            min_size, max_size: Limits for adaptive sizing
+            timeout: Seconds to wait for a free connection
+            validate_idle: Ping connections idle for longer than this
+            max_lifetime: Replace connections older than this
+            target_wait_ms: Wait time above which the pool grows
+            adaptive: Resize the pool based on measured wait times
+            cursor_wrapper: Optional callable(cursor, connection) wrapping
+                every cursor handed out except prepared ones, e.g. for
+                instrumentation
+        """
+        self.connect = connect
+        self.min_size = max(1, min_size)
+        self.max_size = max(self.min_size, max_size)
+        self.size = min(max(size, self.min_size), self.max_size)
+        self.timeout = timeout
+        self.validate_idle = validate_idle
+        self.max_lifetime = max_lifetime
+        self.target_wait_ms = target_wait_ms
+        self.adaptive = adaptive
+        self.cursor_wrapper = cursor_wrapper
+
+        self.cond = threading.Condition()
+        self.idle = deque()  # (connection, created, returned) newest last
+        self.open_count = 0
+        self.in_use = 0
+        self.queue = deque()  # one slot list per waiting caller, first come first served
+        self.recent_waits = deque(maxlen=100)
+        self.last_resize = time.monotonic()
+        self.counters = {
+            "acquired": 0, "timeouts": 0, "created": 0,
+            "recycled": 0, "failed_checks": 0, "grown": 0, "shrunk": 0,
+        }
+        self.wait_histogram = [0] * (len(WAIT_BUCKETS_MS) + 1)
+        self.total_wait = 0.0
+        self.borrowed = {}  # id(connection) -> created, for age stats
+
+    def get_connection(self, timeout=None):
+        """Borrow a connection, waiting up to timeout seconds for one"""
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+
+        cnx, created, returned = self._checkout(deadline)
+        if cnx is None:
+            cnx, created = self._open()
+        else:
+            # Replace idle connections that are too old or no longer answer
+            now = time.monotonic()
+            if now - created > self.max_lifetime:
+                self._discard(cnx, "recycled")
+                cnx, created = self._open()
+            elif now - returned > self.validate_idle and not self._is_alive(cnx):
+                self._discard(cnx, "failed_checks")
+                cnx, created = self._open()
+
+        wait = time.monotonic() - start
+        self._record_wait(wait)
+        with self.cond:
+            self.borrowed[id(cnx)] = created
+        return PooledConnection(self, cnx, created, wait)
+
+    def _checkout(self, deadline):
+        """Reserve a slot: return an idle connection, or (None, ...) when
+        the caller should open a new one"""
+        with self.cond:
+            if not self.queue:
+                if self.idle:
+                    self.in_use += 1
+                    return self.idle.pop()
+                if self.open_count < self.size:
+                    self.open_count += 1
+                    self.in_use += 1
+                    return OPEN_SLOT
+
+            # Wait in line; _hand_off fills the slot of the first waiter
+            slot = []
+            self.queue.append(slot)
+            self._maybe_grow()
+            while not slot:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.queue.remove(slot)
+                    self.counters["timeouts"] += 1
+                    self._maybe_grow(force=True)
+                    raise PoolTimeoutError(
+                        f"No database connection free after {self.timeout:.1f}s "
+                        f"({self.in_use} in use, {len(self.queue)} waiting)"
+                    )
+                self.cond.wait(remaining)
+            return slot[0]
+
+    def _hand_off(self, item):
+        """Give an idle connection or OPEN_SLOT to the first waiter (lock held)"""
+        slot = self.queue.popleft()
+        slot.append(item)
+        self.in_use += 1
+        self.cond.notify_all()
+
+    def _offer_new_slot(self):
+        """Let the first waiter open a connection if the pool has room (lock held)"""
+        if self.queue and self.open_count < self.size:
+            self.open_count += 1
+            self._hand_off(OPEN_SLOT)
+
+    def _open(self):
+        """Open a connection for a slot reserved by _checkout"""
+        try:
+            cnx = self.connect()
+        except Exception:
+            with self.cond:
+                self.open_count -= 1
+                self.in_use -= 1
+                self._offer_new_slot()
+            raise
+        with self.cond:
+            self.counters["created"] += 1
+        return cnx, time.monotonic()
+
+    def _discard(self, cnx, reason):
+        """Close a connection whose slot is reused by the caller, counting
+        it under reason (recycled or failed_checks)"""
+        with self.cond:
+            self.counters[reason] += 1
+            self.borrowed.pop(id(cnx), None)
+        try:
+            cnx.close()
+        except Exception:
+            pass
+
+    def _is_alive(self, cnx):
+        try:
+            cnx.ping(reconnect=False)
+            return True
+        except Exception as e:
+            logger.warning(f"Dropping dead pooled connection: {e}")
+            return False
+
+    def _release(self, cnx, created):
+        """Take a connection back from a caller"""
+        reusable = True
+        try:
+            if cnx.unread_result:
+                cnx.consume_results()
+            if cnx.in_transaction:
+                cnx.rollback()
+        except Exception as e:
+            logger.warning(f"Closing connection that could not be reset: {e}")
+            reusable = False
+
+        with self.cond:
+            self.borrowed.pop(id(cnx), None)
+            self.in_use -= 1
+            if reusable and self.open_count <= self.size:
+                item = (cnx, created, time.monotonic())
+                cnx = None
+                if self.queue:
+                    self._hand_off(item)
+                else:
+                    self.idle.append(item)
+                    self._maybe_shrink()
+            else:
+                self.open_count -= 1
+                self._offer_new_slot()
+
+        if cnx is not None:
+            try:
+                cnx.close()
+            except Exception:
+                pass
+
+    def _record_wait(self, seconds):
+        ms = seconds * 1000
+        with self.cond:
+            self.counters["acquired"] += 1
+            self.total_wait += seconds
+            self.recent_waits.append(ms)
+            for i, bound in enumerate(WAIT_BUCKETS_MS):
+                if ms <= bound:
+                    self.wait_histogram[i] += 1
+                    break
+            else:
+                self.wait_histogram[-1] += 1
+            self._maybe_grow()
+
+    def _p90_wait(self):
+        waits = sorted(self.recent_waits)
+        return waits[int(len(waits) * 0.9)] if waits else 0.0
+
+    def _maybe_grow(self, force=False):
+        """Allow one more connection while callers wait too long (lock held)"""
+        if not self.adaptive or self.size >= self.max_size or not (self.queue or force):
+            return
+        if not force and self._p90_wait() <= self.target_wait_ms:
+            return
+        if time.monotonic() - self.last_resize < 0.2:
+            return
+        self.size += 1
+        self.last_resize = time.monotonic()
+        self.recent_waits.clear()
+        self.counters["grown"] += 1
+        logger.info(f"Connection pool grown to {self.size}")
+        self._offer_new_slot()
+
+    def _maybe_shrink(self):
+        """Close one idle connection when the pool has been quiet (lock held)"""
+        if not self.adaptive or self.size <= self.min_size:
+            return
+        if self.queue or time.monotonic() - self.last_resize < 60.0:
+            return
+        if len(self.idle) * 2 < self.size or self._p90_wait() > 1.0:
+            return
+        self.size -= 1
+        self.last_resize = time.monotonic()
+        self.counters["shrunk"] += 1
+        if self.open_count > self.size and self.idle:
+            cnx = self.idle.popleft()[0]
+            self.open_count -= 1
+            try:
+                cnx.close()
+            except Exception:
+                pass
+        logger.info(f"Connection pool shrunk to {self.size}")
+
+    def close_idle(self):
+        """Close every idle connection, e.g. on shutdown"""
+        with self.cond:
+            idle, self.idle = list(self.idle), deque()
+            self.open_count -= len(idle)
+        for cnx, _, _ in idle:
+            try:
+                cnx.close()
+            except Exception:
+                pass
+
+    def get_stats(self):
+        """Return a snapshot of pool usage and wait statistics"""
+        now = time.monotonic()
+        with self.cond:
+            ages = [now - created for _, created, _ in self.idle]
+            ages += [now - created for created in self.borrowed.values()]
+            acquired = self.counters["acquired"]
+            labels = [f"<={bound}ms" for bound in WAIT_BUCKETS_MS] + [f">{WAIT_BUCKETS_MS[-1]}ms"]
+            return dict(
+                self.counters,
+                size=self.size,
+                min_size=self.min_size,
+                max_size=self.max_size,
+                open=self.open_count,
+                in_use=self.in_use,
+                idle=len(self.idle),
+                waiters=len(self.queue),
+                avg_wait_ms=self.total_wait * 1000 / acquired if acquired else 0.0,
+                p90_wait_ms=self._p90_wait(),
+                wait_histogram=dict(zip(labels, self.wait_histogram)),
+                oldest_connection_age=max(ages) if ages else 0.0,
+                mean_connection_age=sum(ages) / len(ages) if ages else 0.0,
+            )
@@ -6,6 +6,7 @@ from tkinter import ttk, messagebox, filedialog
 import logging
 from dotenv import load_dotenv
 import database_connection as db
+import query_budget
 import form_utils
 
 # Configure logging
@@ -227,6 +228,11 @@ class CustomerManagement:
                 for row in rows:
                     results_tree.insert("", "end", values=row)
                 
+                # Say so when the matches were cut at the row limit
+                if getattr(rows, "truncated", False):
+                    messagebox.showinfo("Search", f"{len(rows)} matches shown{query_budget.truncation_note(rows)}",
+                                        parent=search_window)
+                
             except Exception as e:
                 logger.error(f"Search error: {e}")
                 messagebox.showerror("Search Error", str(e))
@@ -0,0 +1,384 @@
+import os
+import csv
+import json
+import time
+import logging
+from itertools import islice
+import database_connection as db
+
+logger = logging.getLogger("data_import")
+
+def detect_format(filename):
+    """Guess the file format from its extension"""
+    extension = os.path.splitext(filename)[1].lower()
+    if extension in (".jsonl", ".ndjson", ".json"):
+        return "jsonl"
+    return "csv"
+
+def resolve_columns(table, source_columns, column_map=None):
+    """Map the columns found in a file onto the columns of a table
+
+    Args:
+        table: Database table name
+        source_columns: Column names from the file header or JSON keys
+        column_map: Optional {file column: table column} overrides
+
+    Returns a list with the table column for each source column, or None
+    for source columns that do not exist in the table.
+    """
+    table_columns = db.get_table_columns(table)
+    if not table_columns:
+        raise ValueError(f"Unknown table: {table}")
+
+    by_lower = {col.lower(): col for col in table_columns}
+    column_map = column_map or {}
+
+    mapping = []
+    for source in source_columns:
+        target = column_map.get(source)
+        if target is None:
+            target = by_lower.get(str(source).strip().lower())
+        if target is not None and target not in table_columns:
+            raise ValueError(f"Unknown column {target} for {table}")
+        mapping.append(target)
+
+    if not any(mapping):
+        raise ValueError(f"No columns in the file match the columns of {table}")
+
+    skipped = [s for s, t in zip(source_columns, mapping) if t is None]
+    if skipped:
+        logger.warning(f"Ignoring columns not in {table}: {', '.join(map(str, skipped))}")
+    return mapping
+
+class _ByteCounter:
+    """Iterate lines of a binary file while counting the bytes read"""
+    def __init__(self, f, encoding="utf-8-sig"):
+        self.f = f
+        self.encoding = encoding
+        self.bytes_read = 0
+
+    def __iter__(self):
+        first = True
+        for line in self.f:
+            self.bytes_read += len(line)
+            # utf-8-sig only strips a BOM from the start of the file
+            text = line.decode(self.encoding if first else "utf-8")
+            first = False
+            yield text
+
+def read_rows(filename, file_format, counter_holder=None):
+    """Yield (line_number, source_columns, values) for every record of a file
+
+    CSV files must have a header row. JSONL files hold one object per line.
+    counter_holder, if given, is a list that receives the _ByteCounter so
+    callers can report progress.
+    """
+    with open(filename, "rb") as f:
+        counter = _ByteCounter(f)
+        if counter_holder is not None:
+            counter_holder.append(counter)
+
+        if file_format == "csv":
+            reader = csv.reader(counter)
+            header = next(reader, None)
+            if header is None:
+                return
+            for row in reader:
+                if not row:
+                    continue
+                yield reader.line_num, header, row
+        elif file_format == "jsonl":
+            for line_number, line in enumerate(counter, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    yield line_number, None, f"Invalid JSON: {e}"
+                    continue
+                if not isinstance(record, dict):
+                    yield line_number, None, "Line is not a JSON object"
+                    continue
+                yield line_number, list(record.keys()), list(record.values())
+        else:
+            raise ValueError(f"Unknown import format: {file_format}")
+
+def server_allows_local_infile():
+    """Check whether the server accepts LOAD DATA LOCAL INFILE"""
+    try:
+        result = db.execute_query("SHOW VARIABLES LIKE 'local_infile'")
+        return bool(result) and str(result[0][1]).upper() in ("ON", "1")
+    except Exception as e:
+        logger.error(f"Error checking local_infile: {e}")
+        return False
+
+def _line_terminator(filename):
+    """Return the line ending used by a file"""
+    with open(filename, "rb") as f:
+        chunk = f.read(65536)
+    return "\r\n" if b"\r\n" in chunk else "\n"
+
+def _count_valid_rows(table, filename, mapping, batch_size):
+    """Return the number of rows of a CSV file if every row passes the
+    in-process checks (types, ranges, lengths, NOT NULL), else None
+
+    LOAD DATA bypasses the validators, so it is only used for files that
+    pass them. Key checks need the database and are left to the server,
+    which skips rows with a duplicate or missing key and warns about them.
+    """
+    validator = db.get_validator(table)
+    columns = [target for target in mapping if target]
+    rows = read_rows(filename, "csv")
+    count = 0
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return count
+        values = []
+        for line_number, _, row in batch:
+            if len(row) != len(mapping):
+                logger.info(f"Line {line_number} of {filename} has the wrong number of values, using batched inserts")
+                return None
+            values.append([None if value == "" else value for target, value in zip(mapping, row) if target])
+        failures = validator.validate_many(columns, values)
+        if failures:
+            line_number = batch[min(failures)][0]
+            logger.info(f"Line {line_number} of {filename} fails validation, using batched inserts")
+            return None
+        count += len(batch)
+
+def load_data_infile(table, filename, mapping, reject_file=None):
+    """Load a CSV file with LOAD DATA LOCAL INFILE
+
+    Every file column is read into a user variable so empty strings can be
+    turned into NULL, matching what export_data_to_csv writes for NULL.
+    The server does not run the validators; import_file checks the file
+    with them first. Rows that break a key are skipped by the server (LOCAL
+    implies IGNORE) with a warning. Returns (rows_loaded, warnings); the
+    warnings are written to reject_file as level, code, message.
+    """
+    variables = []
+    assignments = []
+    for i, target in enumerate(mapping):
+        variable = f"@c{i}"
+        variables.append(variable)
+        if target:
+            assignments.append(f"{target} = NULLIF({variable}, '')")
+
+    terminator = _line_terminator(filename).replace("\r", "\\r").replace("\n", "\\n")
+    query = (
+        f"LOAD DATA LOCAL INFILE %s INTO TABLE {table} "
+        f"CHARACTER SET utf8mb4 "
+        f"FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' "
+        f"LINES TERMINATED BY '{terminator}' IGNORE 1 LINES "
+        f"({', '.join(variables)}) SET {', '.join(assignments)}"
+    )
+
+    conn = None
+    try:
+        conn = db.get_direct_connection(allow_local_infile=True)
+        cursor = conn.cursor()
+        cursor.execute(query, (os.path.abspath(filename),))
+        rows_loaded = cursor.rowcount
+
+        cursor.execute("SHOW WARNINGS")
+        warnings = cursor.fetchall()
+        conn.commit()
+    except Exception:
+        if conn:
+            conn.rollback()
+        raise
+    finally:
+        if conn:
+            conn.close()
+
+    # Rows were validated before loading; record what the server skipped or warned about
+    if reject_file and warnings:
+        writer = csv.writer(reject_file)
+        writer.writerow(["level", "code", "message"])
+        writer.writerows(warnings)
+
+    db.notify_table_write(table)
+    return rows_loaded, len(warnings)
+
+def import_file(table, filename, file_format=None, column_map=None,
+                batch_size=1000, dry_run=False, reject_filename=None,
+                progress_callback=None, use_load_data=True):
+    """Import a CSV or JSONL file into a table
+
+    Args:
+        table: Database table name
+        filename: File to import
+        file_format: "csv" or "jsonl", guessed from the extension if None
+        column_map: Optional {file column: table column} overrides
+        batch_size: Rows per INSERT when loading through executemany
+        dry_run: Parse, map and validate every row without writing anything
+        reject_filename: CSV file that receives rows that could not be
+            imported, with the line number and reason
+        progress_callback: Called as progress_callback(processed, rejected,
+            bytes_read, total_bytes)
+        use_load_data: Try LOAD DATA LOCAL INFILE for CSV files when the
+            server allows it
+
+    Returns a summary dict with method, processed, imported, rejected,
+    warnings, seconds and rows_per_second. A CSV file is handed to LOAD
+    DATA only when every row passes the in-process checks; key violations
+    are then left to the server, and the rows it skipped are counted as
+    rejected, with its warnings in the reject file.
+    """
+    file_format = file_format or detect_format(filename)
+    total_bytes = os.path.getsize(filename)
+    start = time.monotonic()
+
+    reject_file = open(reject_filename, "w", newline="") if reject_filename else None
+    try:
+        # Fast path: the server parses the file itself
+        if (use_load_data and not dry_run and file_format == "csv"
+                and server_allows_local_infile()):
+            with open(filename, newline="", encoding="utf-8-sig") as f:
+                header = next(csv.reader(f), [])
+            mapping = resolve_columns(table, header, column_map)
+            count = _count_valid_rows(table, filename, mapping, batch_size)
+            if count is not None:
+                try:
+                    loaded, warnings = load_data_infile(table, filename, mapping, reject_file)
+                    summary = {
+                        "method": "load_data",
+                        "processed": count,
+                        "imported": loaded,
+                        "rejected": max(count - loaded, 0),
+                        "warnings": warnings,
+                    }
+                    if progress_callback:
+                        progress_callback(count, summary["rejected"], total_bytes, total_bytes)
+                    return _finish(table, summary, start)
+                except Exception as e:
+                    logger.warning(f"LOAD DATA failed for {table}, using batched inserts: {e}")
+
+        summary = _import_batched(
+            table, filename, file_format, column_map, batch_size,
+            dry_run, reject_file, progress_callback, total_bytes
+        )
+        return _finish(table, summary, start)
+    finally:
+        if reject_file:
+            reject_file.close()
+
+def _finish(table, summary, start):
+    """Add timing to an import summary and log it"""
+    elapsed = time.monotonic() - start
+    summary["seconds"] = elapsed
+    summary["rows_per_second"] = summary["imported"] / elapsed if elapsed > 0 else 0
+    logger.info(
+        f"Import into {table} ({summary['method']}): {summary['imported']} imported, "
+        f"{summary['rejected']} rejected, {summary['warnings']} warnings in {elapsed:.2f}s"
+    )
+    return summary
+
+def _validate_group(table, columns, group, reject):
+    """Check a group of rows against the compiled validator of the table
+
+    Rows that fail type, NOT NULL, UNIQUE or foreign key checks are
+    rejected with the reason; the rows that pass are returned.
+    """
+    validator = db.get_validator(table)
+    columns = list(columns)
+    rows = [row for _, row in group]
+
+    failures = validator.validate_many(columns, rows)
+    try:
+        for i, errors in validator.check_keys(columns, rows, db.find_existing_keys).items():
+            failures.setdefault(i, []).extend(errors)
+    except Exception as e:
+        # The insert itself will still enforce the constraints
+        logger.warning(f"Skipping key checks for {table}: {e}")
+
+    valid = []
+    for i, (line_number, row) in enumerate(group):
+        if i in failures:
+            reject(line_number, ", ".join(failures[i]), row)
+        else:
+            valid.append((line_number, row))
+    return valid
+
+def _import_batched(table, filename, file_format, column_map, batch_size,
+                    dry_run, reject_file, progress_callback, total_bytes):
+    """Parse a file in Python and insert it in batches"""
+    counter_holder = []
+    reject_writer = None
+    if reject_file:
+        reject_writer = csv.writer(reject_file)
+        reject_writer.writerow(["line", "reason", "values"])
+
+    stats = {"processed": 0, "imported": 0, "rejected": 0}
+    mappings = {}
+
+    def reject(line_number, reason, values):
+        stats["rejected"] += 1
+        if reject_writer:
+            reject_writer.writerow([line_number, reason, json.dumps(values, default=str)])
+
+    def prepared_rows():
+        """Yield (line_number, columns, values) ready to insert"""
+        for line_number, source_columns, values in read_rows(filename, file_format, counter_holder):
+            stats["processed"] += 1
+            if source_columns is None:
+                reject(line_number, values, None)
+                continue
+
+            key = tuple(source_columns)
+            if key not in mappings:
+                mappings[key] = resolve_columns(table, source_columns, column_map)
+            mapping = mappings[key]
+
+            if len(values) != len(mapping):
+                reject(line_number, f"Expected {len(mapping)} values, found {len(values)}", values)
+                continue
+
+            columns = []
+            row = []
+            for target, value in zip(mapping, values):
+                if target:
+                    columns.append(target)
+                    row.append(None if value == "" else value)
+            yield line_number, tuple(columns), row
+
+    def report():
+        if progress_callback and counter_holder:
+            progress_callback(stats["processed"], stats["rejected"],
+                              counter_holder[0].bytes_read, total_bytes)
+
+    rows = prepared_rows()
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+
+        # JSONL records may have different keys, so group by column set
+        groups = {}
+        for line_number, columns, row in batch:
+            groups.setdefault(columns, []).append((line_number, row))
+
+        for columns, group in groups.items():
+            group = _validate_group(table, columns, group, reject)
+            if not group:
+                continue
+            if dry_run:
+                stats["imported"] += len(group)
+                continue
+            try:
+                db.bulk_insert(table, list(columns), [row for _, row in group], batch_size)
+                stats["imported"] += len(group)
+            except Exception:
+                # Retry row by row so only the bad rows are rejected
+                for line_number, row in group:
+                    try:
+                        db.bulk_insert(table, list(columns), [row], 1)
+                        stats["imported"] += 1
+                    except Exception as e:
+                        reject(line_number, str(e), row)
+        report()
+
+    report()
+    return dict(stats, warnings=0, method="dry_run" if dry_run else "batched")
@@ -1,8 +1,29 @@
 import os
+import re
+import time
 import logging
+import threading
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+from itertools import islice
 from dotenv import load_dotenv
 import mysql.connector
-from mysql.connector import pooling
+from connection_pool import ConnectionPool, PoolTimeoutError, WAIT_BUCKETS_MS
+from schema_catalog import SchemaCatalog
+from result_cache import ResultCache, is_cacheable, tables_read, table_written
+from query_stats import QueryRecorder, InstrumentedCursor, take_pool_wait, LATENCY_BUCKETS_MS
+from query_explain import PlanCapture
+from single_flight import SingleFlight
+from trigram_index import SearchIndexes, RowChange
+import fulltext_search
+import search_predicates
+import index_advisor
+import validators
+import tracing
+import metrics
+import cancellation
+import query_budget
 
 # Set up logging
 logging.basicConfig(
@@ -25,96 +46,466 @@ db_name = os.getenv("MYSQL_DATABASE")
 db_user = os.getenv("MYSQL_USER")
 db_password = os.getenv("MYSQL_PASSWORD")
 
-# Create connection pool
-try:
-    connection_pool = mysql.connector.pooling.MySQLConnectionPool(
-        pool_name="fleet_management_pool",
-        pool_size=5,
+# Connection pool settings
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+POOL_VALIDATE_IDLE = float(os.getenv("DB_POOL_VALIDATE_IDLE", "30"))
+POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "1800"))
+POOL_TARGET_WAIT_MS = float(os.getenv("DB_POOL_TARGET_WAIT_MS", "50"))
+POOL_ADAPTIVE = os.getenv("DB_POOL_ADAPTIVE", "1") not in ("0", "false", "False", "no")
+CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "10"))
+
+def _connect():
+    return mysql.connector.connect(
         host=db_host,
         port=db_port,
         user=db_user,
         password=db_password,
-        database=db_name
+        database=db_name,
+        connection_timeout=CONNECT_TIMEOUT
     )
-    logger.info("Connection Pool created successfully")
-except Exception as e:
-    logger.error(f"Error creating connection pool: {e}")
+
+# Per-statement latency statistics and slow-query log
+QUERY_STATS = os.getenv("QUERY_STATS", "1") not in ("0", "false", "False", "no")
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "500"))
+query_recorder = QueryRecorder(
+    slow_ms=SLOW_QUERY_MS,
+    slow_log_file=os.getenv("SLOW_QUERY_LOG", "slow_queries.log")
+)
+
+def _instrument_cursor(cursor, connection):
+    return InstrumentedCursor(cursor, query_recorder, connection)
+
+def get_query_stats(top=None, sort_by="total_ms"):
+    """Return latency stats per statement fingerprint, heaviest first"""
+    return query_recorder.get_stats(top, sort_by)
+
+# Slow SELECTs are explained on a side connection; the plan is written to
+# the slow-query log right after the statement
+EXPLAIN_SLOW_QUERIES = os.getenv("EXPLAIN_SLOW_QUERIES", "1") not in ("0", "false", "False", "no")
+plan_capture = PlanCapture(lambda: get_direct_connection(), plan_log=query_recorder.slow_log)
+if EXPLAIN_SLOW_QUERIES:
+    query_recorder.on_slow_query(plan_capture.submit)
+
+def get_slow_query_plans():
+    """Return recent slow statements with their EXPLAIN plan and flags
+    (full_scans, index_scans, filesort, temporary)"""
+    return plan_capture.get_records()
+
+# Per-action traces (UI click to SQL and back); see tracing.py
+tracing.tracer.configure(
+    enabled=os.getenv("TRACING", "1") not in ("0", "false", "False", "no"),
+    keep=int(os.getenv("TRACE_KEEP", "100")),
+    trace_file=os.getenv("TRACE_FILE") or None
+)
+
+# The pool is created on first use so importing this module never blocks
+connection_pool = None
+connection_pool_lock = threading.Lock()
+
+def get_pool():
+    """Return the shared connection pool, creating it if needed"""
+    global connection_pool
+    with connection_pool_lock:
+        if connection_pool is None:
+            connection_pool = ConnectionPool(
+                _connect,
+                size=POOL_SIZE,
+                min_size=POOL_MIN_SIZE,
+                max_size=POOL_MAX_SIZE,
+                timeout=POOL_TIMEOUT,
+                validate_idle=POOL_VALIDATE_IDLE,
+                max_lifetime=POOL_MAX_LIFETIME,
+                target_wait_ms=POOL_TARGET_WAIT_MS,
+                adaptive=POOL_ADAPTIVE,
+                cursor_wrapper=_instrument_cursor if QUERY_STATS else None
+            )
+            logger.info(f"Connection pool created (size {POOL_SIZE}, max {POOL_MAX_SIZE})")
+            if METRICS_PORT:
+                metrics.start_server(METRICS_PORT, METRICS_HOST)
+        return connection_pool
 
 # Function to get a connection from the pool
-def get_connection():
+def get_connection(timeout=None):
+    """Borrow a pooled connection; close() returns it to the pool
+    
+    Waits up to DB_POOL_TIMEOUT seconds (or timeout) for a free connection
+    and raises PoolTimeoutError instead of opening an unpooled one.
+    """
+    # Don't take a connection for a task that was already superseded
+    cancellation.check()
     try:
-        return connection_pool.get_connection()
+        with tracing.span("pool_wait"):
+            return get_pool().get_connection(timeout)
     except Exception as e:
         logger.error(f"Error getting connection from pool: {e}")
-        # Fallback to direct connection if pool fails
-        return mysql.connector.connect(
-            host=db_host,
-            port=db_port,
-            user=db_user,
-            password=db_password,
-            database=db_name
-        )
+        raise
+
+def get_pool_stats():
+    """Return in-use, idle, waiters, wait histogram and connection age stats"""
+    return get_pool().get_stats()
 
-# Function to fetch table columns (with caching)
-column_cache = {}
+# Function to open a dedicated connection outside the pool
+def get_direct_connection(**options):
+    """Open an unpooled connection, e.g. with allow_local_infile=True"""
+    return mysql.connector.connect(
+        host=db_host,
+        port=db_port,
+        user=db_user,
+        password=db_password,
+        database=db_name,
+        **options
+    )
+
+# Function to stop the statement running on another connection
+def kill_query(thread_id):
+    """Send KILL QUERY for a server thread id from a side connection"""
+    conn = get_direct_connection(connection_timeout=CONNECT_TIMEOUT)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"KILL QUERY {int(thread_id)}")
+        cursor.close()
+        logger.info(f"Killed query on connection {thread_id}")
+    finally:
+        conn.close()
+
+@contextmanager
+def cancellable(conn):
+    """Let the current task's cancel token stop statements run on conn
+    inside the block; the killed statement raises QueryCancelled"""
+    token = cancellation.current_token.get()
+    if token is None or conn is None:
+        yield
+        return
+    thread_id = _raw_connection(conn).connection_id
+    kill = token.add_callback(lambda: kill_query(thread_id))
+    try:
+        yield
+    except Exception as e:
+        if token.cancelled and not isinstance(e, cancellation.QueryCancelled):
+            raise cancellation.QueryCancelled(f"Query cancelled: {e}") from e
+        raise
+    finally:
+        token.remove_callback(kill)
+
+# Schema metadata for every table, loaded from information_schema in one query
+schema = SchemaCatalog(get_connection, snapshot_path=os.getenv("SCHEMA_SNAPSHOT_FILE"))
+
+def invalidate_schema():
+    """Reload schema metadata on next use, e.g. after DDL"""
+    schema.invalidate()
+    sql_cache.clear()
+    validator_cache.clear()
+    search_indexes.invalidate()
+
+# Function to fetch table columns (from the schema catalog)
 def get_table_columns(table_name):
-    # Check if columns are already in cache
-    if table_name in column_cache:
-        return column_cache[table_name]
+    try:
+        return schema.column_names(table_name)
+    except Exception as e:
+        logger.error(f"Error fetching columns for {table_name}: {e}")
+        return []
+
+# Function to fetch the primary key columns of a table (from the schema catalog)
+def get_primary_key(table_name):
+    """Return the primary key columns of a table in index order"""
+    try:
+        return schema.primary_key(table_name)
+    except Exception as e:
+        logger.error(f"Error fetching primary key for {table_name}: {e}")
+        return []
+
+# Row counts are cached so paging does not run COUNT(*) on every request
+COUNT_CACHE_TTL = int(os.getenv("COUNT_CACHE_TTL", "60"))
+count_cache = {}
+def get_row_count(table, refresh=False):
+    """Return the row count of a table, cached for COUNT_CACHE_TTL seconds"""
+    cached = count_cache.get(table)
+    if cached and not refresh and time.monotonic() - cached[1] < COUNT_CACHE_TTL:
+        return cached[0]
     
     conn = None
     try:
         conn = get_connection()
         cursor = conn.cursor()
-        cursor.execute(f"SHOW COLUMNS FROM {table_name}")
-        cols = [col[0] for col in cursor.fetchall()]
-        # Store in cache
-        column_cache[table_name] = cols
-        return cols
+        cursor.execute(f"SELECT COUNT(*) FROM {table}")
+        total_count = cursor.fetchone()[0]
+        count_cache[table] = (total_count, time.monotonic())
+        return total_count
     except Exception as e:
-        logger.error(f"Error fetching columns for {table_name}: {e}")
-        return []
+        logger.error(f"Error counting rows in {table}: {e}")
+        return cached[0] if cached else 0
     finally:
         if conn:
             conn.close()
 
-# Function to fetch data with pagination
-def fetch_data_paginated(table, page=1, items_per_page=100):
-    offset = (page - 1) * items_per_page
+# Callbacks run after a write helper modifies a table
+write_listeners = []
+def on_table_write(callback):
+    """Register callback(table) to be called whenever a table is modified"""
+    write_listeners.append(callback)
+    return callback
+
+# Callbacks run with the row a write helper modified
+change_listeners = []
+def on_table_change(callback):
+    """Register callback(table, row) to be called whenever a table is
+    modified; row is a RowChange for the single-row write helpers and
+    None when the modified rows are not known"""
+    change_listeners.append(callback)
+    return callback
+
+def notify_table_write(table, row=None):
+    """Invalidate cached state that depends on the given table"""
+    count_cache.pop(table, None)
+    for callback in write_listeners:
+        try:
+            callback(table)
+        except Exception as e:
+            logger.error(f"Error in write listener for {table}: {e}")
+    for callback in change_listeners:
+        try:
+            callback(table, row)
+        except Exception as e:
+            logger.error(f"Error in change listener for {table}: {e}")
+
+# Identical SELECTs in flight at the same time share one execution;
+# SINGLE_FLIGHT_DIR also shares them between portal processes
+SINGLE_FLIGHT = os.getenv("SINGLE_FLIGHT", "1") not in ("0", "false", "False", "no")
+single_flight = SingleFlight(
+    shared_dir=os.getenv("SINGLE_FLIGHT_DIR") or None,
+    wait_timeout=float(os.getenv("SINGLE_FLIGHT_WAIT", "30"))
+)
+
+# Opt-in cache of SELECT results, dropped per table by the write helpers
+result_cache = ResultCache(
+    max_entries=int(os.getenv("RESULT_CACHE_SIZE", "0")),
+    max_bytes=int(os.getenv("RESULT_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+)
+on_table_write(result_cache.invalidate_table)
+on_table_write(lambda table: single_flight.note_write())
+
+def _select(query, params=None):
+    """Run a SELECT on a pooled connection and return all rows"""
     conn = None
     try:
         conn = get_connection()
         cursor = conn.cursor()
-        cursor.execute(f"SELECT * FROM {table} LIMIT %s OFFSET %s", 
-                     (items_per_page, offset))
-        rows = cursor.fetchall()
+        with cancellable(conn), query_budget.enforced():
+            cursor.execute(query_budget.apply_hint(query), params)
+            return cursor.fetchall()
+    finally:
+        if conn:
+            conn.close()
+
+def cached_select(query, params=None, run=None):
+    """Return the rows of a SELECT, from the result cache when enabled
+    
+    run() produces the rows on a miss; by default the query is executed
+    on a pooled connection. Identical SELECTs running at the same time
+    are coalesced so only one of them reaches the server.
+    """
+    run = run or (lambda: _select(query, params))
+    key = result_cache.make_key(query, params)
+    if not result_cache.enabled:
+        return _coalesced(key, run)
+    
+    rows = result_cache.get(key)
+    if rows is not None:
+        return rows
+    
+    generation = result_cache.generation
+    rows = _coalesced(key, run)
+    if rows is not None:
+        result_cache.put(key, rows, tables_read(query), generation)
+    return rows
+
+def _coalesced(key, run):
+    """Run run() through single-flight, keyed by the statement and the
+    write generation so a read started after a write never shares the
+    result of one started before it"""
+    if not SINGLE_FLIGHT:
+        return run()
+    timeout = query_budget.current().timeout_ms
+    return single_flight.do((key, result_cache.generation, timeout), run, shared_key=(key, timeout))
+
+def get_result_cache_stats():
+    """Return hits, misses, hit_rate, entries, bytes, evictions and invalidations"""
+    return result_cache.get_stats()
+
+# Function to fetch data with pagination
+def fetch_data_paginated(table, page=1, items_per_page=100, with_count=True):
+    """Fetch a page by number. Prefer fetch_page for deep pages, since
+    OFFSET still reads and discards every row before the page."""
+    offset = (page - 1) * items_per_page
+    try:
+        rows = cached_select(f"SELECT * FROM {table} LIMIT %s OFFSET %s", 
+                             (items_per_page, offset))
         
-        # Also get total count for pagination info
-        cursor.execute(f"SELECT COUNT(*) FROM {table}")
-        total_count = cursor.fetchone()[0]
+        # Total count comes from the count cache rather than a fresh COUNT(*)
+        total_count = get_row_count(table) if with_count else None
         
         return rows, total_count
     except Exception as e:
         logger.error(f"Error fetching data from {table}: {e}")
         return [], 0
-    finally:
-        if conn:
-            conn.close()
+
+def _keyset_columns(table, sort_column=None):
+    """Columns to order and seek on: optional sort column plus the primary key"""
+    columns = get_table_columns(table)
+    key_columns = get_primary_key(table) or columns[:1]
+    if sort_column:
+        if sort_column not in columns:
+            raise ValueError(f"Unknown column {sort_column} for {table}")
+        key_columns = [sort_column] + [c for c in key_columns if c != sort_column]
+    return columns, key_columns
+
+def _keyset_condition(key_columns, operator):
+    """Build (a > %s) OR (a = %s AND b > %s) ... for a row-value comparison
+
+    Expanded instead of (a, b) > (x, y) so the optimizer can use a range
+    scan on the leading index column on every MySQL version we support."""
+    clauses = []
+    for i, col in enumerate(key_columns):
+        parts = [f"{c} = %s" for c in key_columns[:i]]
+        parts.append(f"{col} {operator} %s")
+        clauses.append("(" + " AND ".join(parts) + ")")
+    return "(" + " OR ".join(clauses) + ")"
+
+def _keyset_params(key):
+    """Repeat the key values in the order _keyset_condition expects them"""
+    params = []
+    for i in range(len(key)):
+        params.extend(key[:i + 1])
+    return params
+
+def _has_rows_before(table, key_columns, key):
+    """Whether any row sorts before key in keyset order"""
+    query = (f"SELECT 1 FROM {table} WHERE {_keyset_condition(key_columns, '<')} "
+             f"LIMIT 1")
+    try:
+        return bool(cached_select(query, _keyset_params(list(key))))
+    except Exception as e:
+        logger.error(f"Error checking for earlier rows in {table}: {e}")
+        return True
+
+# Function to fetch a page using keyset (seek) pagination
+def fetch_page(table, cursor=None, direction="next", page_size=100,
+               sort_column=None, with_count=False):
+    """Fetch one page of a table ordered by its primary key
+    (or by sort_column with the primary key as tie-breaker).
+    
+    Args:
+        table: Database table name
+        cursor: Key tuple to seek from, e.g. page_info["last_key"].
+            None starts from the first row (or the last row for "prev").
+        direction: "next" for rows after cursor, "prev" for rows before
+            cursor, "at" to jump to the page starting at cursor
+        page_size: Number of rows per page
+        sort_column: Optional indexed column to order by
+        with_count: Include the (cached) total row count
+    
+    Returns (rows, page_info) where page_info holds first_key, last_key,
+    has_next, has_prev and total (None unless with_count).
+    """
+    if direction not in ("next", "prev", "at"):
+        raise ValueError(f"Unknown page direction: {direction}")
+    
+    columns, key_columns = _keyset_columns(table, sort_column)
+    positions = [columns.index(c) for c in key_columns]
+    
+    backwards = direction == "prev"
+    order = "DESC" if backwards else "ASC"
+    order_clause = ", ".join(f"{c} {order}" for c in key_columns)
+    
+    where_clause = ""
+    params = []
+    if cursor is not None:
+        key = list(cursor) if isinstance(cursor, (list, tuple)) else [cursor]
+        if len(key) != len(key_columns):
+            raise ValueError(f"Cursor for {table} needs {len(key_columns)} values")
+        operator = {"next": ">", "prev": "<", "at": ">="}[direction]
+        where_clause = f"WHERE {_keyset_condition(key_columns, operator)}"
+        params = _keyset_params(key)
+    
+    # Fetch one extra row to know whether another page exists
+    query = f"SELECT * FROM {table} {where_clause} ORDER BY {order_clause} LIMIT %s"
+    params.append(page_size + 1)
+    
+    try:
+        rows = cached_select(query, params)
+    except Exception as e:
+        logger.error(f"Error fetching page from {table}: {e}")
+        return [], {"first_key": None, "last_key": None, "has_next": False,
+                    "has_prev": False, "total": 0 if with_count else None}
+    
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backwards:
+        rows.reverse()
+    
+    def key_of(row):
+        return tuple(row[p] for p in positions)
+    
+    first_key = key_of(rows[0]) if rows else None
+    if direction == "at":
+        # The cursor of a reload may be the first key of the table
+        has_prev = first_key is not None and _has_rows_before(table, key_columns, first_key)
+    else:
+        has_prev = (backwards and has_more) or (not backwards and cursor is not None)
+    
+    page_info = {
+        "first_key": first_key,
+        "last_key": key_of(rows[-1]) if rows else None,
+        "has_next": (not backwards and has_more) or (backwards and cursor is not None),
+        "has_prev": has_prev,
+        "total": get_row_count(table) if with_count else None,
+    }
+    return rows, page_info
 
 # Function to execute queries with proper connection management
-def execute_query(query, params=None):
+def execute_query(query, params=None, use_cache=True):
+    """Execute a query and return its rows (None for statements without rows)
+    
+    SELECTs go through the result cache when it is enabled and are
+    coalesced with identical ones in flight; writes to a table invalidate
+    the cached state that depends on it.
+    """
+    if use_cache and is_cacheable(query):
+        return cached_select(query, params, lambda: _run_query(query, params))
+    
+    result = _run_query(query, params)
+    written = table_written(query)
+    if written:
+        notify_table_write(written)
+    return result
+
+def _run_query(query, params=None):
     conn = None
     try:
         conn = get_connection()
         cursor = conn.cursor()
-        if params:
-            cursor.execute(query, params)
-        else:
-            cursor.execute(query)
-        conn.commit()
-        result = cursor.fetchall() if cursor.with_rows else None
+        with cancellable(conn), query_budget.enforced():
+            if params:
+                cursor.execute(query_budget.apply_hint(query), params)
+            else:
+                cursor.execute(query_budget.apply_hint(query))
+            conn.commit()
+            result = cursor.fetchall() if cursor.with_rows else None
         logger.info(f"Query executed: {query[:50]}...")
         return result
+    except cancellation.QueryCancelled as e:
+        if conn:
+            conn.rollback()
+        logger.info(f"Query cancelled: {query[:50]}...")
+        raise e
+    except query_budget.QueryTimeout as e:
+        if conn:
+            conn.rollback()
+        logger.warning(f"Query exceeded its time budget: {query[:50]}...")
+        raise e
     except Exception as e:
         if conn:
             conn.rollback()
@@ -124,144 +515,1032 @@ def execute_query(query, params=None):
         if conn:
             conn.close()
 
+# Opt-in in-process substring indexes answering LIKE '%value%' searches
+# on text columns without a table scan; SEARCH_INDEX_TABLES=* indexes all
+TEXT_TYPES = ("char", "varchar", "tinytext", "text", "mediumtext", "longtext", "enum", "set")
+
+def _describe_search_table(table):
+    key = get_primary_key(table)
+    if len(key) != 1:
+        return None
+    columns = [col["name"] for col in schema.columns(table) if col["data_type"] in TEXT_TYPES]
+    auto_increment = "auto_increment" in (schema.column(table, key[0]) or {}).get("extra", "")
+    return key[0], columns, auto_increment
+
+def _load_search_rows(table, key_column, columns, after=None):
+    check_identifiers(table, [key_column] + list(columns))
+    query = f"SELECT {key_column}, {', '.join(columns)} FROM {table}"
+    params = None
+    if after is not None:
+        query += f" WHERE {key_column} > %s"
+        params = (after,)
+    # Snapshots are bulk reads, not bound by the interactive time budget
+    with query_budget.use("export"):
+        yield from stream_query(query, params)
+
+search_indexes = SearchIndexes(
+    _describe_search_table,
+    _load_search_rows,
+    tables=[t.strip() for t in os.getenv("SEARCH_INDEX_TABLES", "").split(",") if t.strip()],
+    max_rows=int(os.getenv("SEARCH_INDEX_MAX_ROWS", "200000")),
+    refresh_after=float(os.getenv("SEARCH_INDEX_REFRESH", "300"))
+)
+on_table_change(search_indexes.on_change)
+
+def _indexed_search(table, criteria, max_rows):
+    """Rows matching every (column, value) LIKE criterion, found through
+    the search index and fetched by primary key, or None when the index
+    cannot answer"""
+    keys = search_indexes.search(table, criteria)
+    if keys is None:
+        return None
+    return _fetch_by_keys(table, search_indexes.key_column(table), keys, max_rows)
+
+def _fetch_by_keys(table, key_column, keys, max_rows):
+    """Rows of table with the given sorted keys, at most max_rows"""
+    truncated = bool(max_rows) and len(keys) > max_rows
+    if truncated:
+        keys = keys[:max_rows]
+    rows = []
+    for i in range(0, len(keys), 1000):
+        chunk = keys[i:i + 1000]
+        placeholders = ", ".join(["%s"] * len(chunk))
+        rows.extend(execute_query(
+            f"SELECT * FROM {table} WHERE {key_column} IN ({placeholders}) ORDER BY {key_column}",
+            chunk, use_cache=False
+        ) or [])
+    return query_budget.Rows(rows, truncated, max_rows)
+
+def get_search_index_stats():
+    """Return search counters and the state, rows and trigrams of each index"""
+    return search_indexes.get_stats()
+
+# Searches on columns with a FULLTEXT (ngram) index use MATCH ... AGAINST
+# and come back ranked by relevance
+FULLTEXT_SEARCH = os.getenv("FULLTEXT_SEARCH", "1") not in ("0", "false", "False", "no")
+# Unbudgeted ranked searches read their matches in pages of this many rows
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "1000"))
+
+def _fulltext_columns(table):
+    if not FULLTEXT_SEARCH:
+        return set()
+    return fulltext_search.fulltext_columns(schema.indexes(table))
+
+def search_ranked(table, criteria, page=1, page_size=100):
+    """Return (rows, page_info) for one page of rows matching every
+    (column, value) LIKE criterion
+    
+    Criteria on columns with a FULLTEXT index run through MATCH ...
+    AGAINST and the rows are ordered by relevance (page_info["ranked"]);
+    otherwise they are ordered by primary key.
+    """
+    criteria = [(column, value) for column, value in criteria if value]
+    if not criteria:
+        raise ValueError("Enter at least one search criterion")
+    check_identifiers(table, [column for column, _ in criteria])
+    page = max(1, int(page))
+    query, params, ranked = fulltext_search.build_search(
+        table, criteria, _fulltext_columns(table), get_primary_key(table),
+        page_size + 1, (page - 1) * page_size
+    )
+    rows = execute_query(query, params) or []
+    page_info = {
+        "page": page,
+        "page_size": page_size,
+        "has_next": len(rows) > page_size,
+        "has_prev": page > 1,
+        "ranked": ranked,
+    }
+    return rows[:page_size], page_info
+
+def _fulltext_search(table, criteria, max_rows):
+    """First max_rows rows of a ranked search (every row when max_rows is
+    0), or None when no criterion is on a FULLTEXT indexed column"""
+    columns = _fulltext_columns(table)
+    criteria = [(column, value) for column, value in criteria if value]
+    if not any(fulltext_search.uses_fulltext(column, value, columns) for column, value in criteria):
+        return None
+    if max_rows:
+        rows, page_info = search_ranked(table, criteria, 1, max_rows)
+        return query_budget.Rows(rows, page_info["has_next"], max_rows)
+    
+    # No cap: read every page, so the result is complete
+    rows, page = [], 1
+    while True:
+        page_rows, page_info = search_ranked(table, criteria, page, SEARCH_PAGE_SIZE)
+        rows.extend(page_rows)
+        if not page_info["has_next"]:
+            return query_budget.Rows(rows, False, max_rows)
+        page += 1
+
+def create_fulltext_indexes(tables=None):
+    """Add the ngram FULLTEXT indexes of fulltext_search.CANDIDATES that
+    do not exist yet; returns the names of the indexes created"""
+    missing = fulltext_search.missing_indexes(schema, tables)
+    if not missing:
+        return []
+    conn = get_direct_connection(connection_timeout=CONNECT_TIMEOUT)
+    try:
+        return fulltext_search.create_indexes(conn, missing)
+    finally:
+        conn.close()
+        invalidate_schema()
+
+# Function to propose indexes for the statements recorded so far
+def get_index_advice(top=20):
+    """Return index_advisor.Proposal objects for the statements recorded by
+    query_recorder, best estimated net benefit first"""
+    return index_advisor.advise(query_recorder.get_stats(), schema, _table_row_estimates(), top)
+
+def _table_row_estimates():
+    """{table (lower case): row estimate} from information_schema, which
+    is cheap to read unlike COUNT(*)"""
+    rows = execute_query(
+        "SELECT TABLE_NAME, TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE()",
+        use_cache=False
+    ) or []
+    return {
+        (name.decode() if isinstance(name, (bytes, bytearray)) else str(name)).lower(): int(count or 0)
+        for name, count in rows
+    }
+
+def get_index_migrations():
+    """Return the managed indexes: the seed migrations and every applied
+    one, as dicts with version, description, statement, status (applied
+    or pending) and applied_at, in version order"""
+    conn = get_direct_connection(connection_timeout=CONNECT_TIMEOUT)
+    try:
+        applied = {row["version"]: row for row in index_advisor.applied_migrations(conn)}
+    finally:
+        conn.close()
+    result = [{
+        "version": migration.version,
+        "description": migration.description,
+        "statement": migration.up,
+        "status": "applied" if migration.version in applied else "pending",
+        "applied_at": applied[migration.version]["applied_at"] if migration.version in applied else None,
+    } for migration in index_advisor.SEED_MIGRATIONS]
+    seeds = {migration.version for migration in index_advisor.SEED_MIGRATIONS}
+    result.extend({
+        "version": version,
+        "description": row["description"],
+        "statement": row["up"],
+        "status": "applied",
+        "applied_at": row["applied_at"],
+    } for version, row in applied.items() if version not in seeds)
+    return sorted(result, key=lambda row: row["version"])
+
+def apply_index_migrations(migrations=None):
+    """Apply index migrations not applied yet, the seed set by default;
+    returns (applied, skipped) lists of versions"""
+    if migrations is None:
+        migrations = index_advisor.SEED_MIGRATIONS
+    conn = get_direct_connection(connection_timeout=CONNECT_TIMEOUT)
+    try:
+        return index_advisor.apply_migrations(conn, migrations, schema)
+    finally:
+        conn.close()
+        invalidate_schema()
+
+def revert_index_migration(version):
+    """Drop the index of an applied migration; returns False if the
+    version was not applied"""
+    conn = get_direct_connection(connection_timeout=CONNECT_TIMEOUT)
+    try:
+        return index_advisor.revert_migration(conn, version)
+    finally:
+        conn.close()
+        invalidate_schema()
+
+# Function to search every text column of a table
+def search_text_columns(table, term, limit=50):
+    """Return up to limit rows of table with term in any text column
+    (query_budget.Rows, truncated when more rows matched)
+    
+    Uses the in-process search index when it covers the table, MATCH ...
+    AGAINST on FULLTEXT indexed columns and LIKE on the others.
+    """
+    text_columns = [col["name"] for col in schema.columns(table) if col["data_type"] in TEXT_TYPES]
+    if not text_columns or not term:
+        return query_budget.Rows()
+    
+    keys = set()
+    for column in text_columns:
+        found = search_indexes.search(table, [(column, term)])
+        if found is None:
+            break
+        keys.update(found)
+    else:
+        return _fetch_by_keys(table, search_indexes.key_column(table), sorted(keys), limit)
+    
+    fulltext_columns = _fulltext_columns(table)
+    conditions, params, scores = [], [], []
+    for column in text_columns:
+        if fulltext_search.uses_fulltext(column, term, fulltext_columns):
+            match = f"MATCH({column}) AGAINST (%s IN BOOLEAN MODE)"
+            conditions.append(match)
+            scores.append(match)
+            params.append(fulltext_search.phrase(term))
+        else:
+            conditions.append(f"{column} LIKE %s")
+            params.append(f"%{term}%")
+    query = f"SELECT * FROM {table} WHERE {' OR '.join(conditions)}"
+    if scores:
+        # Most relevant rows first, so the limit keeps the best matches
+        query += f" ORDER BY {' + '.join(scores)} DESC"
+        params += [fulltext_search.phrase(term)] * len(scores)
+    query += " LIMIT %s"
+    rows = execute_query(query, params + [limit + 1])
+    return query_budget.cap(rows, limit)
+
 # Function to search data
 def search_data(table, column, value):
+    """Rows of table whose column matches value; errors are logged and
+    raised so the search dialogs can report them"""
+    try:
+        max_rows = query_budget.current().max_rows
+        rows = _indexed_search(table, [(column, value)], max_rows)
+        if rows is None:
+            rows = _fulltext_search(table, [(column, value)], max_rows)
+        if rows is not None:
+            return rows
+        query = query_budget.limit_query(compile_statement("search", table, key_column=column), max_rows)
+        params = (f"%{value}%",)
+        rows = cached_select(query, params, lambda: execute_statement(query, params, fetch=True))
+        return query_budget.cap(rows, max_rows)
+    except (cancellation.QueryCancelled, query_budget.QueryTimeout):
+        raise
+    except Exception as e:
+        logger.error(f"Error searching data in {table}: {e}")
+        raise
+
+# Function to advanced search with multiple criteria
+def advanced_search_data(table, search_params, page=1, page_size=None, match_any=False):
+    """Search with multiple criteria; returns (rows, total)
+    
+    Each value is read according to the type of its column (see
+    search_predicates.SYNTAX_HELP): IDs and numbers are compared with =,
+    IN and ranges, dates with ranges on the column, text with LIKE or
+    MATCH ... AGAINST, so indexes on the columns can be used. Criteria
+    are combined with AND, or OR if match_any. rows is one page of
+    query_budget.Rows ordered by primary key (by relevance for FULLTEXT
+    searches), truncated when more pages follow; total counts every
+    matching row. Raises search_predicates.PredicateError for a value
+    that does not fit its column.
+    """
+    criteria = [(column, str(value).strip()) for column, value in search_params
+                if value is not None and str(value).strip()]
+    max_rows = query_budget.current().max_rows
+    page_size = min(page_size or max_rows or SEARCH_PAGE_SIZE, max_rows or SEARCH_PAGE_SIZE)
+    page = max(1, int(page))
+    offset = (page - 1) * page_size
+    
+    if not criteria:
+        rows, total = fetch_data_paginated(table, page, page_size)
+        return query_budget.Rows(rows, offset + len(rows) < total, page_size, total), total
+    
+    check_identifiers(table, [column for column, _ in criteria])
+    builder = search_predicates.PredicateBuilder(
+        {column["name"]: column for column in schema.columns(table)}, _fulltext_columns(table)
+    )
+    predicate = builder.build(criteria, match_any)
+    
+    if predicate.plain_text:
+        # The index gets the terms the LIKE searches for, without the * marks
+        keys = search_indexes.search(table, predicate.terms)
+        if keys is not None:
+            rows = _fetch_by_keys(table, search_indexes.key_column(table),
+                                  keys[offset:offset + page_size], 0)
+            total = len(keys)
+            return query_budget.Rows(rows, offset + len(rows) < total, page_size, total), total
+    
+    order = [" + ".join(match for match, _ in predicate.ranks) + " DESC"] if predicate.ranks else []
+    order += get_primary_key(table) or get_table_columns(table)[:1]
+    rank_params = [param for _, params in predicate.ranks for param in params]
+    query = (f"SELECT * FROM {table} WHERE {predicate.sql} "
+             f"ORDER BY {', '.join(order)} LIMIT %s OFFSET %s")
+    rows = execute_query(query, predicate.params + rank_params + [page_size + 1, offset]) or []
+    has_next = len(rows) > page_size
+    rows = rows[:page_size]
+    
+    if has_next or (offset and not rows):
+        # Only a full page (or one past the end) needs the separate count
+        counted = execute_query(f"SELECT COUNT(*) FROM {table} WHERE {predicate.sql}", predicate.params)
+        total = counted[0][0] if counted else 0
+    else:
+        total = offset + len(rows)
+    return query_budget.Rows(rows, has_next, page_size, total), total
+
+# Compiled SQL for the generic CRUD helpers, keyed by
+# (operation, table, columns, key column)
+sql_cache = {}
+
+# Prepared cursors per pooled connection: {connection: OrderedDict(sql -> cursor)}
+STATEMENT_CACHE_SIZE = int(os.getenv("STATEMENT_CACHE_SIZE", "64"))
+prepared_statements = weakref.WeakKeyDictionary()
+statement_cache_lock = threading.Lock()
+statement_cache_stats = {
+    "sql_hits": 0,
+    "sql_misses": 0,
+    "prepared_hits": 0,
+    "prepared_misses": 0,
+}
+
+def check_identifiers(table, columns=()):
+    """Raise ValueError unless the table and columns exist in the cached schema"""
+    table_columns = get_table_columns(table)
+    if not table_columns:
+        raise ValueError(f"Unknown table: {table}")
+    for col in columns:
+        if col not in table_columns:
+            raise ValueError(f"Unknown column {col} for {table}")
+
+def compile_statement(operation, table, columns=(), key_column=None):
+    """Return the SQL text for a CRUD operation, building it only once
+    
+    The same string object is returned for every call with the same shape,
+    which is what lets the prepared cursor skip re-preparing it.
+    """
+    key = (operation, table, tuple(columns), key_column)
+    query = sql_cache.get(key)
+    if query is not None:
+        statement_cache_stats["sql_hits"] += 1
+        return query
+    
+    statement_cache_stats["sql_misses"] += 1
+    check_identifiers(table, list(columns) + ([key_column] if key_column else []))
+    
+    if operation == "insert":
+        col_clause = ", ".join(columns)
+        placeholder_clause = ", ".join(["%s"] * len(columns))
+        query = f"INSERT INTO {table} ({col_clause}) VALUES ({placeholder_clause})"
+    elif operation == "update":
+        set_clause = ", ".join([f"{col}=%s" for col in columns])
+        query = f"UPDATE {table} SET {set_clause} WHERE {key_column}=%s"
+    elif operation == "delete":
+        query = f"DELETE FROM {table} WHERE {key_column}=%s"
+    elif operation == "search":
+        query = f"SELECT * FROM {table} WHERE {key_column} LIKE %s"
+    else:
+        raise ValueError(f"Unknown statement operation: {operation}")
+    
+    sql_cache[key] = query
+    return query
+
+def _raw_connection(conn):
+    """The driver connection behind a pooled connection wrapper"""
+    return getattr(conn, "_cnx", conn)
+
+def get_prepared_cursor(conn, query):
+    """Return a prepared cursor for query on this connection, reusing it if cached"""
+    raw = _raw_connection(conn)
+    with statement_cache_lock:
+        statements = prepared_statements.get(raw)
+        if statements is None:
+            statements = OrderedDict()
+            prepared_statements[raw] = statements
+        
+        cursor = statements.get(query)
+        if cursor is not None:
+            statement_cache_stats["prepared_hits"] += 1
+            statements.move_to_end(query)
+            return cursor
+        
+        statement_cache_stats["prepared_misses"] += 1
+        cursor = conn.cursor(prepared=True)
+        statements[query] = cursor
+        
+        # Stay well under the server's max_prepared_stmt_count
+        if len(statements) > STATEMENT_CACHE_SIZE:
+            _, old_cursor = statements.popitem(last=False)
+            try:
+                old_cursor.close()
+            except Exception:
+                pass
+        return cursor
+
+def discard_prepared_statements(conn):
+    """Forget the prepared cursors of a connection, e.g. after an error"""
+    with statement_cache_lock:
+        prepared_statements.pop(_raw_connection(conn), None)
+
+def execute_statement(query, params, fetch=False):
+    """Execute a compiled statement through a cached prepared cursor"""
     conn = None
+    start = None
+    rows = None
+    error = None
     try:
         conn = get_connection()
-        cursor = conn.cursor()
-        query = f"SELECT * FROM {table} WHERE {column} LIKE %s"
-        cursor.execute(query, (f"%{value}%",))
-        rows = cursor.fetchall()  # Make sure to fetch all results
-        return rows
+        # Each time budget prepares its own hinted copy of a SELECT
+        sql = query_budget.apply_hint(query) if fetch else query
+        cursor = get_prepared_cursor(conn, sql)
+        start = time.perf_counter()
+        with cancellable(conn), query_budget.enforced():
+            with tracing.span("query.execute", sql=query[:500], prepared=True):
+                cursor.execute(sql, params)
+            if fetch:
+                with tracing.span("query.fetch", prepared=True) as span:
+                    rows = cursor.fetchall()
+                    if span is not None:
+                        span.set(rows=len(rows))
+                return rows
+        conn.commit()
+        return None
     except Exception as e:
-        print(f"Error searching data in {table}: {e}")
-        return []
+        error = e
+        if conn:
+            conn.rollback()
+            discard_prepared_statements(conn)
+        logger.error(f"Error executing statement: {e}")
+        raise e
     finally:
+        # The pool leaves prepared cursors unwrapped, so this is their
+        # only record
+        if QUERY_STATS and start is not None:
+            count = len(rows) if rows is not None else max(cursor.rowcount or 0, 0)
+            query_recorder.record(query, time.perf_counter() - start, count,
+                                  take_pool_wait(conn), error=error, params=params)
         if conn:
             conn.close()
 
-# Function to advanced search with multiple criteria
-def advanced_search_data(table, search_params):
-    """Search with multiple criteria"""
-    query_parts = []
-    params = []
-    
-    for column, value in search_params:
-        if value:  # Only add non-empty criteria
-            query_parts.append(f"{column} LIKE %s")
-            params.append(f"%{value}%")
-    
-    if not query_parts:
-        return fetch_data_paginated(table)[0], 0
-    
-    query = f"SELECT * FROM {table} WHERE " + " AND ".join(query_parts)
-    return execute_query(query, params), len(params)
+def get_statement_cache_stats():
+    """Return hit and miss counters for the SQL and prepared statement caches"""
+    with statement_cache_lock:
+        stats = dict(statement_cache_stats)
+        stats["sql_cached"] = len(sql_cache)
+        stats["prepared_cached"] = sum(len(s) for s in prepared_statements.values())
+    return stats
+
+def _row_key(table, column, value):
+    """A key value as the server returns it; forms pass every value as a
+    string, while the search index holds keys with their column type"""
+    meta = schema.column(table, column) or {}
+    if isinstance(value, str) and meta.get("data_type") in search_predicates.INTEGER_TYPES:
+        try:
+            return int(value)
+        except ValueError:
+            pass
+    return value
+
+def _row_change(table, op, key_column, key_value, values):
+    if values and key_column in values:
+        values = dict(values, **{key_column: _row_key(table, key_column, values[key_column])})
+    return RowChange(op, key_column, _row_key(table, key_column, key_value) if key_column else None, values)
 
 # Function to insert data
 def insert_data(table, columns, values):
-    col_clause = ", ".join(columns)
-    placeholder_clause = ", ".join(["%s"] * len(values))
-    query = f"INSERT INTO {table} ({col_clause}) VALUES ({placeholder_clause})"
+    query = compile_statement("insert", table, columns)
     logger.info(f"Inserting into {table}: {', '.join(str(v) for v in values[:3])}...")
-    return execute_query(query, values)
+    result = execute_statement(query, list(values))
+    row = dict(zip(columns, values))
+    key = get_primary_key(table)
+    if len(key) == 1 and key[0] in row:
+        notify_table_write(table, _row_change(table, "insert", key[0], row[key[0]], row))
+    else:
+        notify_table_write(table, _row_change(table, "insert", None, None, row))
+    return result
 
 # Function to update data
 def update_data(table, columns, values, id_column, id_value):
-    set_clause = ", ".join([f"{col}=%s" for col in columns])
-    query = f"UPDATE {table} SET {set_clause} WHERE {id_column}=%s"
-    all_values = values + [id_value]
+    query = compile_statement("update", table, columns, id_column)
+    all_values = list(values) + [id_value]
     logger.info(f"Updating {table} where {id_column}={id_value}")
-    return execute_query(query, all_values)
+    result = execute_statement(query, all_values)
+    notify_table_write(table, _row_change(table, "update", id_column, id_value, dict(zip(columns, values))))
+    return result
 
 # Function to delete data
 def delete_data(table, id_column, id_value):
-    query = f"DELETE FROM {table} WHERE {id_column}=%s"
+    query = compile_statement("delete", table, key_column=id_column)
     logger.info(f"Deleting from {table} where {id_column}={id_value}")
-    return execute_query(query, (id_value,))
+    result = execute_statement(query, (id_value,))
+    notify_table_write(table, _row_change(table, "delete", id_column, id_value, None))
+    return result
+
+# Function to insert many rows in a single transaction
+def bulk_insert(table, columns, rows, batch_size=500):
+    """Insert rows using multi-row INSERT statements
+    
+    Args:
+        table: Database table name
+        columns: Column names, in the order the values appear in each row
+        rows: Iterable of row sequences (may be a generator)
+        batch_size: Rows sent per INSERT statement
+    
+    All batches run in one transaction, so either every row is written
+    or none are. Returns a dict with rows, batches, seconds and
+    rows_per_second.
+    """
+    return _bulk_write(table, columns, rows, batch_size)
+
+# Function to insert or update many rows in a single transaction
+def bulk_upsert(table, columns, rows, batch_size=500, on_duplicate=None):
+    """Insert rows, updating existing rows on a duplicate key
+    
+    on_duplicate selects what happens to a row that collides with an
+    existing primary or unique key. It may be a list of columns to take
+    from the new row, or a dict of {column: SQL expression}. By default
+    every inserted column except the primary key is overwritten.
+    """
+    if on_duplicate is None:
+        primary_key = get_primary_key(table)
+        on_duplicate = [c for c in columns if c not in primary_key]
+    
+    if isinstance(on_duplicate, dict):
+        check_identifiers(table, on_duplicate.keys())
+        assignments = [f"{col}={expr}" for col, expr in on_duplicate.items()]
+    else:
+        check_identifiers(table, on_duplicate)
+        assignments = [f"{col}=VALUES({col})" for col in on_duplicate]
+    
+    if not assignments:
+        # Nothing to update, so duplicates are left as they are
+        first_col = columns[0]
+        assignments = [f"{first_col}={first_col}"]
+    
+    suffix = " ON DUPLICATE KEY UPDATE " + ", ".join(assignments)
+    return _bulk_write(table, columns, rows, batch_size, suffix)
+
+def _bulk_write(table, columns, rows, batch_size, suffix=""):
+    """Run batched multi-row INSERTs for bulk_insert and bulk_upsert"""
+    check_identifiers(table, columns)
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+    
+    col_clause = ", ".join(columns)
+    row_placeholder = "(" + ", ".join(["%s"] * len(columns)) + ")"
+    full_batch_query = None
+    
+    start = time.monotonic()
+    total_rows = 0
+    batches = 0
+    rows = iter(rows)
+    
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            
+            params = []
+            for row in batch:
+                if len(row) != len(columns):
+                    raise ValueError(
+                        f"Row {total_rows + len(params) // len(columns) + 1} has "
+                        f"{len(row)} values, expected {len(columns)}"
+                    )
+                params.extend(row)
+            
+            # Every full batch has the same shape, so build its SQL once
+            if len(batch) == batch_size and full_batch_query:
+                query = full_batch_query
+            else:
+                values_clause = ", ".join([row_placeholder] * len(batch))
+                query = f"INSERT INTO {table} ({col_clause}) VALUES {values_clause}{suffix}"
+                if len(batch) == batch_size:
+                    full_batch_query = query
+            
+            cursor.execute(query, params)
+            total_rows += len(batch)
+            batches += 1
+            logger.debug(f"Bulk write to {table}: batch {batches}, {total_rows} rows")
+        
+        conn.commit()
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error(f"Error bulk writing to {table} after {total_rows} rows: {e}")
+        raise e
+    finally:
+        if conn:
+            conn.close()
+    
+    if total_rows:
+        notify_table_write(table)
+    
+    elapsed = time.monotonic() - start
+    rate = total_rows / elapsed if elapsed > 0 else float(total_rows)
+    logger.info(f"Bulk wrote {total_rows} rows to {table} in {batches} batches "
+                f"({elapsed:.2f}s, {rate:.0f} rows/s)")
+    return {
+        "rows": total_rows,
+        "batches": batches,
+        "seconds": elapsed,
+        "rows_per_second": rate,
+    }
 
 # Generic function to fetch all data from a table
 def fetch_all_data(table):
     query = f"SELECT * FROM {table}"
-    return execute_query(query)
+    return capped_query(query)
+
+# Function to run a SELECT whose rows are shown in a view
+def capped_query(query, params=None):
+    """Return at most the current budget's max_rows rows of a SELECT as
+    query_budget.Rows, with truncated set when more rows matched"""
+    max_rows = query_budget.current().max_rows
+    rows = execute_query(query_budget.limit_query(query, max_rows), params)
+    return query_budget.cap(rows, max_rows)
+
+# Matches a bare table name as opposed to a full SQL statement
+TABLE_NAME_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+# Function to stream rows without loading the whole result into memory
+def stream_query(table_or_sql, params=None, batch_size=1000, description=None):
+    """Yield rows of a table or SELECT statement in batches of batch_size
+    
+    Uses an unbuffered cursor with fetchmany, so memory stays constant
+    no matter how many rows the query returns. The pooled connection is
+    held until the generator is exhausted or closed.
+    
+    Args:
+        table_or_sql: A table name or a full SELECT statement
+        params: Query parameters for a SELECT statement
+        batch_size: Rows fetched from the server per round trip
+        description: Optional list that receives the column names
+    """
+    if TABLE_NAME_RE.match(table_or_sql):
+        query = f"SELECT * FROM {table_or_sql}"
+    else:
+        query = table_or_sql
+    
+    conn = None
+    cursor = None
+    finished = False
+    try:
+        conn = get_connection()
+        cursor = conn.cursor(buffered=False)
+        with cancellable(conn), query_budget.enforced():
+            cursor.execute(query_budget.apply_hint(query), params or ())
+            if description is not None:
+                description.extend(col[0] for col in cursor.description)
+            
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield row
+        finished = True
+    finally:
+        if conn:
+            # An abandoned unbuffered result must be drained before the
+            # connection can go back to the pool
+            if not finished:
+                try:
+                    conn.consume_results()
+                except Exception as e:
+                    logger.error(f"Error discarding unread rows: {e}")
+            if cursor:
+                try:
+                    cursor.close()
+                except Exception:
+                    pass
+            conn.close()
+
+# Foreign key dropdown options, cached per (table, id column, display column)
+# as (rows, complete) until a write helper touches the referenced table.
+# Lookup tables with more than FK_DROPDOWN_LIMIT rows are searched as the
+# user types instead of being loaded into a dropdown.
+FK_DROPDOWN_LIMIT = int(os.getenv("FK_DROPDOWN_LIMIT", "500"))
+fk_option_cache = {}
+fk_option_lock = threading.Lock()
+
+@on_table_write
+def _invalidate_fk_options(table):
+    with fk_option_lock:
+        for key in [key for key in fk_option_cache if key[0] == table]:
+            del fk_option_cache[key]
+
+def get_display_column(table):
+    """First column of a table that is not an ID, used as the dropdown label"""
+    for col in get_table_columns(table):
+        if not col.endswith('_ID') and col != 'ID':
+            return col
+    return None
+
+def get_form_foreign_keys(table):
+    """Return {column: (ref_table, ref_column, display_column)} for a table
+    
+    Uses the foreign keys in the schema catalog, falling back to the
+    Name_ID -> Name naming convention for columns without a declared key.
+    """
+    references = {}
+    for fk in schema.foreign_keys(table):
+        references[fk["column"]] = (fk["ref_table"], fk["ref_column"])
+    
+    primary_key = get_primary_key(table)
+    for col in get_table_columns(table):
+        if col in references or not col.endswith('_ID') or col in primary_key:
+            continue
+        ref_table = schema.table_name(col.replace('_ID', ''))
+        if ref_table and col in get_table_columns(ref_table):
+            references[col] = (ref_table, col)
+    
+    return {
+        col: (ref_table, ref_column, get_display_column(ref_table))
+        for col, (ref_table, ref_column) in references.items()
+    }
+
+def prefetch_foreign_key_options(table, max_options=None):
+    """Load the dropdown options of every foreign key of a table
+    
+    Lookup tables that are not cached yet are fetched together in a single
+    UNION ALL query, reading at most max_options + 1 rows from each.
+    Returns {column: [(id, display), ...]}, where display is None for
+    lookup tables without a label column. Columns whose lookup table has
+    more than max_options rows map to None.
+    """
+    references = get_form_foreign_keys(table)
+    limit = f" LIMIT {int(max_options) + 1}" if max_options is not None else ""
+    
+    def usable(entry):
+        return entry is not None and (entry[1] or max_options is not None)
+    
+    with fk_option_lock:
+        missing = list(dict.fromkeys(
+            ref for ref in references.values() if not usable(fk_option_cache.get(ref))
+        ))
+    
+    if missing:
+        selects = []
+        for n, (ref_table, ref_column, display_column) in enumerate(missing):
+            display = f"CAST({display_column} AS CHAR)" if display_column else "NULL"
+            selects.append(f"(SELECT {n}, {ref_column}, {display} FROM {ref_table}{limit})")
+        result = execute_query(" UNION ALL ".join(selects))
+        if result is None:
+            raise RuntimeError(f"Could not load foreign key options for {table}")
+        
+        loaded = {ref: [] for ref in missing}
+        for n, id_value, display_value in result:
+            loaded[missing[n]].append((id_value, display_value))
+        with fk_option_lock:
+            for ref, rows in loaded.items():
+                complete = max_options is None or len(rows) <= max_options
+                fk_option_cache[ref] = (rows, complete)
+        logger.info(f"Prefetched {len(missing)} lookup tables for {table}")
+    
+    options = {}
+    with fk_option_lock:
+        for col, ref in references.items():
+            rows, complete = fk_option_cache.get(ref, ([], True))
+            if max_options is not None and len(rows) > max_options:
+                options[col] = None
+            else:
+                options[col] = list(rows)
+    return options
 
 # Function to get foreign key data for dropdowns
 def get_foreign_key_options(table, id_column, display_column=None):
     """Get options for foreign key dropdowns"""
+    key = (table, id_column, display_column)
+    with fk_option_lock:
+        cached = fk_option_cache.get(key)
+    
+    if cached is None or not cached[1]:
+        display = f"CAST({display_column} AS CHAR)" if display_column else "NULL"
+        result = execute_query(f"SELECT {id_column}, {display} FROM {table}")
+        if result is None:
+            return []
+        cached = ([tuple(row) for row in result], True)
+        with fk_option_lock:
+            fk_option_cache[key] = cached
+    
     if display_column:
-        query = f"SELECT {id_column}, {display_column} FROM {table}"
-        result = execute_query(query)
-        return result if result else []
+        return list(cached[0])
+    return [item[0] for item in cached[0]]
+
+# Function to search a large lookup table by prefix for type-ahead pickers
+def search_foreign_key_options(table, id_column, display_column=None, prefix="", limit=50):
+    """Return up to limit (id, display) rows whose display value starts with
+    prefix, or whose ID equals it
+    
+    The prefix match is a LIKE 'abc%' on the display column so it can use
+    an index on that column.
+    """
+    check_identifiers(table, [id_column] + ([display_column] if display_column else []))
+    prefix = str(prefix).strip()
+    like = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    
+    if display_column:
+        query = f"SELECT {id_column}, CAST({display_column} AS CHAR) FROM {table} WHERE {display_column} LIKE %s"
+        params = [like]
+        if prefix.isdigit():
+            query += f" OR {id_column} = %s"
+            params.append(int(prefix))
+        query += f" ORDER BY {display_column}"
     else:
-        query = f"SELECT {id_column} FROM {table}"
-        result = execute_query(query)
-        return [item[0] for item in result] if result else []
+        query = f"SELECT {id_column}, NULL FROM {table} WHERE CAST({id_column} AS CHAR) LIKE %s ORDER BY {id_column}"
+        params = [like]
+    query += f" LIMIT {int(limit)}"
+    
+    result = execute_query(query, params)
+    if result is None:
+        raise RuntimeError(f"Could not search {table}")
+    return [tuple(row) for row in result]
 
 # Function to export data to CSV
-def export_data_to_csv(table, filename):
-    """Export table data to CSV file"""
+def export_data_to_csv(table, filename, batch_size=1000, progress_callback=None):
+    """Export table data to CSV file
+    
+    Rows are written as they arrive from the server, so memory use does
+    not grow with the size of the table. progress_callback(rows_written)
+    is called after every batch_size rows.
+    """
     import csv
     
     try:
-        data = fetch_all_data(table)
-        columns = get_table_columns(table)
+        start = time.monotonic()
+        row_count = 0
+        columns = []
+        rows = stream_query(table, batch_size=batch_size, description=columns)
         
         with open(filename, 'w', newline='') as csvfile:
             writer = csv.writer(csvfile)
-            writer.writerow(columns)  # Write header
-            writer.writerows(data)    # Write data
+            for row in rows:
+                if row_count == 0:
+                    writer.writerow(columns)  # Write header
+                writer.writerow(row)
+                row_count += 1
+                if progress_callback and row_count % batch_size == 0:
+                    progress_callback(row_count)
+            
+            # Empty tables still get a header
+            if row_count == 0:
+                writer.writerow(columns or get_table_columns(table))
         
-        logger.info(f"Data from {table} exported to {filename}")
+        elapsed = time.monotonic() - start
+        logger.info(f"Data from {table} exported to {filename} "
+                    f"({row_count} rows in {elapsed:.2f}s)")
+        with export_stats_lock:
+            export_stats["exports"] += 1
+            export_stats["rows"] += row_count
+            export_stats["seconds"] += elapsed
         return True
     except Exception as e:
         logger.error(f"Error exporting data: {e}")
+        with export_stats_lock:
+            export_stats["errors"] += 1
         return False
 
+export_stats = {"exports": 0, "errors": 0, "rows": 0, "seconds": 0.0}
+export_stats_lock = threading.Lock()
+
+def get_export_stats():
+    """Return export counts, rows written and seconds spent exporting"""
+    with export_stats_lock:
+        return dict(export_stats)
+
+# Compiled validators, one per table, built from the schema catalog
+validator_cache = {}
+def get_validator(table):
+    """Return the compiled TableValidator of a table"""
+    validator = validator_cache.get(table)
+    if validator is None:
+        validator = validators.compile_validator(schema, table)
+        validator_cache[table] = validator
+    return validator
+
+# Function to look up which key values already exist in a table
+def find_existing_keys(table, column, values, extra_column=None, chunk_size=1000):
+    """Return rows of (value,) or (value, extra_column) for the values found
+    in table.column, using one IN query per chunk_size values"""
+    check_identifiers(table, [column] + ([extra_column] if extra_column else []))
+    select = f"{column}, {extra_column}" if extra_column else column
+    values = list(values)
+    found = []
+    for i in range(0, len(values), chunk_size):
+        chunk = values[i:i + chunk_size]
+        placeholders = ", ".join(["%s"] * len(chunk))
+        query = f"SELECT {select} FROM {table} WHERE {column} IN ({placeholders})"
+        result = execute_query(query, chunk)
+        if result is None:
+            raise RuntimeError(f"Could not look up {table}.{column}")
+        found.extend(result)
+    return found
+
 # Validate data before insert/update
-def validate_data(table, data_dict):
+def validate_data(table, data_dict, check_keys=True, original_key=None):
     """Validate data before saving to database
-    Returns (is_valid, error_message)"""
-    
-    errors = []
     
-    # Get table columns and their properties
-    conn = None
+    Types, ranges, lengths and NOT NULL are checked in-process from the
+    schema catalog. With check_keys, foreign key values must exist and
+    the primary key and UNIQUE columns must not clash with another row;
+    original_key is the primary key of the row being edited (None for a
+    new row).
+    Returns (is_valid, error_message)"""
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute(f"DESCRIBE {table}")
-        columns_info = cursor.fetchall()
+        validator = get_validator(table)
+        errors = validator.validate(data_dict)
         
-        # Basic validation rules based on column properties
-        for col_info in columns_info:
-            col_name = col_info[0]
-            col_type = col_info[1]
-            is_nullable = col_info[2] == 'YES'
-            
-            if col_name in data_dict:
-                value = data_dict[col_name]
-                
-                # Check for required fields
-                if not is_nullable and (value is None or value == ''):
-                    errors.append(f"{col_name} is required")
-                
-                # Type validation
-                if value and 'int' in col_type and not str(value).isdigit():
-                    errors.append(f"{col_name} must be a number")
-                
-                # Date validation
-                if value and 'date' in col_type:
-                    try:
-                        from datetime import datetime
-                        datetime.strptime(value, '%Y-%m-%d')
-                    except ValueError:
-                        errors.append(f"{col_name} must be a valid date (YYYY-MM-DD)")
+        if not errors and check_keys:
+            columns = list(data_dict)
+            row = [data_dict[col] for col in columns]
+            errors = validator.check_keys(columns, [row], find_existing_keys, [original_key]).get(0, [])
         
         return (len(errors) == 0, ', '.join(errors))
     
     except Exception as e:
         logger.error(f"Validation error: {e}")
         return (False, str(e))
-    finally:
-        if conn:
-            conn.close()
\ No newline at end of file
+
+# Opt-in Prometheus endpoint; started with the pool when METRICS_PORT is set
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0") or 0)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_TOP_STATEMENTS = int(os.getenv("METRICS_TOP_STATEMENTS", "20"))
+
+POOL_GAUGES = {
+    "size": "Connections the pool may currently open",
+    "min_size": "Lower limit for adaptive pool sizing",
+    "max_size": "Upper limit for adaptive pool sizing",
+    "open": "Open pooled connections",
+    "in_use": "Borrowed pooled connections",
+    "idle": "Idle pooled connections",
+    "waiters": "Callers waiting for a pooled connection",
+}
+POOL_COUNTERS = {
+    "acquired": "Connections borrowed from the pool",
+    "timeouts": "Callers that gave up waiting for a connection",
+    "created": "Connections opened by the pool",
+    "recycled": "Connections replaced after DB_POOL_MAX_LIFETIME",
+    "failed_checks": "Idle connections that failed their health check",
+    "grown": "Times the pool grew",
+    "shrunk": "Times the pool shrank",
+}
+
+@metrics.registry.register_collector
+def _collect_metrics(writer):
+    """Write pool, query, cache and export metrics for the /metrics page"""
+    # Pool utilisation; nothing to report before the first connection
+    if connection_pool is not None:
+        stats = connection_pool.get_stats()
+        for key, help_text in POOL_GAUGES.items():
+            writer.gauge(f"pool_{key}", help_text, stats[key])
+        for key, help_text in POOL_COUNTERS.items():
+            writer.counter(f"pool_{key}_total", help_text, stats[key])
+        writer.histogram(
+            "pool_wait_seconds", "Time spent waiting for a pooled connection",
+            [bound / 1000 for bound in WAIT_BUCKETS_MS], list(stats["wait_histogram"].values()),
+            stats["avg_wait_ms"] * stats["acquired"] / 1000
+        )
+        writer.gauge("pool_oldest_connection_age_seconds", "Age of the oldest open connection",
+                     stats["oldest_connection_age"])
+
+    # Query latency over all statements, plus the heaviest statements
+    statements = query_recorder.get_stats()
+    histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+    total_ms = 0.0
+    for entry in statements:
+        for i, count in enumerate(entry["histogram"].values()):
+            histogram[i] += count
+        total_ms += entry["total_ms"]
+    writer.histogram("query_duration_seconds", "Statement latency including fetches",
+                     [bound / 1000 for bound in LATENCY_BUCKETS_MS], histogram, total_ms / 1000)
+    writer.counter("query_rows_total", "Rows returned or affected by statements",
+                   sum(entry["rows"] for entry in statements))
+    writer.counter("query_errors_total", "Statements that raised an error",
+                   sum(entry["errors"] for entry in statements))
+    writer.counter("query_slow_total", "Statements slower than SLOW_QUERY_MS",
+                   sum(entry["slow"] for entry in statements))
+    for entry in statements[:METRICS_TOP_STATEMENTS]:
+        labels = {"statement": entry["fingerprint"][:200]}
+        writer.counter("statement_calls_total", "Executions of a statement", entry["count"], labels)
+        writer.counter("statement_seconds_total", "Time spent in a statement", entry["total_ms"] / 1000, labels)
+        writer.counter("statement_rows_total", "Rows returned by a statement", entry["rows"], labels)
+
+    # Cache hit rates
+    cache = result_cache.get_stats()
+    for key in ("hits", "misses", "evictions", "invalidations"):
+        writer.counter(f"result_cache_{key}_total", f"Result cache {key}", cache[key])
+    writer.gauge("result_cache_entries", "Cached SELECT results", cache["entries"])
+    writer.gauge("result_cache_bytes", "Approximate memory held by cached results", cache["bytes"])
+    writer.gauge("result_cache_hit_ratio", "Result cache hits per lookup", cache["hit_rate"])
+    flights = single_flight.get_stats()
+    writer.counter("single_flight_executions_total", "SELECTs that ran on the server through single-flight", flights["leaders"])
+    writer.counter("single_flight_shared_total", "SELECTs answered by an identical one in flight", flights["shared"])
+    writer.counter("single_flight_shared_across_processes_total", "SELECTs answered by another portal process", flights["shared_across_processes"])
+    writer.gauge("single_flight_in_flight", "Distinct SELECTs currently in flight", flights["in_flight"])
+    indexes = get_search_index_stats()
+    writer.counter("search_index_searches_total", "Searches offered to the search index", indexes["searches"])
+    writer.counter("search_index_answered_total", "Searches answered by the search index", indexes["answered"])
+    writer.counter("search_index_builds_total", "Search index builds", indexes["builds"])
+    for table, info in indexes["tables"].items():
+        writer.gauge("search_index_rows", "Rows in the search index of a table", info["rows"], {"table": table})
+    statement_cache = get_statement_cache_stats()
+    for outcome in ("hits", "misses"):
+        for kind in ("sql", "prepared"):
+            writer.counter(f"statement_cache_{outcome}_total", f"Statement cache {outcome}",
+                           statement_cache[f"{kind}_{outcome}"], {"cache": kind})
+
+    # Export throughput
+    exports = get_export_stats()
+    writer.counter("exports_total", "Completed table exports", exports["exports"])
+    writer.counter("export_errors_total", "Failed table exports", exports["errors"])
+    writer.counter("export_rows_total", "Rows written by table exports", exports["rows"])
+    writer.counter("export_seconds_total", "Time spent exporting tables", exports["seconds"])
+    writer.gauge("threads", "Live Python threads, including background work", threading.active_count())
@@ -5,8 +5,10 @@ import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 import logging
 from dotenv import load_dotenv
-import mysql.connector
-import threading
+import database_connection as db
+import tracing
+import query_budget
+import task_runner
 import csv
 from datetime import datetime
 
@@ -24,72 +26,43 @@ logger = logging.getLogger("driver_management")
 # Load environment variables
 load_dotenv()
 
-# Access the environment variables
-db_host = os.getenv("MYSQL_HOST")
-db_port = os.getenv("MYSQL_PORT")
-db_name = os.getenv("MYSQL_DATABASE")
-db_user = os.getenv("MYSQL_USER")
-db_password = os.getenv("MYSQL_PASSWORD")
-
 def connect_db():
-    """Create a database connection"""
-    return mysql.connector.connect(
-        host=db_host,
-        port=db_port,
-        user=db_user,
-        password=db_password,
-        database=db_name
-    )
+    """Borrow a connection from the shared pool; close() returns it"""
+    return db.get_connection()
 
 def fetch_data(tree, table):
     """Fetch data from a table and populate treeview"""
     try:
-        conn = connect_db()
-        cursor = conn.cursor()
-        
-        # Get columns
-        cursor.execute(f"SHOW COLUMNS FROM {table}")
-        cols = [col[0] for col in cursor.fetchall()]
+        # Get columns from the shared schema catalog
+        cols = db.get_table_columns(table)
         
         if tree:
             # Get data
-            cursor.execute(f"SELECT * FROM {table}")
-            rows = cursor.fetchall()
-            
-            # Clear existing data
-            tree.delete(*tree.get_children())
-            
-            # Add new data
-            for row in rows:
-                tree.insert("", tk.END, values=row)
+            rows = db.fetch_all_data(table)
+            populate_tree(tree, rows)
                 
-        conn.close()
         return cols
     except Exception as e:
         logger.error(f"Database error in fetch_data: {e}")
         messagebox.showerror("Database Error", str(e))
         return []
 
-def search_data(tree, table, column, value):
-    """Search for specific data in a table"""
-    try:
-        conn = connect_db()
-        cursor = conn.cursor()
-        
-        # Execute search query
-        query = f"SELECT * FROM {table} WHERE {column} LIKE %s"
-        cursor.execute(query, (f"%{value}%",))
-        
-        rows = cursor.fetchall()
-        
+def populate_tree(tree, rows):
+    """Replace the rows of a treeview; call on the Tk thread only"""
+    with tracing.span("tree.populate", rows=len(rows)):
         # Clear existing data
         tree.delete(*tree.get_children())
         
-        # Add search results
+        # Add new data
         for row in rows:
             tree.insert("", tk.END, values=row)
-            
-        conn.close()
+
+def search_data(tree, table, column, value):
+    """Search for specific data in a table"""
+    try:
+        # Execute search query
+        rows = db.search_data(table, column, value)
+        populate_tree(tree, rows)
         
         # Return number of results
         return len(rows)
@@ -142,13 +115,8 @@ def add_edit_form(table, columns, tree, data=None):
             # Extract base table name from field
             referenced_table = col.replace('_ID', '')
             try:
-                # Fetch foreign key values
-                conn = connect_db()
-                cursor = conn.cursor()
-                
                 # Get display field if available (use first non-ID field)
-                cursor.execute(f"SHOW COLUMNS FROM {referenced_table}")
-                ref_cols = [c[0] for c in cursor.fetchall()]
+                ref_cols = db.get_table_columns(referenced_table)
                 display_field = None
                 
                 for ref_col in ref_cols:
@@ -158,18 +126,14 @@ def add_edit_form(table, columns, tree, data=None):
                 
                 if display_field:
                     # Fetch ID and display values
-                    cursor.execute(f"SELECT {col}, {display_field} FROM {referenced_table}")
-                    ref_data = cursor.fetchall()
+                    ref_data = db.get_foreign_key_options(referenced_table, col, display_field)
                     ref_values = [f"{item[0]} - {item[1]}" for item in ref_data]
                     ref_dict = {f"{item[0]} - {item[1]}": item[0] for item in ref_data}
                 else:
                     # Just fetch IDs
-                    cursor.execute(f"SELECT {col} FROM {referenced_table}")
-                    ref_data = cursor.fetchall()
-                    ref_values = [str(item[0]) for item in ref_data]
-                    ref_dict = {str(item[0]): item[0] for item in ref_values}
-                
-                conn.close()
+                    ref_data = db.get_foreign_key_options(referenced_table, col)
+                    ref_values = [str(item) for item in ref_data]
+                    ref_dict = {str(item): item for item in ref_data}
                 
                 var = tk.StringVar(value=data[idx] if data else "")
                 combo = ttk.Combobox(field_frame, values=ref_values, textvariable=var, width=30)
@@ -234,25 +198,16 @@ def add_edit_form(table, columns, tree, data=None):
                 values.append(var.get())
         
         try:
-            conn = connect_db()
-            cursor = conn.cursor()
-            
             if data:
                 # Update existing record
-                set_clause = ", ".join([f"{col}=%s" for col, _ in entries[1:]])
-                cursor.execute(f"UPDATE {table} SET {set_clause} WHERE {entries[0][0]}=%s", 
-                              values[1:] + [values[0]])
+                db.update_data(table, [col for col, _ in entries[1:]], values[1:],
+                               entries[0][0], values[0])
                 status = "updated"
             else:
                 # Insert new record
-                col_clause = ", ".join([col for col, _ in entries])
-                q_clause = ", ".join(["%s"] * len(entries))
-                cursor.execute(f"INSERT INTO {table} ({col_clause}) VALUES ({q_clause})", values)
+                db.insert_data(table, [col for col, _ in entries], values)
                 status = "added"
             
-            conn.commit()
-            conn.close()
-            
             # Refresh the tree
             fetch_data(tree, table)
             
@@ -292,16 +247,11 @@ def delete_selected(table, tree):
     
     if messagebox.askyesno("Confirm Delete", "Are you sure you want to delete this record?"):
         try:
-            conn = connect_db()
-            cursor = conn.cursor()
-            
             item = tree.item(selected[0])
             record_id = item["values"][0]
             id_column = tree["columns"][0]
             
-            cursor.execute(f"DELETE FROM {table} WHERE {id_column}=%s", (record_id,))
-            conn.commit()
-            conn.close()
+            db.delete_data(table, id_column, record_id)
             
             # Refresh the tree
             fetch_data(tree, table)
@@ -363,9 +313,6 @@ def export_to_csv(tree, filename=None):
 def get_expiring_qualifications():
     """Get qualifications approaching expiry"""
     try:
-        conn = connect_db()
-        cursor = conn.cursor()
-        
         # Get current date
         today = datetime.now().strftime('%Y-%m-%d')
         
@@ -380,9 +327,7 @@ def get_expiring_qualifications():
         ORDER BY dq.Expiry_Date
         """
         
-        cursor.execute(query)
-        results = cursor.fetchall()
-        conn.close()
+        results = db.execute_query(query)
         
         return results
     except Exception as e:
@@ -396,6 +341,13 @@ class DriverManagement:
         self.root.geometry("1200x800")
         self.root.minsize(800, 600)
         
+        # Widget updates from background tasks are applied on this thread
+        task_runner.ui.attach(self.root)
+        
+        # Tab loads and searches share one view: a newer request cancels the
+        # one still running, e.g. when switching tabs or searching again
+        self.view = (type(self).__name__, id(self))
+        
         # Create menu
         self.create_menu()
         
@@ -410,6 +362,7 @@ class DriverManagement:
         file_menu = tk.Menu(menubar, tearoff=0)
         file_menu.add_command(label="Export Current View", command=self.export_current_view)
         file_menu.add_command(label="Export All Data", command=self.export_all_data)
+        file_menu.add_command(label="Export Traces...", command=self.export_traces)
         file_menu.add_separator()
         file_menu.add_command(label="Exit", command=self.root.quit)
         menubar.add_cascade(label="File", menu=file_menu)
@@ -588,22 +541,32 @@ class DriverManagement:
         """Refresh data in a table"""
         # Update status
         self.status_var.set(f"Loading data from {table}...")
-        
-        # Function to run in background thread
-        def background_load():
-            try:
-                # Fetch data
-                fetch_data(tree, table)
-                
-                # Update status in main thread
-                self.root.after(0, lambda: self.status_var.set(f"Ready - {len(tree.get_children())} records loaded from {table}"))
-            except Exception as e:
-                logger.error(f"Error refreshing {table}: {e}")
-                # Update status in main thread
-                self.root.after(0, lambda: self.status_var.set(f"Error: {str(e)[:50]}..."))
-        
-        # Start background thread
-        threading.Thread(target=background_load, daemon=True).start()
+        action = tracing.start_action("DriverManagement.refresh_table", table=table)
+        
+        # Function to show the rows in main thread
+        def loaded(rows):
+            with tracing.activate(action):
+                populate_tree(tree, rows)
+            self.status_var.set(f"Ready - {len(rows)} records loaded from {table}{query_budget.truncation_note(rows)}")
+            tracing.finish_action(action, tree, rows=len(rows))
+        
+        # Function to report errors in main thread
+        def failed(e):
+            logger.error(f"Error refreshing {table}: {e}")
+            self.status_var.set(f"Error: {str(e)[:50]}...")
+            tracing.finish_action(action, error=e)
+        
+        # Function to close the trace of a request replaced by a newer one
+        def cancelled(e):
+            tracing.finish_action(action, error=e)
+        
+        # Fetch data on the shared worker pool
+        task_runner.submit(
+            tracing.bind(action, db.fetch_all_data), table,
+            priority=task_runner.INTERACTIVE, key=("refresh", table),
+            on_success=loaded, on_error=failed,
+            view=self.view, on_cancel=cancelled
+        )
     
     def search_data(self, tree, table, column, value):
         """Search for data in a table"""
@@ -613,22 +576,32 @@ class DriverManagement:
         
         # Update status
         self.status_var.set(f"Searching for {value} in {column}...")
-        
-        # Function to run in background thread
-        def background_search():
-            try:
-                # Perform search
-                result_count = search_data(tree, table, column, value)
-                
-                # Update status in main thread
-                self.root.after(0, lambda: self.status_var.set(f"Search complete - {result_count} matches found"))
-            except Exception as e:
-                logger.error(f"Error searching {table}: {e}")
-                # Update status in main thread
-                self.root.after(0, lambda: self.status_var.set(f"Search error: {str(e)[:50]}..."))
-        
-        # Start background thread
-        threading.Thread(target=background_search, daemon=True).start()
+        action = tracing.start_action("DriverManagement.search_data", table=table, column=column)
+        
+        # Function to show the matches in main thread
+        def searched(rows):
+            with tracing.activate(action):
+                populate_tree(tree, rows)
+            self.status_var.set(f"Search complete - {len(rows)} matches found{query_budget.truncation_note(rows)}")
+            tracing.finish_action(action, tree, rows=len(rows))
+        
+        # Function to report errors in main thread
+        def failed(e):
+            logger.error(f"Error searching {table}: {e}")
+            self.status_var.set(f"Search error: {str(e)[:50]}...")
+            tracing.finish_action(action, error=e)
+        
+        # Function to close the trace of a request replaced by a newer one
+        def cancelled(e):
+            tracing.finish_action(action, error=e)
+        
+        # Perform search on the shared worker pool
+        task_runner.submit(
+            tracing.bind(action, db.search_data), table, column, value,
+            priority=task_runner.INTERACTIVE, key=("search", table, column, value),
+            on_success=searched, on_error=failed,
+            view=self.view, on_cancel=cancelled
+        )
     
     def export_current_view(self):
         """Export current tab data to CSV"""
@@ -642,6 +615,23 @@ class DriverManagement:
         # Ask for filename
         export_to_csv(tree)
     
+    def export_traces(self):
+        """Export recent action traces to a JSON file"""
+        filename = filedialog.asksaveasfilename(
+            defaultextension=".json",
+            filetypes=[("JSON files", "*.json"), ("All files", "*.*")],
+            initialfile="traces.json"
+        )
+        if not filename:
+            return
+        
+        try:
+            tracing.export_json(filename)
+            self.status_var.set(f"Traces exported to {filename}")
+        except Exception as e:
+            logger.error(f"Error exporting traces: {e}")
+            messagebox.showerror("Export Error", str(e))
+    
     def export_all_data(self):
         """Export all tables to CSV"""
         # Ask for directory
@@ -652,32 +642,33 @@ class DriverManagement:
         # Update status
         self.status_var.set("Exporting all data...")
         
-        # Function to run in background thread
-        def background_export():
-            try:
-                # Export each table
-                for table, tree in self.treeviews.items():
-                    # Refresh to ensure latest data
-                    fetch_data(tree, table)
-                    
-                    # Export
-                    filename = os.path.join(directory, f"{table}.csv")
-                    export_to_csv(tree, filename)
-                
-                # Update status in main thread
-                self.root.after(0, lambda: self.status_var.set("Export complete"))
-                self.root.after(0, lambda: messagebox.showinfo(
-                    "Export Complete", 
-                    f"All tables exported to {directory}"
-                ))
-            except Exception as e:
-                logger.error(f"Export error: {e}")
-                # Update status in main thread
-                self.root.after(0, lambda: self.status_var.set(f"Export error: {str(e)[:50]}..."))
-                self.root.after(0, lambda: messagebox.showerror("Export Error", str(e)))
-        
-        # Start background thread
-        threading.Thread(target=background_export, daemon=True).start()
+        # Function to run in background; streams each table straight from
+        # the database so no widgets are touched off the main thread
+        def background_export(tables):
+            for table in tables:
+                filename = os.path.join(directory, f"{table}.csv")
+                if not db.export_data_to_csv(table, filename):
+                    raise RuntimeError(f"Could not export {table}")
+        
+        # Function to update status in main thread
+        def exported(result):
+            self.status_var.set("Export complete")
+            messagebox.showinfo(
+                "Export Complete", 
+                f"All tables exported to {directory}"
+            )
+        
+        # Function to report errors in main thread
+        def failed(e):
+            logger.error(f"Export error: {e}")
+            self.status_var.set(f"Export error: {str(e)[:50]}...")
+            messagebox.showerror("Export Error", str(e))
+        
+        task_runner.submit(
+            background_export, list(self.treeviews),
+            priority=task_runner.BULK, key=("export_all", directory),
+            on_success=exported, on_error=failed
+        )
     
     def refresh_current_view(self):
         """Refresh current tab"""
@@ -692,62 +683,61 @@ class DriverManagement:
         # Update status
         self.status_var.set("Refreshing all tabs...")
         
-        # Function to run in background thread
-        def background_refresh():
-            try:
-                # Refresh each table
-                for table, tree in self.treeviews.items():
-                    fetch_data(tree, table)
-                
-                # Update status in main thread
-                self.root.after(0, lambda: self.status_var.set("All tabs refreshed"))
-            except Exception as e:
-                logger.error(f"Refresh error: {e}")
-                # Update status in main thread
-                self.root.after(0, lambda: self.status_var.set(f"Refresh error: {str(e)[:50]}..."))
-                self.root.after(0, lambda: messagebox.showerror("Refresh Error", str(e)))
-        
-        # Start background thread
-        threading.Thread(target=background_refresh, daemon=True).start()
+        # Function to run in background
+        def background_refresh(tables):
+            return {table: db.fetch_all_data(table) for table in tables}
+        
+        # Function to show every table in main thread
+        def refreshed(results):
+            for table, rows in results.items():
+                populate_tree(self.treeviews[table], rows)
+            self.status_var.set("All tabs refreshed")
+        
+        # Function to report errors in main thread
+        def failed(e):
+            logger.error(f"Refresh error: {e}")
+            self.status_var.set(f"Refresh error: {str(e)[:50]}...")
+            messagebox.showerror("Refresh Error", str(e))
+        
+        task_runner.submit(
+            background_refresh, list(self.treeviews),
+            priority=task_runner.BULK, key="refresh_all",
+            on_success=refreshed, on_error=failed
+        )
     
     def show_driver_qualifications(self):
         """Show driver qualifications report"""
         # Update status
         self.status_var.set("Generating driver qualifications report...")
         
-        # Function to run in background thread
+        # Function to run in background
         def background_report():
-            try:
-                # Get data
-                conn = connect_db()
-                cursor = conn.cursor()
-                
-                query = """
-                SELECT d.Driver_ID, d.First_Name, d.Last_Name, dq.Qualification_Type, 
-                       dq.Qualification_Number, dq.Expiry_Date 
-                FROM Driver d
-                JOIN Driver_Qualification dq ON d.Driver_ID = dq.Driver_ID
-                ORDER BY d.Last_Name, d.First_Name
-                """
-                
-                cursor.execute(query)
-                results = cursor.fetchall()
-                conn.close()
-                
-                # Show report in main thread
-                self.root.after(0, lambda: self.display_qualifications_report(results))
-                
-                # Update status
-                self.root.after(0, lambda: self.status_var.set("Ready"))
-                
-            except Exception as e:
-                logger.error(f"Report error: {e}")
-                # Update status in main thread
-                self.root.after(0, lambda: self.status_var.set("Ready"))
-                self.root.after(0, lambda: messagebox.showerror("Report Error", str(e)))
-        
-        # Start background thread
-        threading.Thread(target=background_report, daemon=True).start()
+            # Get data
+            query = """
+            SELECT d.Driver_ID, d.First_Name, d.Last_Name, dq.Qualification_Type, 
+                   dq.Qualification_Number, dq.Expiry_Date 
+            FROM Driver d
+            JOIN Driver_Qualification dq ON d.Driver_ID = dq.Driver_ID
+            ORDER BY d.Last_Name, d.First_Name
+            """
+            
+            return db.execute_query(query)
+        
+        # Function to show report in main thread
+        def show_report(results):
+            self.display_qualifications_report(results)
+            self.status_var.set("Ready")
+        
+        # Function to report errors in main thread
+        def failed(e):
+            logger.error(f"Report error: {e}")
+            self.status_var.set("Ready")
+            messagebox.showerror("Report Error", str(e))
+        
+        task_runner.submit(
+            background_report, key="qualifications_report",
+            on_success=show_report, on_error=failed
+        )
     
     def display_qualifications_report(self, results):
         """Display driver qualifications report"""
@@ -929,40 +919,35 @@ class DriverManagement:
         # Update status
         self.status_var.set("Generating driver assignments report...")
         
-        # Function to run in background thread
+        # Function to run in background
         def background_report():
-            try:
-                # Get data
-                conn = connect_db()
-                cursor = conn.cursor()
-                
-                query = """
-                SELECT d.Driver_ID, d.First_Name, d.Last_Name, v.Vehicle_ID, 
-                       v.Make, v.Model, v.Registration_Number, vda.Assignment_Date 
-                FROM Driver d
-                JOIN Vehicle_Driver_Assignment vda ON d.Driver_ID = vda.Driver_ID
-                JOIN Vehicle v ON vda.Vehicle_ID = v.Vehicle_ID
-                ORDER BY d.Last_Name, d.First_Name
-                """
-                
-                cursor.execute(query)
-                results = cursor.fetchall()
-                conn.close()
-                
-                # Show report in main thread
-                self.root.after(0, lambda: self.display_assignments_report(results))
-                
-                # Update status
-                self.root.after(0, lambda: self.status_var.set("Ready"))
-                
-            except Exception as e:
-                logger.error(f"Report error: {e}")
-                # Update status in main thread
-                self.root.after(0, lambda: self.status_var.set("Ready"))
-                self.root.after(0, lambda: messagebox.showerror("Report Error", str(e)))
-        
-        # Start background thread
-        threading.Thread(target=background_report, daemon=True).start()
+            # Get data
+            query = """
+            SELECT d.Driver_ID, d.First_Name, d.Last_Name, v.Vehicle_ID, 
+                   v.Make, v.Model, v.Registration_Number, vda.Assignment_Date 
+            FROM Driver d
+            JOIN Vehicle_Driver_Assignment vda ON d.Driver_ID = vda.Driver_ID
+            JOIN Vehicle v ON vda.Vehicle_ID = v.Vehicle_ID
+            ORDER BY d.Last_Name, d.First_Name
+            """
+            
+            return db.execute_query(query)
+        
+        # Function to show report in main thread
+        def show_report(results):
+            self.display_assignments_report(results)
+            self.status_var.set("Ready")
+        
+        # Function to report errors in main thread
+        def failed(e):
+            logger.error(f"Report error: {e}")
+            self.status_var.set("Ready")
+            messagebox.showerror("Report Error", str(e))
+        
+        task_runner.submit(
+            background_report, key="assignments_report",
+            on_success=show_report, on_error=failed
+        )
     
     def display_assignments_report(self, results):
         """Display driver assignments report"""
@@ -1048,26 +1033,26 @@ class DriverManagement:
         # Update status
         self.status_var.set("Generating license expiry report...")
         
-        # Function to run in background thread
+        # Function to run in background
         def background_report():
-            try:
-                # Get data
-                results = get_expiring_qualifications()
-                
-                # Show report in main thread
-                self.root.after(0, lambda: self.display_license_expiry(results))
-                
-                # Update status
-                self.root.after(0, lambda: self.status_var.set("Ready"))
-                
-            except Exception as e:
-                logger.error(f"Report error: {e}")
-                # Update status in main thread
-                self.root.after(0, lambda: self.status_var.set("Ready"))
-                self.root.after(0, lambda: messagebox.showerror("Report Error", str(e)))
-        
-        # Start background thread
-        threading.Thread(target=background_report, daemon=True).start()
+            # Get data
+            return get_expiring_qualifications()
+        
+        # Function to show report in main thread
+        def show_report(results):
+            self.display_license_expiry(results)
+            self.status_var.set("Ready")
+        
+        # Function to report errors in main thread
+        def failed(e):
+            logger.error(f"Report error: {e}")
+            self.status_var.set("Ready")
+            messagebox.showerror("Report Error", str(e))
+        
+        task_runner.submit(
+            background_report, key="license_expiry_report",
+            on_success=show_report, on_error=failed
+        )
     
     def display_license_expiry(self, results):
         """Display license expiry report"""
@@ -2,10 +2,107 @@ import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 import csv
 import database_connection as db
+import task_runner
+import query_budget
 import logging
 
 logger = logging.getLogger("form_utils")
 
+# Type-ahead searches run ahead of reports and exports
+task_runner.runner.set_module_priority(__name__, task_runner.INTERACTIVE)
+
+class ForeignKeyPicker(ttk.Combobox):
+    """Combobox that searches a large lookup table as the user types
+    
+    Each search asks the server for at most `limit` rows whose display
+    column starts with the typed text. Searches are debounced and the
+    results are cached per prefix, so typing further into a prefix that
+    returned fewer than `limit` rows is filtered locally.
+    """
+    DEBOUNCE_MS = 250
+    
+    def __init__(self, parent, table, id_column, display_column=None, limit=50, **kwargs):
+        self.var = kwargs.pop("textvariable", None) or tk.StringVar()
+        super().__init__(parent, textvariable=self.var, postcommand=self.search, **kwargs)
+        self.table = table
+        self.id_column = id_column
+        self.display_column = display_column
+        self.limit = limit
+        self.choices = {}       # label -> ID, for every row shown so far
+        self.prefix_cache = {}  # prefix -> rows returned by the server
+        self.pending = None
+        self.wanted = None
+        
+        self.bind("<KeyRelease>", self.on_key)
+        task_runner.ui.attach(self)
+    
+    def label(self, row):
+        return f"{row[0]} - {row[1]}" if row[1] is not None else str(row[0])
+    
+    def matches(self, row, prefix):
+        """Local equivalent of the server-side prefix match"""
+        if row[1] is None:
+            return str(row[0]).startswith(prefix)
+        return str(row[1]).lower().startswith(prefix.lower()) or str(row[0]) == prefix
+    
+    def on_key(self, event):
+        if event.keysym in ("Up", "Down", "Return", "Escape", "Tab"):
+            return
+        if self.pending:
+            self.after_cancel(self.pending)
+        self.pending = self.after(self.DEBOUNCE_MS, self.search)
+    
+    def cached_rows(self, prefix):
+        if prefix in self.prefix_cache:
+            return self.prefix_cache[prefix]
+        # A shorter prefix that was not cut off by the limit has every match
+        for n in range(len(prefix) - 1, -1, -1):
+            rows = self.prefix_cache.get(prefix[:n])
+            if rows is not None and len(rows) < self.limit:
+                return [row for row in rows if self.matches(row, prefix)]
+        return None
+    
+    def search(self):
+        self.pending = None
+        prefix = self.var.get().strip()
+        if prefix in self.choices:
+            return  # A complete choice is selected
+        
+        rows = self.cached_rows(prefix)
+        if rows is not None:
+            self.show(rows)
+            return
+        
+        self.wanted = prefix
+        task_runner.submit(
+            db.search_foreign_key_options,
+            self.table, self.id_column, self.display_column, prefix, self.limit,
+            key=(id(self), prefix), view=id(self),
+            on_success=lambda rows: self.loaded(prefix, rows),
+            on_error=lambda e: logger.error(f"Error searching {self.table}: {e}")
+        )
+    
+    def loaded(self, prefix, rows):
+        self.prefix_cache[prefix] = rows
+        # Ignore results for text the user has already typed past
+        if prefix == self.wanted:
+            self.show(rows)
+    
+    def show(self, rows):
+        labels = [self.label(row) for row in rows]
+        self.choices.update(zip(labels, (row[0] for row in rows)))
+        self["values"] = labels
+    
+    def get_id(self):
+        """Return the ID of the selected row, or None"""
+        text = self.var.get().strip()
+        if text in self.choices:
+            return self.choices[text]
+        try:
+            return int(text.split(" - ")[0])
+        except ValueError:
+            return None
+
 def create_edit_form(parent, table, columns, tree, data=None):
     """
     Creates a reusable form for adding or editing records
@@ -45,6 +142,14 @@ def create_edit_form(parent, table, columns, tree, data=None):
     # Track which fields are dropdowns
     dropdown_vars = {}
     
+    # Load the options of every foreign key dropdown in one round trip
+    try:
+        fk_references = db.get_form_foreign_keys(table)
+        fk_options = db.prefetch_foreign_key_options(table, db.FK_DROPDOWN_LIMIT)
+    except Exception as e:
+        logger.error(f"Error loading foreign key options for {table}: {e}")
+        fk_options = {}
+    
     for idx, col in enumerate(columns):
         # Skip auto-increment fields for new records
         if not data and col.endswith('_ID') and col == columns[0]:
@@ -58,31 +163,26 @@ def create_edit_form(parent, table, columns, tree, data=None):
         label = ttk.Label(field_frame, text=col, width=20, anchor="w")
         label.pack(side="left")
         
+        # Large lookup tables get a type-ahead picker instead of a dropdown
+        if col in fk_options and fk_options[col] is None and col != columns[0]:
+            ref_table, ref_column, display_column = fk_references[col]
+            picker = ForeignKeyPicker(field_frame, ref_table, ref_column, display_column, width=30)
+            picker.var.set(data[idx] if data else "")
+            picker.pack(side="left", fill="x", expand=True, padx=(0, 10))
+            dropdown_vars[col] = (picker.var, picker.choices)
+            entries.append((col, picker.var))
+        
         # For foreign keys, create dropdowns
-        if col.endswith('_ID') and col != columns[0]:
-            # Extract base table name from field
-            referenced_table = col.replace('_ID', '')
+        elif col in fk_options and col != columns[0]:
             try:
-                # Fetch foreign key values
-                ref_values = []
-                
-                # Get display field if available (use first non-ID field)
-                ref_cols = db.get_table_columns(referenced_table)
-                display_field = None
-                
-                for ref_col in ref_cols:
-                    if not ref_col.endswith('_ID') and ref_col != 'ID':
-                        display_field = ref_col
-                        break
-                
-                if display_field:
-                    # Fetch ID and display values
-                    ref_data = db.get_foreign_key_options(referenced_table, col, display_field)
+                ref_data = fk_options[col]
+                if any(item[1] is not None for item in ref_data):
+                    # Show ID and display values
                     ref_values = [f"{item[0]} - {item[1]}" for item in ref_data]
                     ref_dict = {f"{item[0]} - {item[1]}": item[0] for item in ref_data}
                 else:
-                    # Just fetch IDs
-                    ref_values = [str(item) for item in db.get_foreign_key_options(referenced_table, col)]
+                    # Just show IDs
+                    ref_values = [str(item[0]) for item in ref_data]
                     ref_dict = {item: item for item in ref_values}
                 
                 var = tk.StringVar(value=data[idx] if data else "")
@@ -135,7 +235,8 @@ def create_edit_form(parent, table, columns, tree, data=None):
                 data_dict[col] = var.get()
         
         # Validate data
-        is_valid, error_message = db.validate_data(table, data_dict)
+        # An edited row may keep its own key and unique values
+        is_valid, error_message = db.validate_data(table, data_dict, original_key=data[0] if data else None)
         
         if not is_valid:
             messagebox.showerror("Validation Error", error_message)
@@ -177,13 +278,73 @@ def create_edit_form(parent, table, columns, tree, data=None):
     
     return form
 
-def refresh_tree(tree, table):
+# Rows per treeview page
+PAGE_SIZE = 100
+
+def fetch_tree_page(tree, table, direction=None):
+    """Fetch a keyset page for a treeview and remember its position
+    
+    Args:
+        tree: The treeview the page is for
+        table: Database table name
+        direction: None reloads the current page, "first", "next" or "prev"
+            move to another page
+    """
+    if direction not in (None, "first", "next", "prev"):
+        raise ValueError(f"Unknown page direction: {direction}")
+    
+    page_info = getattr(tree, "page_info", None)
+    
+    # Stay on the current page when there is nothing further to move to
+    if page_info and direction == "next" and not page_info["has_next"]:
+        direction = None
+    if page_info and direction == "prev" and not page_info["has_prev"]:
+        direction = None
+    
+    rows, info = [], None
+    if direction != "first" and page_info and page_info["last_key"] is not None:
+        if direction == "next":
+            rows, info = db.fetch_page(table, page_info["last_key"], "next", PAGE_SIZE)
+        elif direction == "prev":
+            rows, info = db.fetch_page(table, page_info["first_key"], "prev", PAGE_SIZE)
+        elif direction is None:
+            rows, info = db.fetch_page(table, page_info["first_key"], "at", PAGE_SIZE)
+    
+    # First page, or the current page no longer has any rows
+    if not rows:
+        rows, info = db.fetch_page(table, page_size=PAGE_SIZE)
+    
+    info["total"] = db.get_row_count(table)
+    tree.page_info = info
+    return rows
+
+def update_page_label(tree):
+    """Show the page position under a treeview, if it has a pager"""
+    page_var = getattr(tree, "page_var", None)
+    page_info = getattr(tree, "page_info", None)
+    if page_var is None or page_info is None:
+        return
+    
+    shown = len(tree.get_children())
+    page_var.set(f"Showing {shown} of {page_info['total']} records")
+
+def update_search_label(tree, rows):
+    """Show the match count of search results shown in a treeview"""
+    # Search results are not a keyset page; Clear starts from the first page
+    tree.page_info = None
+    # Searches are capped by the query budget; say when rows were left out
+    page_var = getattr(tree, "page_var", None)
+    if page_var is not None:
+        page_var.set(f"{len(rows)} matches{query_budget.truncation_note(rows)}")
+
+def refresh_tree(tree, table, direction=None):
     """Update treeview with latest data"""
     try:
-        rows, _ = db.fetch_data_paginated(table)
+        rows = fetch_tree_page(tree, table, direction)
         tree.delete(*tree.get_children())
         for row in rows:
             tree.insert("", tk.END, values=row)
+        update_page_label(tree)
     except Exception as e:
         handle_db_error("refresh data", e)
 
@@ -298,6 +459,26 @@ def setup_tree_for_table(parent, table):
             [e.delete(0, tk.END), refresh_tree(t, tbl)]
     ).pack(side="left", padx=5)
     
+    # Pager for moving between keyset pages
+    pager_frame = ttk.Frame(parent)
+    pager_frame.pack(fill="x", padx=10)
+    
+    tree.page_var = tk.StringVar(value="")
+    
+    ttk.Button(
+        pager_frame, 
+        text="< Prev",
+        command=lambda t=tree, tbl=table: refresh_tree(t, tbl, "prev")
+    ).pack(side="left")
+    
+    ttk.Button(
+        pager_frame, 
+        text="Next >",
+        command=lambda t=tree, tbl=table: refresh_tree(t, tbl, "next")
+    ).pack(side="left", padx=5)
+    
+    ttk.Label(pager_frame, textvariable=tree.page_var).pack(side="left", padx=5)
+    
     # Add action buttons
     action_frame = ttk.Frame(parent)
     action_frame.pack(pady=10)
@@ -342,6 +523,7 @@ def search_data(tree, table, column, value):
         tree.delete(*tree.get_children())
         for row in rows:
             tree.insert("", tk.END, values=row)
+        update_search_label(tree, rows)
     except Exception as e:
         handle_db_error("search", e)
 
@@ -0,0 +1,106 @@
+import re
+import logging
+
+logger = logging.getLogger("fulltext_search")
+
+# Free-text columns that get a FULLTEXT index with the ngram parser, so
+# substring-style searches on them no longer scan the table
+CANDIDATES = {
+    "Driver": ["Driver_Name"],
+    "Customer": ["Customer_Name"],
+    "Service_Provider": ["Provider_Name"],
+    "Address": ["Street", "City"],
+    "Maintenance": ["Description"],
+    "Vehicle_Load": ["Special_Instructions"],
+}
+
+# Terms shorter than the server's ngram_token_size (2 by default) produce
+# no tokens and are searched with LIKE instead
+MIN_TERM_LENGTH = 2
+
+IDENTIFIER_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+def index_name(table, column):
+    return f"ft_{table}_{column}".lower()[:64]
+
+def fulltext_columns(indexes):
+    """Columns with a FULLTEXT index of their own, from the catalog's
+    {index name: {"columns", "unique", "type"}} dict of a table"""
+    return {
+        index["columns"][0]
+        for index in indexes.values()
+        if str(index.get("type", "")).upper() == "FULLTEXT" and len(index["columns"]) == 1
+    }
+
+def phrase(term):
+    """Quote a term as a boolean-mode phrase; with the ngram parser a
+    phrase matches values containing the term, like LIKE '%term%'"""
+    return '"' + str(term).replace('"', " ").strip() + '"'
+
+def uses_fulltext(column, term, columns):
+    return column in columns and len(str(term).replace('"', " ").strip()) >= MIN_TERM_LENGTH
+
+def build_search(table, criteria, columns, key_columns, limit, offset=0):
+    """Build a SELECT for (column, term) criteria
+
+    Criteria on a column in columns use MATCH ... AGAINST and order the
+    rows by relevance; the others use LIKE. Returns (sql, params, ranked).
+    """
+    for name in [table] + [column for column, _ in criteria] + list(key_columns):
+        if not IDENTIFIER_RE.match(name):
+            raise ValueError(f"Invalid identifier: {name}")
+
+    where, params, scores, score_params = [], [], [], []
+    for column, term in criteria:
+        if uses_fulltext(column, term, columns):
+            match = f"MATCH({column}) AGAINST (%s IN BOOLEAN MODE)"
+            where.append(match)
+            params.append(phrase(term))
+            scores.append(match)
+            score_params.append(phrase(term))
+        else:
+            where.append(f"{column} LIKE %s")
+            params.append(f"%{term}%")
+
+    order = []
+    if scores:
+        order.append(f"{' + '.join(scores)} DESC")
+    order.extend(key_columns)
+    sql = f"SELECT * FROM {table} WHERE {' AND '.join(where)}"
+    if order:
+        sql += f" ORDER BY {', '.join(order)}"
+    sql += " LIMIT %s OFFSET %s"
+    return sql, params + score_params + [int(limit), int(offset)], bool(scores)
+
+def missing_indexes(schema, tables=None):
+    """(table, column) pairs of CANDIDATES that have no FULLTEXT index yet"""
+    missing = []
+    for table, columns in CANDIDATES.items():
+        if tables is not None and table not in tables:
+            continue
+        name = schema.table_name(table)
+        if name is None:
+            continue
+        existing = fulltext_columns(schema.indexes(name))
+        known = set(schema.column_names(name))
+        missing.extend((name, column) for column in columns
+                       if column in known and column not in existing)
+    return missing
+
+def create_indexes(conn, pairs):
+    """Add an ngram FULLTEXT index for each (table, column) on conn;
+    returns the names of the indexes created"""
+    created = []
+    cursor = conn.cursor()
+    try:
+        # With stopwords enabled the ngram parser drops every token that
+        # contains one, which would hide most short words from searches
+        cursor.execute("SET SESSION innodb_ft_enable_stopword = OFF")
+        for table, column in pairs:
+            name = index_name(table, column)
+            logger.info(f"Creating FULLTEXT index {name} on {table}({column})")
+            cursor.execute(f"ALTER TABLE {table} ADD FULLTEXT INDEX {name} ({column}) WITH PARSER ngram")
+            created.append(name)
+    finally:
+        cursor.close()
+    return created
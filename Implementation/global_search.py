@@ -0,0 +1,187 @@
+import os
+import re
+import time
+import logging
+import database_connection as db
+import query_budget
+import task_runner
+import tracing
+from trigram_index import fold
+
+logger = logging.getLogger("global_search")
+
+# Time allowed for one search of every table, and hits kept per table
+BUDGET_MS = int(os.getenv("GLOBAL_SEARCH_BUDGET_MS", "3000"))
+PER_TABLE = int(os.getenv("GLOBAL_SEARCH_PER_TABLE", "50"))
+
+def score(term, value):
+    """How well value matches term: 1.0 for the whole value, less for a
+    prefix, a word start or anywhere inside; shorter values rank higher"""
+    if value is None:
+        return 0.0
+    term, text = fold(term).strip(), fold(value)
+    if not term or not text:
+        return 0.0
+    if text == term:
+        return 1.0
+    if text.startswith(term):
+        base = 0.8
+    elif re.search(r"\b" + re.escape(term), text):
+        base = 0.6
+    elif term in text:
+        base = 0.4
+    else:
+        base = 0.2  # matched by FULLTEXT, e.g. across spaces
+    return base + 0.1 * len(term) / len(text)
+
+def rank(term, table, columns, rows, key_columns=()):
+    """Hits for rows of table, best first: dicts with table, key (the
+    primary key values), column, value, score and the full row"""
+    positions = [columns.index(column) for column in key_columns if column in columns] or [0]
+    hits = []
+    for row in rows:
+        best = (0.0, None, None)
+        for column, value in zip(columns, row):
+            if isinstance(value, str):
+                best = max(best, (score(term, value), column, value), key=lambda b: b[0])
+        hits.append({
+            "table": table,
+            "key": tuple(row[i] for i in positions) if row else None,
+            "column": best[1],
+            "value": best[2],
+            "score": round(best[0], 3),
+            "row": row,
+        })
+    hits.sort(key=lambda hit: hit["score"], reverse=True)
+    return hits
+
+class GlobalSearch:
+    """One search term fanned out to many tables at once
+
+    Each table is searched as its own interactive task on the shared
+    worker pool, so results arrive as each table responds: on_result is
+    called on the Tk thread with (table, hits, truncated). Tables that
+    have not answered after budget_ms are cancelled (their queries
+    killed) and reported to on_done with the tables that failed.
+    Starting a new search supersedes the tables still running for the
+    previous one.
+    """
+
+    def __init__(self, widget, tables, term, on_result, on_done, budget_ms=BUDGET_MS, per_table=PER_TABLE):
+        """
+        Args:
+            widget: Any Tk widget; used to schedule the deadline
+            tables: Table names to search
+            term: Text to look for in every text column
+            on_result: on_result(table, hits, truncated) for each table
+            on_done: on_done(summary) once every table answered or the
+                budget ran out; summary has searched, timed_out, failed
+                and seconds
+            budget_ms: Time allowed for the whole search
+            per_table: Hits kept per table
+        """
+        self.widget = widget
+        self.tables = list(tables)
+        self.term = term
+        self.on_result = on_result
+        self.on_done = on_done
+        self.budget_ms = budget_ms
+        self.per_table = per_table
+        self.tasks = {}
+        self.pending = set()
+        self.searched = []
+        self.failed = {}
+        self.finished = False
+        self.action = None
+        self.started = None
+        self.deadline = None
+
+    def start(self):
+        self.started = time.monotonic()
+        self.action = tracing.start_action("GlobalSearch", term=self.term, tables=len(self.tables))
+        # Queries stop on the server when the search's time is up
+        budget = query_budget.get("interactive").replace(timeout_ms=self.budget_ms, max_rows=self.per_table)
+        self.pending = set(self.tables)
+        for table in self.tables:
+            try:
+                self.tasks[table] = task_runner.submit(
+                    tracing.bind(self.action, self._search), table,
+                    priority=task_runner.INTERACTIVE, budget=budget,
+                    view=("global_search", table),
+                    on_success=lambda hits, t=table: self._answered(t, hits),
+                    on_error=lambda e, t=table: self._failed(t, e),
+                    on_cancel=lambda e, t=table: self._failed(t, e)
+                )
+            except task_runner.TaskQueueFull as e:
+                self._failed(table, e)
+        self.deadline = self.widget.after(self.budget_ms, self._expire)
+        self._check_done()
+        return self
+
+    def _search(self, table):
+        """Runs on a worker thread"""
+        rows = db.search_text_columns(table, self.term, self.per_table)
+        hits = rank(self.term, table, db.get_table_columns(table), rows, db.get_primary_key(table))
+        return hits, getattr(rows, "truncated", False)
+
+    def _answered(self, table, result):
+        if self.finished:
+            return
+        hits, truncated = result
+        self.searched.append(table)
+        self.pending.discard(table)
+        if hits:
+            self.on_result(table, hits, truncated)
+        self._check_done()
+
+    def _failed(self, table, error):
+        if self.finished:
+            return
+        self.pending.discard(table)
+        self.failed[table] = str(error)
+        logger.warning(f"Global search of {table} failed: {error}")
+        self._check_done()
+
+    def _check_done(self):
+        if not self.pending and not self.finished:
+            self._finish([])
+
+    def _expire(self):
+        """Budget used up: stop the tables that are still running"""
+        self.deadline = None
+        if self.finished:
+            return
+        timed_out = [table for table in self.tables if table in self.pending]
+        for table in timed_out:
+            if table in self.tasks:
+                self.tasks[table].cancel()
+        self._finish(timed_out)
+
+    def cancel(self):
+        """Stop the search without calling on_done, e.g. when its window
+        is closed"""
+        if not self.finished:
+            for table in self.pending:
+                if table in self.tasks:
+                    self.tasks[table].cancel()
+            self._finish(list(self.pending), notify=False)
+
+    def _finish(self, timed_out, notify=True):
+        self.finished = True
+        self.tasks = {}
+        self.pending = set()
+        if self.deadline is not None:
+            try:
+                self.widget.after_cancel(self.deadline)
+            except Exception:
+                pass
+            self.deadline = None
+        summary = {
+            "searched": len(self.searched),
+            "timed_out": timed_out,
+            "failed": {t: e for t, e in self.failed.items() if t not in timed_out},
+            "seconds": time.monotonic() - self.started,
+        }
+        tracing.finish_action(self.action, searched=summary["searched"], timed_out=len(timed_out))
+        if notify:
+            self.on_done(summary)
@@ -0,0 +1,493 @@
+import re
+import time
+import hashlib
+import logging
+from collections import namedtuple
+
+logger = logging.getLogger("index_advisor")
+
+MIGRATIONS_TABLE = "schema_migrations"
+
+# Columns that cannot be indexed without a prefix length
+UNINDEXABLE_TYPES = ("tinytext", "text", "mediumtext", "longtext", "tinyblob", "blob",
+                     "mediumblob", "longblob", "json", "geometry")
+
+# Rough planner assumptions behind the benefit estimates: the fraction of
+# rows left after an equality or range condition, the share of a query's
+# time saved by reading rows in index order instead of sorting them, and
+# the cost an extra index adds to every write of its table
+EQUALITY_SELECTIVITY = 0.05
+RANGE_SELECTIVITY = 0.3
+SORT_SAVING = 0.3
+WRITE_COST_MS = 0.05
+# Tables this small are read in about the time an index lookup takes
+SMALL_TABLE_ROWS = 1000
+# Covering indexes carry at most this many columns in total
+MAX_INDEX_COLUMNS = 5
+
+KEYWORDS = {
+    "where", "join", "inner", "left", "right", "outer", "cross", "natural", "straight_join",
+    "on", "using", "order", "group", "having", "limit", "set", "as", "for", "union", "values",
+    "select", "from", "and", "or", "not", "is", "null", "in", "like", "between", "asc", "desc",
+    "distinct", "case", "when", "then", "else", "end", "exists", "interval",
+}
+
+TABLE_RE = re.compile(r"\b(FROM|JOIN|UPDATE)\s+`?(\w+)`?(?:\s+(?:AS\s+)?`?(\w+)`?)?", re.IGNORECASE)
+CLAUSE_RE = re.compile(r"\b(WHERE|GROUP\s+BY|ORDER\s+BY|HAVING|LIMIT|FOR\s+UPDATE|UNION|SET)\b", re.IGNORECASE)
+JOIN_RE = re.compile(r"\bJOIN\s+`?(\w+)`?(?:\s+(?:AS\s+)?`?(\w+)`?)?\s+ON\b(.*?)"
+                     r"(?=\b(?:(?:INNER|LEFT|RIGHT|CROSS)\s+)?(?:OUTER\s+)?JOIN\b|\b(?:WHERE|GROUP\s+BY|ORDER\s+BY|HAVING|LIMIT)\b|$)",
+                     re.IGNORECASE | re.DOTALL)
+BETWEEN_RE = re.compile(r"\bBETWEEN\s+\?\s+AND\s+\?", re.IGNORECASE)
+COLUMN = r"`?(?:(\w+)`?\.`?)?(\w+)`?"
+CONDITIONS = [
+    (re.compile(rf"^{COLUMN}\s*(?:=|<=>)\s*\?$", re.IGNORECASE), "eq"),
+    (re.compile(rf"^\?\s*=\s*{COLUMN}$", re.IGNORECASE), "eq"),
+    (re.compile(rf"^{COLUMN}\s+IN\s*\(", re.IGNORECASE), "eq"),
+    (re.compile(rf"^{COLUMN}\s+IS\s+NULL$", re.IGNORECASE), "eq"),
+    (re.compile(rf"^{COLUMN}\s+IS\s+NOT\s+NULL$", re.IGNORECASE), "range"),
+    (re.compile(rf"^{COLUMN}\s+BETWEEN\b", re.IGNORECASE), "range"),
+    (re.compile(rf"^{COLUMN}\s*(?:<|>|<=|>=)\s*\?$", re.IGNORECASE), "range"),
+]
+JOIN_CONDITION_RE = re.compile(rf"^{COLUMN}\s*=\s*{COLUMN}$", re.IGNORECASE)
+ORDER_ITEM_RE = re.compile(rf"^{COLUMN}(?:\s+(ASC|DESC))?$", re.IGNORECASE)
+SELECT_COLUMN_RE = re.compile(r"`?(?:(\w+)`?\.`?)?([A-Za-z_]\w*)\b`?(?!\s*\()")
+WRITE_RE = re.compile(r"^\s*(?:INSERT(?:\s+IGNORE)?\s+INTO|REPLACE\s+INTO|UPDATE|DELETE\s+FROM)\s+`?(\w+)`?", re.IGNORECASE)
+
+def index_name(table, columns):
+    """idx_<table>_<columns>, shortened with a hash to MySQL's 64 characters"""
+    name = f"idx_{table}_{'_'.join(columns)}".lower()
+    if len(name) > 64:
+        digest = hashlib.sha1(name.encode()).hexdigest()[:8]
+        name = f"{name[:55]}_{digest}"
+    return name
+
+class IndexMigration:
+    """A secondary index managed as a versioned migration"""
+
+    def __init__(self, version, table, columns, description=""):
+        self.version = version
+        self.table = table
+        self.columns = list(columns)
+        self.description = description or f"Index {table}({', '.join(columns)})"
+        self.name = index_name(table, columns)
+
+    @property
+    def up(self):
+        # Online DDL: reads and writes continue while the index is built
+        return (f"ALTER TABLE {self.table} ADD INDEX {self.name} ({', '.join(self.columns)}), "
+                f"ALGORITHM=INPLACE, LOCK=NONE")
+
+    @property
+    def down(self):
+        return f"ALTER TABLE {self.table} DROP INDEX {self.name}"
+
+    def __repr__(self):
+        return f"IndexMigration({self.version!r}, {self.table!r}, {self.columns!r})"
+
+# Indexes for the filters and sorts the schema left without one
+SEED_MIGRATIONS = [
+    IndexMigration("0001_maintenance_next_service_date", "Maintenance", ["Next_Service_Date"],
+                   "Upcoming service lookups by next service date"),
+    IndexMigration("0002_driver_license_expiration_date", "Driver", ["License_Expiration_Date"],
+                   "Drivers whose licenses expire in a date range"),
+    IndexMigration("0003_vehicle_load_scheduled_departure", "Vehicle_Load", ["Scheduled_Departure"],
+                   "Loads departing in a time window"),
+    IndexMigration("0004_vehicle_load_status_departure", "Vehicle_Load", ["Delivery_Status_ID", "Scheduled_Departure"],
+                   "Loads in a delivery status, in departure order"),
+    IndexMigration("0005_assignment_current_driver", "Vehicle_Driver_Assignment", ["Is_Current", "Driver_ID", "Vehicle_ID"],
+                   "Current assignments joined to drivers and vehicles without reading the rows"),
+]
+
+# Columns one table contributes to a statement
+Usage = namedtuple("Usage", "table eq range order selected")
+
+class Proposal:
+    """A suggested index with its estimated benefit"""
+
+    def __init__(self, table, columns, kind):
+        self.table = table
+        self.columns = list(columns)
+        self.kind = kind  # single, composite or covering
+        self.benefit_ms = 0.0
+        self.write_cost_ms = 0.0
+        self.queries = 0
+        self.fingerprints = []
+
+    @property
+    def name(self):
+        return index_name(self.table, self.columns)
+
+    @property
+    def net_benefit_ms(self):
+        return self.benefit_ms - self.write_cost_ms
+
+    def migration(self):
+        """The proposal as a migration, versioned by the time it was accepted"""
+        return IndexMigration(f"{time.strftime('%Y%m%d%H%M%S')}_{self.name}", self.table, self.columns,
+                              f"Advisor: {self.kind} index for {self.queries} queries")
+
+    def as_dict(self):
+        return {
+            "table": self.table,
+            "columns": list(self.columns),
+            "kind": self.kind,
+            "name": self.name,
+            "benefit_ms": round(self.benefit_ms, 1),
+            "write_cost_ms": round(self.write_cost_ms, 1),
+            "net_benefit_ms": round(self.net_benefit_ms, 1),
+            "queries": self.queries,
+            "fingerprints": list(self.fingerprints),
+        }
+
+def _split(expr, word):
+    """Split expr at word (AND, OR or ,) outside parentheses"""
+    parts, depth, start = [], 0, 0
+    pattern = re.compile(r"\(|\)|" + (r"," if word == "," else rf"\b{word}\b"), re.IGNORECASE)
+    for match in pattern.finditer(expr):
+        token = match.group(0)
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth -= 1
+        elif depth == 0:
+            parts.append(expr[start:match.start()])
+            start = match.end()
+    parts.append(expr[start:])
+    return [part.strip() for part in parts if part.strip()]
+
+def _unwrap(expr):
+    """Drop parentheses around the whole of expr"""
+    expr = expr.strip()
+    while expr.startswith("(") and expr.endswith(")"):
+        depth = 0
+        for i, c in enumerate(expr):
+            depth += c == "("
+            depth -= c == ")"
+            if depth == 0 and i < len(expr) - 1:
+                return expr
+        expr = expr[1:-1].strip()
+    return expr
+
+def conjuncts(expr):
+    """Conditions that must all hold; groups joined by OR are left out"""
+    expr = _unwrap(expr)
+    if len(_split(expr, "OR")) > 1:
+        return []
+    result = []
+    for part in _split(expr, "AND"):
+        part = _unwrap(part)
+        if len(_split(part, "AND")) > 1:
+            result.extend(conjuncts(part))
+        else:
+            result.append(part)
+    return result
+
+def _clause(sql, name):
+    """Text of a clause up to the next clause keyword, outside parentheses"""
+    match = re.search(rf"\b{name}\b", sql, re.IGNORECASE)
+    if not match:
+        return ""
+    rest = sql[match.end():]
+    depth = 0
+    for i, c in enumerate(rest):
+        depth += c == "("
+        depth -= c == ")"
+        if depth == 0 and CLAUSE_RE.match(rest, i) and (i == 0 or not (rest[i - 1].isalnum() or rest[i - 1] == "_")):
+            return rest[:i]
+    return rest
+
+class Schema:
+    """Column names and types of the tables a statement touches"""
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+    def table(self, name):
+        return self.catalog.table_name(name)
+
+    def columns(self, table):
+        return {column["name"].lower(): column for column in self.catalog.columns(table)}
+
+    def indexable(self, table, column):
+        meta = self.columns(table).get(column.lower())
+        return meta is not None and meta.get("data_type") not in UNINDEXABLE_TYPES
+
+def analyze(fingerprint, schema):
+    """Usage of each table in a SELECT, UPDATE or DELETE fingerprint"""
+    sql = fingerprint.strip()
+    verb = sql.split(None, 1)[0].upper() if sql else ""
+    if verb not in ("SELECT", "UPDATE", "DELETE"):
+        return []
+
+    aliases, tables = {}, []
+    for _, name, alias in TABLE_RE.findall(sql):
+        table = schema.table(name)
+        if table is None:
+            continue
+        if table not in tables:
+            tables.append(table)
+        aliases[name.lower()] = table
+        if alias and alias.lower() not in KEYWORDS:
+            aliases[alias.lower()] = table
+    if not tables:
+        return []
+    columns = {table: schema.columns(table) for table in tables}
+
+    def resolve(qualifier, column):
+        if qualifier:
+            table = aliases.get(qualifier.lower())
+            owners = [table] if table and column.lower() in columns[table] else []
+        else:
+            owners = [table for table in tables if column.lower() in columns[table]]
+        if len(owners) != 1:
+            return None
+        return owners[0], columns[owners[0]][column.lower()]["name"]
+
+    usage = {table: Usage(table, [], [], [], set()) for table in tables}
+
+    def add(kind, qualifier, column):
+        resolved = resolve(qualifier, column)
+        if resolved and resolved[1] not in getattr(usage[resolved[0]], kind):
+            getattr(usage[resolved[0]], kind).append(resolved[1])
+
+    where = BETWEEN_RE.sub("BETWEEN ?", _clause(sql, "WHERE"))
+    for condition in conjuncts(where):
+        for pattern, kind in CONDITIONS:
+            match = pattern.match(condition)
+            if match:
+                add(kind, *match.groups()[:2])
+                break
+
+    # A joined table is looked up by its join column for every row read
+    # before it; the column on the other side is only read
+    for name, _, on in JOIN_RE.findall(sql):
+        joined = schema.table(name)
+        for condition in conjuncts(on):
+            match = JOIN_CONDITION_RE.match(condition)
+            if not match:
+                continue
+            for lookup, other in ((match.groups()[:2], match.groups()[2:]), (match.groups()[2:], match.groups()[:2])):
+                lookup, other = resolve(*lookup), resolve(*other)
+                if lookup and other and lookup[0] == joined != other[0]:
+                    if lookup[1] not in usage[joined].eq:
+                        usage[joined].eq.append(lookup[1])
+                    usage[other[0]].selected.add(other[1])
+
+    order = _clause(sql, r"ORDER\s+BY")
+    if order:
+        items = [ORDER_ITEM_RE.match(item) for item in _split(order, ",")]
+        resolved = [resolve(*item.groups()[:2]) if item else None for item in items]
+        directions = {(item.group(3) or "ASC").upper() for item in items if item}
+        # Only an ORDER BY on a single table in one direction can be read from an index
+        if all(resolved) and len({table for table, _ in resolved}) == 1 and len(directions) == 1:
+            usage[resolved[0][0]].order.extend(column for _, column in resolved)
+
+    if verb == "SELECT":
+        select = re.split(r"\bFROM\b", _clause(sql, "SELECT"), 1, flags=re.IGNORECASE)[0]
+        if "*" in select:
+            for table in tables:
+                usage[table].selected.add("*")
+        else:
+            for qualifier, column in SELECT_COLUMN_RE.findall(select):
+                if column.lower() not in KEYWORDS:
+                    resolved = resolve(qualifier, column)
+                    if resolved:
+                        usage[resolved[0]].selected.add(resolved[1])
+    else:
+        for table in tables:
+            usage[table].selected.add("*")
+    return [usage[table] for table in tables]
+
+def candidate(usage, schema):
+    """(columns, kind) of the index that best serves one table's usage,
+    or None"""
+    indexable = lambda column: schema.indexable(usage.table, column)
+    primary_key = {column.lower() for column in schema.catalog.primary_key(usage.table)}
+    if primary_key and primary_key <= {column.lower() for column in usage.eq}:
+        return None  # rows are found by primary key already
+    columns = [column for column in usage.eq if indexable(column)]
+    ranges = [column for column in usage.range if indexable(column) and column not in columns]
+    order = [column for column in usage.order if indexable(column)]
+    if ranges:
+        # Equality columns first, then one range: only the matching rows are read
+        columns += ranges[:1]
+    elif order and len(order) == len(usage.order):
+        # Equality columns first, then the sort: rows come out in order
+        columns += [column for column in order if column not in columns]
+    if not columns:
+        return None
+
+    kind = "single" if len(columns) == 1 else "composite"
+    if "*" not in usage.selected:
+        needed = set(usage.selected) | set(usage.range) | set(usage.order)
+        extra = sorted(column for column in needed
+                       if column not in columns and column.lower() not in primary_key)
+        if extra and all(indexable(column) for column in extra) and len(columns) + len(extra) <= MAX_INDEX_COLUMNS:
+            columns += extra
+            kind = "covering"
+    return columns, kind
+
+def estimate(usage, columns, entry, table_rows, table_count):
+    """Milliseconds the index would have saved the statements of entry"""
+    leading = columns[:len(usage.eq)]
+    selectivity = EQUALITY_SELECTIVITY ** len([c for c in leading if c in usage.eq])
+    if any(column in usage.range for column in columns):
+        selectivity *= RANGE_SELECTIVITY
+    saving = 1 - selectivity if selectivity < 1 else 0.0
+    if usage.order and all(column in columns for column in usage.order):
+        saving += (1 - saving) * SORT_SAVING
+    rows = table_rows.get(usage.table.lower())
+    if rows is not None and rows < SMALL_TABLE_ROWS:
+        saving *= rows / SMALL_TABLE_ROWS
+    # The statement's time is shared between the tables it reads
+    return entry["total_ms"] * saving / table_count
+
+def _covered(columns, indexes):
+    wanted = [column.lower() for column in columns]
+    return any(
+        [column.lower() for column in index["columns"]][:len(wanted)] == wanted
+        for index in indexes.values()
+    )
+
+def advise(statements, catalog, table_rows=None, top=20):
+    """Propose indexes for recorded statements
+
+    Args:
+        statements: Per-fingerprint stats from QueryRecorder.get_stats()
+        catalog: SchemaCatalog of the database
+        table_rows: {table name (lower case): estimated rows}
+        top: Proposals to return, best first
+
+    Returns Proposals not already served by an existing index, ordered by
+    estimated net benefit (time saved on reads minus cost on writes).
+    """
+    schema = Schema(catalog)
+    table_rows = table_rows or {}
+    proposals = {}
+    writes = {}
+    for entry in statements:
+        fingerprint = entry["fingerprint"]
+        match = WRITE_RE.match(fingerprint)
+        if match and schema.table(match.group(1)):
+            table = schema.table(match.group(1)).lower()
+            writes[table] = writes.get(table, 0) + entry["count"]
+        try:
+            usages = analyze(fingerprint, schema)
+        except Exception as e:
+            logger.debug(f"Could not analyze {fingerprint[:100]}: {e}")
+            continue
+        for usage in usages:
+            found = candidate(usage, schema)
+            if found is None:
+                continue
+            columns, kind = found
+            benefit = estimate(usage, columns, entry, table_rows, len(usages))
+            if benefit <= 0:
+                continue
+            key = (usage.table, tuple(columns))
+            proposal = proposals.get(key)
+            if proposal is None:
+                proposal = proposals[key] = Proposal(usage.table, columns, kind)
+            proposal.benefit_ms += benefit
+            proposal.queries += entry["count"]
+            proposal.fingerprints.append(fingerprint)
+
+    # An index also serves every query that needs a prefix of its columns
+    merged = []
+    for proposal in sorted(proposals.values(), key=lambda p: len(p.columns), reverse=True):
+        wider = next((p for p in merged if p.table == proposal.table
+                      and [c.lower() for c in p.columns[:len(proposal.columns)]] == [c.lower() for c in proposal.columns]), None)
+        if wider is None:
+            merged.append(proposal)
+        else:
+            wider.benefit_ms += proposal.benefit_ms
+            wider.queries += proposal.queries
+            wider.fingerprints.extend(proposal.fingerprints)
+
+    result = []
+    for proposal in merged:
+        if _covered(proposal.columns, catalog.indexes(proposal.table)):
+            continue
+        proposal.write_cost_ms = writes.get(proposal.table.lower(), 0) * WRITE_COST_MS
+        if proposal.net_benefit_ms > 0:
+            result.append(proposal)
+    result.sort(key=lambda p: p.net_benefit_ms, reverse=True)
+    return result[:top] if top else result
+
+def ensure_migrations_table(cursor):
+    cursor.execute(
+        f"CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} ("
+        "Version VARCHAR(100) PRIMARY KEY, "
+        "Description VARCHAR(255), "
+        "Up_Statement TEXT NOT NULL, "
+        "Down_Statement TEXT NOT NULL, "
+        "Applied_At TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+    )
+
+def applied_migrations(conn):
+    """Rows of schema_migrations as dicts, oldest version first"""
+    cursor = conn.cursor()
+    try:
+        ensure_migrations_table(cursor)
+        cursor.execute(f"SELECT Version, Description, Up_Statement, Down_Statement, Applied_At "
+                       f"FROM {MIGRATIONS_TABLE} ORDER BY Version")
+        return [
+            {"version": row[0], "description": row[1], "up": row[2], "down": row[3], "applied_at": row[4]}
+            for row in cursor.fetchall()
+        ]
+    finally:
+        cursor.close()
+
+def apply_migrations(conn, migrations, catalog):
+    """Apply the migrations not recorded in schema_migrations yet, in
+    version order
+
+    A migration whose index already exists is only recorded; one whose
+    table or columns are missing is skipped. Returns (applied, skipped)
+    lists of versions.
+    """
+    done = {row["version"] for row in applied_migrations(conn)}
+    applied, skipped = [], []
+    cursor = conn.cursor()
+    try:
+        for migration in sorted(migrations, key=lambda m: m.version):
+            if migration.version in done:
+                continue
+            table = catalog.table_name(migration.table)
+            known = {column.lower() for column in catalog.column_names(table)} if table else set()
+            if not table or any(column.lower() not in known for column in migration.columns):
+                logger.warning(f"Skipping migration {migration.version}: "
+                               f"{migration.table}({', '.join(migration.columns)}) not found")
+                skipped.append(migration.version)
+                continue
+            if migration.name in {name.lower() for name in catalog.indexes(table)}:
+                logger.info(f"Index {migration.name} already exists; recording {migration.version}")
+            else:
+                logger.info(f"Applying migration {migration.version}: {migration.up}")
+                cursor.execute(migration.up)
+            cursor.execute(
+                f"INSERT INTO {MIGRATIONS_TABLE} (Version, Description, Up_Statement, Down_Statement) "
+                "VALUES (%s, %s, %s, %s)",
+                (migration.version, migration.description[:255], migration.up, migration.down)
+            )
+            conn.commit()
+            applied.append(migration.version)
+    finally:
+        cursor.close()
+    return applied, skipped
+
+def revert_migration(conn, version):
+    """Drop the index of an applied migration and forget the migration;
+    returns False if it was not applied"""
+    row = next((row for row in applied_migrations(conn) if row["version"] == version), None)
+    if row is None:
+        return False
+    cursor = conn.cursor()
+    try:
+        logger.info(f"Reverting migration {version}: {row['down']}")
+        cursor.execute(row["down"])
+        cursor.execute(f"DELETE FROM {MIGRATIONS_TABLE} WHERE Version = %s", (version,))
+        conn.commit()
+    finally:
+        cursor.close()
+    return True
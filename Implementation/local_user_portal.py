@@ -3,8 +3,11 @@ import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 import logging
 from dotenv import load_dotenv
-import mysql.connector
-import threading
+import database_connection as db
+import tracing
+import query_budget
+import task_runner
+import search_predicates
 import csv
 from datetime import datetime
 
@@ -22,72 +25,43 @@ logger = logging.getLogger("local_portal")
 # load files variables from .env
 load_dotenv()
 
-# Access the environment variables
-db_host = os.getenv("MYSQL_HOST")
-db_port = os.getenv("MYSQL_PORT")
-db_name = os.getenv("MYSQL_DATABASE")
-db_user = os.getenv("MYSQL_USER")
-db_password = os.getenv("MYSQL_PASSWORD")
-
 def connect_db():
-    """Create a database connection"""
-    return mysql.connector.connect(
-        host=db_host,
-        port=db_port,
-        user=db_user,
-        password=db_password,
-        database=db_name
-    )
+    """Borrow a connection from the shared pool; close() returns it"""
+    return db.get_connection()
 
 def fetch_data(tree, table):
     """Fetch data from a table and populate treeview"""
     try:
-        conn = connect_db()
-        cursor = conn.cursor()
-        
-        # Get columns
-        cursor.execute(f"SHOW COLUMNS FROM {table}")
-        cols = [col[0] for col in cursor.fetchall()]
+        # Get columns from the shared schema catalog
+        cols = db.get_table_columns(table)
         
         if tree:
             # Get data
-            cursor.execute(f"SELECT * FROM {table}")
-            rows = cursor.fetchall()
-            
-            # Clear existing data
-            tree.delete(*tree.get_children())
-            
-            # Add new data
-            for row in rows:
-                tree.insert("", tk.END, values=row)
+            rows = db.fetch_all_data(table)
+            populate_tree(tree, rows)
                 
-        conn.close()
         return cols
     except Exception as e:
         logger.error(f"Database error in fetch_data: {e}")
         messagebox.showerror("Database Error", str(e))
         return []
 
-def search_data(tree, table, column, value):
-    """Search for specific data in a table"""
-    try:
-        conn = connect_db()
-        cursor = conn.cursor()
-        
-        # Execute search query
-        query = f"SELECT * FROM {table} WHERE {column} LIKE %s"
-        cursor.execute(query, (f"%{value}%",))
-        
-        rows = cursor.fetchall()
-        
+def populate_tree(tree, rows):
+    """Replace the rows of a treeview; call on the Tk thread only"""
+    with tracing.span("tree.populate", rows=len(rows)):
         # Clear existing data
         tree.delete(*tree.get_children())
         
-        # Add search results
+        # Add new data
         for row in rows:
             tree.insert("", tk.END, values=row)
-            
-        conn.close()
+
+def search_data(tree, table, column, value):
+    """Search for specific data in a table"""
+    try:
+        # Execute search query
+        rows = db.search_data(table, column, value)
+        populate_tree(tree, rows)
         
         # Return number of results
         return len(rows)
@@ -99,30 +73,12 @@ def search_data(tree, table, column, value):
 def advanced_search(table, criteria):
     """Perform advanced search with multiple criteria"""
     try:
-        conn = connect_db()
-        cursor = conn.cursor()
-        
-        # Build WHERE clause
-        where_clauses = []
-        params = []
-        
-        for column, value in criteria:
-            if value:  # Only include non-empty criteria
-                where_clauses.append(f"{column} LIKE %s")
-                params.append(f"%{value}%")
-        
         # If no criteria, return all records
-        if not where_clauses:
-            cursor.execute(f"SELECT * FROM {table}")
+        if not any(value for _, value in criteria):
+            rows = db.fetch_all_data(table)
         else:
-            # Join all WHERE clauses with AND
-            where_sql = " AND ".join(where_clauses)
-            query = f"SELECT * FROM {table} WHERE {where_sql}"
-            cursor.execute(query, params)
-        
-        # Get results
-        rows = cursor.fetchall()
-        conn.close()
+            # Same typed search as the admin portal; rows carry the total matched
+            rows, _ = db.advanced_search_data(table, criteria)
         
         return rows
     except Exception as e:
@@ -153,9 +109,6 @@ def export_to_csv(tree, filename):
 def get_vehicle_status():
     """Get vehicle status information for reporting"""
     try:
-        conn = connect_db()
-        cursor = conn.cursor()
-        
         query = """
         SELECT v.Vehicle_ID, v.Registration_Number, v.Make, v.Model, 
                vst.Status_Name, v.Last_Service_Date, v.Next_Service_Date,
@@ -166,9 +119,7 @@ def get_vehicle_status():
         ORDER BY v.Status_Type_ID, v.Make, v.Model
         """
         
-        cursor.execute(query)
-        results = cursor.fetchall()
-        conn.close()
+        results = db.execute_query(query)
         
         return results
     except Exception as e:
@@ -178,9 +129,6 @@ def get_vehicle_status():
 def get_driver_assignments():
     """Get driver vehicle assignment information"""
     try:
-        conn = connect_db()
-        cursor = conn.cursor()
-        
         query = """
         SELECT d.Driver_ID, d.First_Name, d.Last_Name, v.Vehicle_ID, 
                v.Make, v.Model, v.Registration_Number, vda.Assignment_Date 
@@ -190,9 +138,7 @@ def get_driver_assignments():
         ORDER BY d.Last_Name, d.First_Name
         """
         
-        cursor.execute(query)
-        results = cursor.fetchall()
-        conn.close()
+        results = db.execute_query(query)
         
         return results
     except Exception as e:
@@ -202,9 +148,6 @@ def get_driver_assignments():
 def get_upcoming_maintenance():
     """Get upcoming maintenance information"""
     try:
-        conn = connect_db()
-        cursor = conn.cursor()
-        
         # Get current date
         today = datetime.now().strftime('%Y-%m-%d')
         
@@ -222,9 +165,7 @@ def get_upcoming_maintenance():
         ORDER BY m.Scheduled_Date
         """
         
-        cursor.execute(query)
-        results = cursor.fetchall()
-        conn.close()
+        results = db.execute_query(query)
         
         return results
     except Exception as e:
@@ -240,6 +181,13 @@ class LocalUserPortal:
       
         # Dictionary to store treeviews
         self.treeviews = {}        
+        
+        # Widget updates from background tasks are applied on this thread
+        task_runner.ui.attach(self.root)
+        
+        # Tab loads and searches share one view: a newer request cancels the
+        # one still running, e.g. when switching tabs or searching again
+        self.view = (type(self).__name__, id(self))
      
         # Create menu
         self.create_menu()
@@ -256,6 +204,7 @@ class LocalUserPortal:
         # File menu
         file_menu = tk.Menu(menubar, tearoff=0)
         file_menu.add_command(label="Export Current View", command=self.export_current_view)
+        file_menu.add_command(label="Export Traces...", command=self.export_traces)
         file_menu.add_separator()
         file_menu.add_command(label="Exit", command=self.root.quit)
         menubar.add_cascade(label="File", menu=file_menu)
@@ -412,22 +361,32 @@ class LocalUserPortal:
         """Refresh data in a table"""
         # Update status
         tree.status_var.set(f"Loading data from {table}...")
-        
-        # Function to run in background thread
-        def background_load():
-            try:
-                # Fetch data
-                columns = fetch_data(tree, table)
-                
-                # Update status in main thread
-                self.root.after(0, lambda: tree.status_var.set(f"Ready - {len(tree.get_children())} records"))
-            except Exception as e:
-                logger.error(f"Error refreshing {table}: {e}")
-                # Update status in main thread
-                self.root.after(0, lambda: tree.status_var.set(f"Error: {str(e)[:50]}..."))
-        
-        # Start background thread
-        threading.Thread(target=background_load, daemon=True).start()
+        action = tracing.start_action("LocalUserPortal.refresh_table", table=table)
+        
+        # Function to show the rows in main thread
+        def loaded(rows):
+            with tracing.activate(action):
+                populate_tree(tree, rows)
+            tree.status_var.set(f"Ready - {len(rows)} records{query_budget.truncation_note(rows)}")
+            tracing.finish_action(action, tree, rows=len(rows))
+        
+        # Function to report errors in main thread
+        def failed(e):
+            logger.error(f"Error refreshing {table}: {e}")
+            tree.status_var.set(f"Error: {str(e)[:50]}...")
+            tracing.finish_action(action, error=e)
+        
+        # Function to close the trace of a request replaced by a newer one
+        def cancelled(e):
+            tracing.finish_action(action, error=e)
+        
+        # Fetch data on the shared worker pool
+        task_runner.submit(
+            tracing.bind(action, db.fetch_all_data), table,
+            priority=task_runner.INTERACTIVE, key=("refresh", table),
+            on_success=loaded, on_error=failed,
+            view=self.view, on_cancel=cancelled
+        )
     
     def do_search(self, tree, table, column, value):
         """Perform search"""
@@ -437,22 +396,32 @@ class LocalUserPortal:
         
         # Update status
         tree.status_var.set(f"Searching for {value} in {column}...")
-        
-        # Function to run in background thread
-        def background_search():
-            try:
-                # Perform search
-                result_count = search_data(tree, table, column, value)
-                
-                # Update status in main thread
-                self.root.after(0, lambda: tree.status_var.set(f"Search complete - {result_count} matches"))
-            except Exception as e:
-                logger.error(f"Error searching {table}: {e}")
-                # Update status in main thread
-                self.root.after(0, lambda: tree.status_var.set(f"Search error: {str(e)[:50]}..."))
-        
-        # Start background thread
-        threading.Thread(target=background_search, daemon=True).start()
+        action = tracing.start_action("LocalUserPortal.do_search", table=table, column=column)
+        
+        # Function to show the matches in main thread
+        def searched(rows):
+            with tracing.activate(action):
+                populate_tree(tree, rows)
+            tree.status_var.set(f"Search complete - {len(rows)} matches{query_budget.truncation_note(rows)}")
+            tracing.finish_action(action, tree, rows=len(rows))
+        
+        # Function to report errors in main thread
+        def failed(e):
+            logger.error(f"Error searching {table}: {e}")
+            tree.status_var.set(f"Search error: {str(e)[:50]}...")
+            tracing.finish_action(action, error=e)
+        
+        # Function to close the trace of a request replaced by a newer one
+        def cancelled(e):
+            tracing.finish_action(action, error=e)
+        
+        # Perform search on the shared worker pool
+        task_runner.submit(
+            tracing.bind(action, db.search_data), table, column, value,
+            priority=task_runner.INTERACTIVE, key=("search", table, column, value),
+            on_success=searched, on_error=failed,
+            view=self.view, on_cancel=cancelled
+        )
     
     def export_current_view(self):
         """Export current tab's data to CSV"""
@@ -462,6 +431,23 @@ class LocalUserPortal:
         
         self.export_table(tree, table)
     
+    def export_traces(self):
+        """Export recent action traces to a JSON file"""
+        filename = filedialog.asksaveasfilename(
+            defaultextension=".json",
+            filetypes=[("JSON files", "*.json"), ("All files", "*.*")],
+            initialfile="traces.json"
+        )
+        if not filename:
+            return
+        
+        try:
+            tracing.export_json(filename)
+            messagebox.showinfo("Export Traces", f"Traces exported to {filename}")
+        except Exception as e:
+            logger.error(f"Error exporting traces: {e}")
+            messagebox.showerror("Export Error", str(e))
+    
     def export_table(self, tree, table):
         """Export a table to CSV"""
         # Ask for filename
@@ -544,6 +530,10 @@ class LocalUserPortal:
             
             criteria_entries.append((col, var))
         
+        # How search values are read
+        ttk.Label(search_window, text=search_predicates.SYNTAX_HELP, wraplength=560,
+                  foreground="gray").pack(fill="x", padx=10)
+        
         # Results frame
         results_frame = ttk.LabelFrame(search_window, text="Results")
         results_frame.pack(fill="both", expand=True, padx=10, pady=10)
@@ -593,34 +583,29 @@ class LocalUserPortal:
             
             status_var.set("Searching...")
             
-            # Function to run in background thread
-            def background_search():
-                try:
-                    # Perform search
-                    results = advanced_search(table, criteria)
-                    
-                    # Update UI in main thread
-                    def update_results():
-                        # Clear existing results
-                        results_tree.delete(*results_tree.get_children())
-                        
-                        # Add results
-                        for row in results:
-                            results_tree.insert("", tk.END, values=row)
-                        
-                        # Update status
-                        status_var.set(f"Search complete - {len(results)} matches")
-                    
-                    self.root.after(0, update_results)
-                    
-                except Exception as e:
-                    logger.error(f"Advanced search error: {e}")
-                    # Update status in main thread
-                    self.root.after(0, lambda: status_var.set(f"Search error: {str(e)[:50]}..."))
-                    self.root.after(0, lambda: messagebox.showerror("Search Error", str(e)))
+            # Function to update UI in main thread
+            def update_results(results):
+                populate_tree(results_tree, results)
+                
+                # Update status
+                status_var.set(f"Search complete - {len(results)} matches{query_budget.truncation_note(results)}")
             
-            # Start background thread
-            threading.Thread(target=background_search, daemon=True).start()
+            # Function to report errors in main thread
+            def failed(e):
+                if isinstance(e, search_predicates.PredicateError):
+                    status_var.set("Check the search values")
+                    messagebox.showwarning("Search", str(e), parent=search_window)
+                    return
+                logger.error(f"Advanced search error: {e}")
+                status_var.set(f"Search error: {str(e)[:50]}...")
+                messagebox.showerror("Search Error", str(e))
+            
+            # Perform search on the shared worker pool
+            task_runner.submit(
+                advanced_search, table, criteria,
+                priority=task_runner.INTERACTIVE, view=str(search_window),
+                on_success=update_results, on_error=failed
+            )
         
         # Export function
         def export_results():
@@ -656,25 +641,27 @@ class LocalUserPortal:
         current_table = list(self.tables.keys())[current_tab]
         current_tree = self.treeviews[current_table]
         current_tree.status_var.set("Generating vehicle status report...")
-        
-        # Function to run in background thread
-        def background_report():
-            try:
-                # Get vehicle status data
-                results = get_vehicle_status()
-                
-                # Show report in main thread
-                self.root.after(0, lambda: self.display_vehicle_status(results))
-                self.root.after(0, lambda: current_tree.status_var.set("Ready"))
-                
-            except Exception as e:
-                logger.error(f"Vehicle status report error: {e}")
-                # Update status in main thread
-                self.root.after(0, lambda: current_tree.status_var.set("Ready"))
-                self.root.after(0, lambda: messagebox.showerror("Report Error", str(e)))
-        
-        # Start background thread
-        threading.Thread(target=background_report, daemon=True).start()
+        action = tracing.start_action("LocalUserPortal.show_vehicle_status")
+        
+        # Function to show the report in main thread
+        def show_report(results):
+            with tracing.activate(action), tracing.span("tree.populate", rows=len(results or [])):
+                self.display_vehicle_status(results)
+            current_tree.status_var.set("Ready")
+            tracing.finish_action(action, self.root, rows=len(results or []))
+        
+        # Function to report errors in main thread
+        def failed(e):
+            logger.error(f"Vehicle status report error: {e}")
+            current_tree.status_var.set("Ready")
+            messagebox.showerror("Report Error", str(e))
+            tracing.finish_action(action, error=e)
+        
+        # Get vehicle status data on the shared worker pool
+        task_runner.submit(
+            tracing.bind(action, get_vehicle_status), key="vehicle_status_report",
+            on_success=show_report, on_error=failed
+        )
     
     def display_vehicle_status(self, results):
         """Display vehicle status report"""
@@ -857,24 +844,22 @@ class LocalUserPortal:
         current_tree = self.treeviews[current_table]
         current_tree.status_var.set("Generating driver assignments report...")
         
-        # Function to run in background thread
-        def background_report():
-            try:
-                # Get driver assignment data
-                results = get_driver_assignments()
-                
-                # Show report in main thread
-                self.root.after(0, lambda: self.display_driver_assignments(results))
-                self.root.after(0, lambda: current_tree.status_var.set("Ready"))
-                
-            except Exception as e:
-                logger.error(f"Driver assignments report error: {e}")
-                # Update status in main thread
-                self.root.after(0, lambda: current_tree.status_var.set("Ready"))
-                self.root.after(0, lambda: messagebox.showerror("Report Error", str(e)))
-        
-        # Start background thread
-        threading.Thread(target=background_report, daemon=True).start()
+        # Function to show report in main thread
+        def show_report(results):
+            self.display_driver_assignments(results)
+            current_tree.status_var.set("Ready")
+        
+        # Function to report errors in main thread
+        def failed(e):
+            logger.error(f"Driver assignments report error: {e}")
+            current_tree.status_var.set("Ready")
+            messagebox.showerror("Report Error", str(e))
+        
+        # Get driver assignment data on the shared worker pool
+        task_runner.submit(
+            get_driver_assignments, key="driver_assignments_report",
+            on_success=show_report, on_error=failed
+        )
     
     def display_driver_assignments(self, results):
         """Display driver assignments report"""
@@ -968,24 +953,22 @@ class LocalUserPortal:
         current_tree = self.treeviews[current_table]
         current_tree.status_var.set("Generating upcoming maintenance report...")
         
-        # Function to run in background thread
-        def background_report():
-            try:
-                # Get upcoming maintenance data
-                results = get_upcoming_maintenance()
-                
-                # Show report in main thread
-                self.root.after(0, lambda: self.display_upcoming_maintenance(results))
-                self.root.after(0, lambda: current_tree.status_var.set("Ready"))
-                
-            except Exception as e:
-                logger.error(f"Upcoming maintenance report error: {e}")
-                # Update status in main thread
-                self.root.after(0, lambda: current_tree.status_var.set("Ready"))
-                self.root.after(0, lambda: messagebox.showerror("Report Error", str(e)))
-        
-        # Start background thread
-        threading.Thread(target=background_report, daemon=True).start()
+        # Function to show report in main thread
+        def show_report(results):
+            self.display_upcoming_maintenance(results)
+            current_tree.status_var.set("Ready")
+        
+        # Function to report errors in main thread
+        def failed(e):
+            logger.error(f"Upcoming maintenance report error: {e}")
+            current_tree.status_var.set("Ready")
+            messagebox.showerror("Report Error", str(e))
+        
+        # Get upcoming maintenance data on the shared worker pool
+        task_runner.submit(
+            get_upcoming_maintenance, key="upcoming_maintenance_report",
+            on_success=show_report, on_error=failed
+        )
     
     def display_upcoming_maintenance(self, results):
         """Display upcoming maintenance report"""
@@ -6,6 +6,7 @@ from tkinter import ttk, messagebox, filedialog
 import logging
 from dotenv import load_dotenv
 import database_connection as db
+import query_budget
 import form_utils
 from datetime import datetime
 
@@ -229,6 +230,11 @@ class MaintenanceManagement:
                 for row in rows:
                     results_tree.insert("", "end", values=row)
                 
+                # Say so when the matches were cut at the row limit
+                if getattr(rows, "truncated", False):
+                    messagebox.showinfo("Search", f"{len(rows)} matches shown{query_budget.truncation_note(rows)}",
+                                        parent=search_window)
+                
             except Exception as e:
                 logger.error(f"Search error: {e}")
                 messagebox.showerror("Search Error", str(e))
@@ -261,23 +267,10 @@ class MaintenanceManagement:
         # Vehicle selection
         ttk.Label(main_frame, text="Vehicle:").grid(row=0, column=0, sticky="w", pady=5)
         
-        # Get vehicles
-        try:
-            vehicle_query = """
-            SELECT v.Vehicle_ID, CONCAT(v.Vehicle_ID, ' - ', v.Make, ' ', v.Model, ' (', v.Registration_Number, ')') 
-            FROM Vehicle v
-            ORDER BY v.Vehicle_ID
-            """
-            vehicles = db.execute_query(vehicle_query)
-            vehicle_list = [v[1] for v in vehicles]
-            vehicle_ids = {v[1]: v[0] for v in vehicles}
-        except Exception as e:
-            logger.error(f"Error loading vehicles: {e}")
-            vehicle_list = []
-            vehicle_ids = {}
-        
-        vehicle_var = tk.StringVar()
-        vehicle_combo = ttk.Combobox(main_frame, textvariable=vehicle_var, values=vehicle_list, state="readonly", width=40)
+        # Vehicles are searched as the user types instead of loading them all
+        vehicle_combo = form_utils.ForeignKeyPicker(
+            main_frame, "Vehicle", "Vehicle_ID", db.get_display_column("Vehicle"), width=40
+        )
         vehicle_combo.grid(row=0, column=1, sticky="ew", pady=5)
         
         # Maintenance type
@@ -382,7 +375,7 @@ class MaintenanceManagement:
         def save_maintenance():
             # Get values
             try:
-                vehicle_id = vehicle_ids.get(vehicle_var.get())
+                vehicle_id = vehicle_combo.get_id()
                 type_id = type_ids.get(type_var.get())
                 provider_id = provider_ids.get(provider_var.get())
                 
@@ -0,0 +1,157 @@
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger("metrics")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _value(value):
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+class MetricWriter:
+    """Builds a Prometheus text-format page; each metric gets its HELP and
+    TYPE lines the first time it is written"""
+
+    def __init__(self, prefix="fleet_"):
+        self.prefix = prefix
+        self.lines = []
+        self.declared = set()
+
+    def _declare(self, name, kind, help_text):
+        if name not in self.declared:
+            self.declared.add(name)
+            self.lines.append(f"# HELP {name} {help_text}")
+            self.lines.append(f"# TYPE {name} {kind}")
+
+    def sample(self, name, kind, help_text, value, labels=None):
+        name = self.prefix + name
+        self._declare(name, kind, help_text)
+        self.lines.append(f"{name}{_labels(labels)} {_value(value)}")
+
+    def gauge(self, name, help_text, value, labels=None):
+        self.sample(name, "gauge", help_text, value, labels)
+
+    def counter(self, name, help_text, value, labels=None):
+        self.sample(name, "counter", help_text, value, labels)
+
+    def histogram(self, name, help_text, bounds, counts, total, labels=None):
+        """Write a histogram from per-bucket (not cumulative) counts; the
+        last count is the overflow bucket"""
+        name = self.prefix + name
+        self._declare(name, "histogram", help_text)
+        labels = labels or {}
+        seen = 0
+        for bound, count in zip(bounds, counts):
+            seen += count
+            self.lines.append(f"{name}_bucket{_labels(dict(labels, le=f'{bound:g}'))} {seen}")
+        seen += sum(counts[len(bounds):])
+        self.lines.append(f"{name}_bucket{_labels(dict(labels, le='+Inf'))} {seen}")
+        self.lines.append(f"{name}_sum{_labels(labels)} {_value(float(total))}")
+        self.lines.append(f"{name}_count{_labels(labels)} {seen}")
+
+    def text(self):
+        return "\n".join(self.lines) + "\n"
+
+class MetricsRegistry:
+    """Collectors and gauges that make up the metrics page
+
+    Collectors are callables(writer) that write any number of metrics;
+    gauges are single values read from a callable on every scrape, e.g.
+    the depth of a task queue.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.collectors = []
+        self.gauges = {}
+
+    def register_collector(self, collector):
+        with self.lock:
+            self.collectors.append(collector)
+        return collector
+
+    def register_gauge(self, name, help_text, callback, labels=None):
+        """Expose callback() as a gauge; registering the same name and
+        labels again replaces the callback"""
+        with self.lock:
+            self.gauges[(name, tuple(sorted((labels or {}).items())))] = (help_text, callback)
+
+    def unregister_gauge(self, name, labels=None):
+        with self.lock:
+            self.gauges.pop((name, tuple(sorted((labels or {}).items()))), None)
+
+    def render(self):
+        """Return the current metrics in Prometheus text format"""
+        writer = MetricWriter()
+        with self.lock:
+            collectors = list(self.collectors)
+            gauges = sorted(self.gauges.items())
+        for collector in collectors:
+            try:
+                collector(writer)
+            except Exception as e:
+                logger.error(f"Error collecting metrics: {e}")
+        for (name, labels), (help_text, callback) in gauges:
+            try:
+                writer.gauge(name, help_text, callback(), dict(labels))
+            except Exception as e:
+                logger.error(f"Error reading gauge {name}: {e}")
+        return writer.text()
+
+registry = MetricsRegistry()
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+server = None
+server_lock = threading.Lock()
+
+def start_server(port, host="127.0.0.1"):
+    """Serve /metrics on host:port from a daemon thread; returns the server,
+    or None if the port is not available (e.g. another portal has it)"""
+    global server
+    with server_lock:
+        if server is not None:
+            return server
+        try:
+            server = ThreadingHTTPServer((host, port), MetricsHandler)
+        except OSError as e:
+            logger.warning(f"Metrics endpoint not started on {host}:{port}: {e}")
+            return None
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+        logger.info(f"Metrics endpoint listening on http://{host}:{server.server_port}/metrics")
+        return server
+
+def stop_server():
+    global server
+    with server_lock:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+            server = None
@@ -0,0 +1,167 @@
+import os
+import re
+import logging
+import threading
+import contextvars
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger("query_budget")
+
+# MySQL error raised when MAX_EXECUTION_TIME stops a SELECT
+ER_QUERY_TIMEOUT = 3024
+
+SELECT_RE = re.compile(r"^\s*SELECT\b", re.IGNORECASE)
+HINT_RE = re.compile(r"^\s*SELECT\s*/\*\+", re.IGNORECASE)
+LIMIT_RE = re.compile(r"\bLIMIT\b|\bFOR\s+UPDATE\b|\bINTO\b", re.IGNORECASE)
+
+class QueryTimeout(Exception):
+    """A statement ran longer than the time budget of its caller"""
+
+class Budget:
+    """Time limit and row cap for the statements of one kind of work"""
+
+    def __init__(self, name, timeout_ms=0, max_rows=0):
+        """
+        Args:
+            name: interactive, report or export
+            timeout_ms: Server-side execution limit of a SELECT; 0 for none
+            max_rows: Rows returned to a view before the result is
+                truncated; 0 for no cap
+        """
+        self.name = name
+        self.timeout_ms = max(0, int(timeout_ms))
+        self.max_rows = max(0, int(max_rows))
+
+    def replace(self, timeout_ms=None, max_rows=None):
+        return Budget(
+            self.name,
+            self.timeout_ms if timeout_ms is None else timeout_ms,
+            self.max_rows if max_rows is None else max_rows,
+        )
+
+    def __repr__(self):
+        return f"Budget({self.name!r}, timeout_ms={self.timeout_ms}, max_rows={self.max_rows})"
+
+class Rows(list):
+    """Rows of a capped query; truncated is True when more rows matched
+    than the budget allowed, total is the number that matched if known"""
+
+    def __init__(self, rows=(), truncated=False, limit=0, total=None):
+        super().__init__(rows)
+        self.truncated = truncated
+        self.limit = limit
+        self.total = total
+
+def _setting(name, default):
+    return int(os.getenv(name, str(default)) or 0)
+
+BUDGETS = {
+    "interactive": Budget("interactive",
+                          _setting("QUERY_TIMEOUT_INTERACTIVE_MS", 10000),
+                          _setting("MAX_ROWS_INTERACTIVE", 5000)),
+    "report": Budget("report",
+                     _setting("QUERY_TIMEOUT_REPORT_MS", 120000),
+                     _setting("MAX_ROWS_REPORT", 0)),
+    "export": Budget("export",
+                     _setting("QUERY_TIMEOUT_EXPORT_MS", 0),
+                     _setting("MAX_ROWS_EXPORT", 0)),
+}
+
+# Budget of the work running on this thread; set by the task runner from
+# the task priority. Calls made outside a task count as interactive.
+current_budget = contextvars.ContextVar("current_budget", default=None)
+
+def current():
+    return current_budget.get() or BUDGETS["interactive"]
+
+def get(name):
+    """Return the configured budget called name"""
+    try:
+        return BUDGETS[name]
+    except KeyError:
+        raise ValueError(f"Unknown query budget: {name}") from None
+
+@contextmanager
+def use(budget, timeout_ms=None, max_rows=None):
+    """Run the block under a budget (a Budget or its name), optionally
+    overriding its limits for this call only"""
+    if not isinstance(budget, Budget):
+        budget = get(budget)
+    if timeout_ms is not None or max_rows is not None:
+        budget = budget.replace(timeout_ms, max_rows)
+    token = current_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        current_budget.reset(token)
+
+# Rewritten statements, so the same SQL and limit always give back the
+# same str object: a prepared cursor is only reused when it executes the
+# very object it prepared
+REWRITE_CACHE_SIZE = 512
+rewrite_cache = OrderedDict()
+rewrite_lock = threading.Lock()
+
+def _rewritten(kind, query, limit, rewrite):
+    key = (kind, query, limit)
+    with rewrite_lock:
+        sql = rewrite_cache.get(key)
+        if sql is not None:
+            rewrite_cache.move_to_end(key)
+            return sql
+    sql = rewrite()
+    with rewrite_lock:
+        sql = rewrite_cache.setdefault(key, sql)
+        while len(rewrite_cache) > REWRITE_CACHE_SIZE:
+            rewrite_cache.popitem(last=False)
+    return sql
+
+def apply_hint(query, budget=None):
+    """Add a MAX_EXECUTION_TIME optimizer hint to a SELECT so the server
+    stops it once the budget is used up"""
+    budget = budget or current()
+    if not budget.timeout_ms or not isinstance(query, str) or not SELECT_RE.match(query):
+        return query
+    if HINT_RE.match(query):
+        return query  # The statement carries its own hints
+    return _rewritten("hint", query, budget.timeout_ms, lambda: SELECT_RE.sub(
+        f"SELECT /*+ MAX_EXECUTION_TIME({budget.timeout_ms}) */", query, count=1))
+
+def limit_query(query, max_rows):
+    """Append LIMIT max_rows + 1 to a SELECT without one, so the server
+    stops early and cap() can tell whether rows were left out"""
+    if not max_rows or not SELECT_RE.match(query) or LIMIT_RE.search(query):
+        return query
+    return _rewritten("limit", query, int(max_rows),
+                      lambda: f"{query.rstrip().rstrip(';')} LIMIT {int(max_rows) + 1}")
+
+def cap(rows, max_rows):
+    """Return rows as Rows, cut to max_rows and flagged if there were more"""
+    if rows is None:
+        return None
+    if max_rows and len(rows) > max_rows:
+        return Rows(rows[:max_rows], True, max_rows)
+    return Rows(rows, False, max_rows)
+
+@contextmanager
+def enforced():
+    """Turn the server's execution-time error into QueryTimeout"""
+    try:
+        yield
+    except Exception as e:
+        if getattr(e, "errno", None) == ER_QUERY_TIMEOUT:
+            budget = current()
+            raise QueryTimeout(
+                f"Query stopped after its {budget.timeout_ms} ms {budget.name} time budget; "
+                f"narrow the search and try again"
+            ) from e
+        raise
+
+def truncation_note(rows):
+    """Text telling the user a view shows only part of the matches"""
+    if not getattr(rows, "truncated", False):
+        return ""
+    if getattr(rows, "total", None) is not None:
+        return f" (showing {len(rows)} of {rows.total}; refine the search to see the rest)"
+    return f" (showing the first {rows.limit}; refine the search to see the rest)"
@@ -0,0 +1,167 @@
+import json
+import time
+import queue
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger("query_explain")
+
+EXPLAINABLE = ("SELECT", "WITH")
+
+def analyze_plan(plan):
+    """Walk an EXPLAIN FORMAT=JSON plan and flag the expensive operations
+
+    Returns a dict with full_scans (tables read with access_type ALL),
+    index_scans (full index scans), filesort and temporary flags, and the
+    largest rows_examined_per_scan estimate.
+    """
+    flags = {
+        "full_scans": [],
+        "index_scans": [],
+        "filesort": False,
+        "temporary": False,
+        "max_rows_examined": 0,
+    }
+
+    def walk(node):
+        if isinstance(node, dict):
+            if node.get("using_filesort"):
+                flags["filesort"] = True
+            if node.get("using_temporary_table"):
+                flags["temporary"] = True
+            if "table_name" in node and "access_type" in node:
+                if node["access_type"] == "ALL":
+                    flags["full_scans"].append(node["table_name"])
+                elif node["access_type"] == "index":
+                    flags["index_scans"].append(node["table_name"])
+                rows = node.get("rows_examined_per_scan") or 0
+                flags["max_rows_examined"] = max(flags["max_rows_examined"], int(rows))
+            for value in node.values():
+                walk(value)
+        elif isinstance(node, list):
+            for value in node:
+                walk(value)
+
+    walk(plan)
+    return flags
+
+def describe_flags(flags):
+    parts = []
+    if flags["full_scans"]:
+        parts.append(f"full_scan({', '.join(flags['full_scans'])})")
+    if flags["index_scans"]:
+        parts.append(f"index_scan({', '.join(flags['index_scans'])})")
+    if flags["filesort"]:
+        parts.append("filesort")
+    if flags["temporary"]:
+        parts.append("temporary")
+    return " ".join(parts) or "none"
+
+class PlanCapture:
+    """Runs EXPLAIN FORMAT=JSON for slow statements on a side connection
+
+    Slow statements are queued by submit() (registered as a slow query
+    listener) and explained by a background thread, so the statement that
+    was slow is not delayed further. Each fingerprint is explained at most
+    once per cooldown period.
+    """
+
+    def __init__(self, connection_factory, plan_log=None, cooldown=600.0,
+                 max_pending=50, keep=200):
+        """
+        Args:
+            connection_factory: Callable opening a connection outside the pool
+            plan_log: Logger that receives the plan next to the slow record
+            cooldown: Seconds before the same fingerprint is explained again
+            max_pending: Slow statements queued for EXPLAIN; extras are dropped
+            keep: Number of explained statements kept in memory
+        """
+        self.connection_factory = connection_factory
+        self.plan_log = plan_log or logger
+        self.cooldown = cooldown
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.records = deque(maxlen=keep)
+        self.last_explained = {}
+        self.lock = threading.Lock()
+        self.worker = None
+        self.conn = None
+
+    def submit(self, record):
+        """Queue a slow query record (see QueryRecorder.on_slow_query)"""
+        sql = record["sql"]
+        if isinstance(sql, (bytes, bytearray)):
+            sql = sql.decode("utf-8", "replace")
+        if not sql.lstrip().upper().startswith(EXPLAINABLE):
+            return
+
+        now = time.monotonic()
+        with self.lock:
+            last = self.last_explained.get(record["fingerprint"])
+            if last is not None and now - last < self.cooldown:
+                return
+            self.last_explained[record["fingerprint"]] = now
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self._run, name="explain", daemon=True)
+                self.worker.start()
+
+        try:
+            self.pending.put_nowait(dict(record, sql=sql))
+        except queue.Full:
+            logger.warning("EXPLAIN queue full, skipping slow statement")
+
+    def _run(self):
+        while True:
+            record = self.pending.get()
+            try:
+                self.explain(record)
+            except Exception as e:
+                logger.error(f"Error explaining slow statement: {e}")
+                self._close()
+
+    def _connection(self):
+        if self.conn is None or not self.conn.is_connected():
+            self._close()
+            self.conn = self.connection_factory()
+        return self.conn
+
+    def _close(self):
+        if self.conn is not None:
+            try:
+                self.conn.close()
+            except Exception:
+                pass
+        self.conn = None
+
+    def explain(self, record):
+        """Run EXPLAIN for one slow query record and store the result"""
+        cursor = self._connection().cursor()
+        try:
+            cursor.execute(f"EXPLAIN FORMAT=JSON {record['sql']}", record.get("params") or None)
+            plan = json.loads(cursor.fetchone()[0])
+        finally:
+            cursor.close()
+
+        flags = analyze_plan(plan)
+        entry = {
+            "time": time.time(),
+            "fingerprint": record["fingerprint"],
+            "duration_ms": record["duration_ms"],
+            "rows": record["rows"],
+            "caller": record["caller"],
+            "flags": flags,
+            "plan": plan,
+        }
+        with self.lock:
+            self.records.append(entry)
+
+        self.plan_log.info(
+            f"plan fingerprint={record['fingerprint']} flags={describe_flags(flags)} "
+            f"plan={json.dumps(plan, separators=(',', ':'))}"
+        )
+        return entry
+
+    def get_records(self):
+        """Explained slow statements, most recent last"""
+        with self.lock:
+            return list(self.records)
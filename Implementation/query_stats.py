@@ -0,0 +1,292 @@
+import re
+import sys
+import time
+import logging
+import threading
+from collections import Counter
+import tracing
+
+logger = logging.getLogger("query_stats")
+
+# Upper bounds (ms) of the per-fingerprint latency histogram buckets
+LATENCY_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+# Modules that make up the data layer; the caller of a query is the first
+# frame outside of these
+INTERNAL_MODULES = {
+    "database_connection", "connection_pool", "query_stats",
+    "result_cache", "schema_catalog", "validators",
+}
+
+COMMENT_RE = re.compile(r"/\*.*?\*/|--[^\n]*", re.DOTALL)
+STRING_RE = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.)*\"")
+NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+PLACEHOLDER_RE = re.compile(r"%s|%\(\w+\)s")
+IN_LIST_RE = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+VALUES_LIST_RE = re.compile(r"\bVALUES\s*\(.*\)", re.IGNORECASE | re.DOTALL)
+WHITESPACE_RE = re.compile(r"\s+")
+
+def fingerprint(sql):
+    """Reduce a statement to its shape: literals and placeholders become ?,
+    IN lists and multi-row VALUES collapse, whitespace is normalized"""
+    if isinstance(sql, (bytes, bytearray)):
+        sql = sql.decode("utf-8", "replace")
+    sql = COMMENT_RE.sub(" ", sql)
+    sql = STRING_RE.sub("?", sql)
+    sql = PLACEHOLDER_RE.sub("?", sql)
+    sql = NUMBER_RE.sub("?", sql)
+    sql = IN_LIST_RE.sub("IN (...)", sql)
+    sql = VALUES_LIST_RE.sub("VALUES (...)", sql)
+    return WHITESPACE_RE.sub(" ", sql).strip()
+
+def calling_module():
+    """Name of the first module on the stack outside the data layer"""
+    frame = sys._getframe(1)
+    while frame is not None:
+        name = frame.f_globals.get("__name__", "")
+        if name not in INTERNAL_MODULES and not name.startswith(("mysql", "threading")):
+            return name
+        frame = frame.f_back
+    return "unknown"
+
+def take_pool_wait(connection):
+    """Return and clear the pool wait of a borrowed connection, so it is
+    charged to the first statement of the borrow only"""
+    if connection is None:
+        return 0.0
+    wait = getattr(connection, "_pool_wait", 0.0)
+    connection._pool_wait = 0.0
+    return wait
+
+class QueryRecorder:
+    """Collects latency statistics per statement fingerprint
+
+    Statements slower than slow_ms are also written to the slow-query log
+    with their duration, rows, pool wait and calling module.
+    """
+
+    def __init__(self, slow_ms=500.0, slow_log_file=None, max_fingerprints=2000):
+        """
+        Args:
+            slow_ms: Duration above which a statement is logged as slow
+            slow_log_file: File for the slow-query log; None disables it
+            max_fingerprints: Distinct statements to track before new ones
+                are counted under a single "other" entry
+        """
+        self.slow_ms = slow_ms
+        self.max_fingerprints = max_fingerprints
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.slow_listeners = []
+
+        self.slow_log = logging.getLogger("slow_query")
+        self.slow_log.propagate = False
+        if slow_log_file and not self.slow_log.handlers:
+            handler = logging.FileHandler(slow_log_file, delay=True)
+            handler.setFormatter(logging.Formatter("%(asctime)s - %(message)s"))
+            self.slow_log.addHandler(handler)
+            self.slow_log.setLevel(logging.INFO)
+
+    def on_slow_query(self, callback):
+        """Register callback(record) for every statement above slow_ms"""
+        self.slow_listeners.append(callback)
+        return callback
+
+    def record(self, sql, duration, rows=0, pool_wait=0.0, caller=None, error=None, params=None):
+        """Record one statement
+
+        Args:
+            sql: Statement text as executed (without parameters)
+            duration: Seconds spent executing and fetching
+            rows: Rows returned (or affected)
+            pool_wait: Seconds spent waiting for the pooled connection
+            caller: Calling module, detected from the stack if None
+            error: Exception raised by the statement, if any
+            params: Statement parameters; passed to slow query listeners
+                but never written to the log
+        """
+        key = fingerprint(sql)
+        duration_ms = duration * 1000
+        wait_ms = pool_wait * 1000
+        caller = caller or calling_module()
+
+        with self.lock:
+            entry = self.stats.get(key)
+            if entry is None:
+                if len(self.stats) >= self.max_fingerprints:
+                    key = "other"
+                    entry = self.stats.get(key)
+                if entry is None:
+                    entry = self.stats[key] = {
+                        "count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0,
+                        "rows": 0, "pool_wait_ms": 0.0, "slow": 0,
+                        "histogram": [0] * (len(LATENCY_BUCKETS_MS) + 1),
+                        "callers": Counter(),
+                    }
+            entry["count"] += 1
+            entry["total_ms"] += duration_ms
+            entry["max_ms"] = max(entry["max_ms"], duration_ms)
+            entry["rows"] += rows or 0
+            entry["pool_wait_ms"] += wait_ms
+            entry["callers"][caller] += 1
+            if error is not None:
+                entry["errors"] += 1
+            for i, bound in enumerate(LATENCY_BUCKETS_MS):
+                if duration_ms <= bound:
+                    entry["histogram"][i] += 1
+                    break
+            else:
+                entry["histogram"][-1] += 1
+            slow = duration_ms >= self.slow_ms
+            if slow:
+                entry["slow"] += 1
+
+        if slow:
+            statement = WHITESPACE_RE.sub(" ", sql if isinstance(sql, str) else fingerprint(sql)).strip()
+            self.slow_log.info(
+                f"{duration_ms:.1f}ms rows={rows} pool_wait={wait_ms:.1f}ms "
+                f"caller={caller} fingerprint={key} sql={statement[:2000]}"
+            )
+            record = {
+                "sql": sql, "fingerprint": key, "duration_ms": duration_ms,
+                "rows": rows, "pool_wait_ms": wait_ms, "caller": caller,
+                "params": params,
+            }
+            for callback in self.slow_listeners:
+                try:
+                    callback(record)
+                except Exception as e:
+                    logger.error(f"Error in slow query listener: {e}")
+
+    def get_stats(self, top=None, sort_by="total_ms"):
+        """Return per-fingerprint stats, heaviest first
+
+        Each entry has fingerprint, count, errors, total_ms, avg_ms, max_ms,
+        p95_ms (bucket upper bound), rows, avg_pool_wait_ms, slow,
+        histogram and callers.
+        """
+        labels = [f"<={bound}ms" for bound in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"]
+        with self.lock:
+            result = []
+            for key, entry in self.stats.items():
+                count = entry["count"]
+                result.append({
+                    "fingerprint": key,
+                    "count": count,
+                    "errors": entry["errors"],
+                    "total_ms": entry["total_ms"],
+                    "avg_ms": entry["total_ms"] / count,
+                    "max_ms": entry["max_ms"],
+                    "p95_ms": self._percentile(entry["histogram"], count, 0.95, entry["max_ms"]),
+                    "rows": entry["rows"],
+                    "avg_pool_wait_ms": entry["pool_wait_ms"] / count,
+                    "slow": entry["slow"],
+                    "histogram": dict(zip(labels, entry["histogram"])),
+                    "callers": dict(entry["callers"]),
+                })
+        result.sort(key=lambda e: e[sort_by], reverse=True)
+        return result[:top] if top else result
+
+    @staticmethod
+    def _percentile(histogram, count, fraction, max_ms):
+        target = count * fraction
+        seen = 0
+        for i, n in enumerate(histogram):
+            seen += n
+            if seen >= target:
+                return LATENCY_BUCKETS_MS[i] if i < len(LATENCY_BUCKETS_MS) else max_ms
+        return max_ms
+
+    def reset(self):
+        with self.lock:
+            self.stats.clear()
+
+class InstrumentedCursor:
+    """Cursor wrapper that times each statement including its fetches
+
+    A statement is recorded when the next one starts, or when the cursor
+    or its connection is closed, so rows read with fetchmany are counted.
+    """
+
+    def __init__(self, cursor, recorder, connection=None):
+        self._cursor = cursor
+        self._recorder = recorder
+        self._connection = connection
+        self._pending = None
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        for row in self._cursor:
+            if self._pending:
+                self._pending["rows"] += 1
+            yield row
+
+    def _run(self, method, operation, args, kwargs):
+        self.finish()
+        pending = {
+            "sql": operation, "params": args[0] if args else kwargs.get("params"),
+            "duration": 0.0, "rows": 0,
+            "pool_wait": take_pool_wait(self._connection), "caller": calling_module(), "error": None,
+        }
+        start = time.perf_counter()
+        try:
+            with tracing.span("query.execute") as span:
+                if span is not None:
+                    span.set(sql=fingerprint(operation)[:500])
+                return method(operation, *args, **kwargs)
+        except Exception as e:
+            pending["error"] = e
+            raise
+        finally:
+            pending["duration"] = time.perf_counter() - start
+            self._pending = pending
+            if pending["error"] is not None or not getattr(self._cursor, "with_rows", False):
+                pending["rows"] = max(getattr(self._cursor, "rowcount", 0) or 0, 0)
+                self.finish()
+
+    def execute(self, operation, *args, **kwargs):
+        return self._run(self._cursor.execute, operation, args, kwargs)
+
+    def executemany(self, operation, *args, **kwargs):
+        return self._run(self._cursor.executemany, operation, args, kwargs)
+
+    def _fetch(self, method, done=False):
+        start = time.perf_counter()
+        with tracing.span("query.fetch") as span:
+            result = method()
+            if span is not None:
+                span.set(rows=len(result) if isinstance(result, list) else int(result is not None))
+        if self._pending:
+            self._pending["duration"] += time.perf_counter() - start
+            if isinstance(result, list):
+                self._pending["rows"] += len(result)
+            elif result is not None:
+                self._pending["rows"] += 1
+            # The statement is complete once the result set is exhausted
+            if done or not result:
+                self.finish()
+        return result
+
+    def fetchone(self):
+        return self._fetch(self._cursor.fetchone)
+
+    def fetchmany(self, *args, **kwargs):
+        return self._fetch(lambda: self._cursor.fetchmany(*args, **kwargs))
+
+    def fetchall(self):
+        return self._fetch(self._cursor.fetchall, done=True)
+
+    def finish(self):
+        """Record the pending statement, if any"""
+        pending, self._pending = self._pending, None
+        if pending:
+            self._recorder.record(
+                pending["sql"], pending["duration"], pending["rows"],
+                pending["pool_wait"], pending["caller"], pending["error"], pending["params"]
+            )
+
+    def close(self):
+        self.finish()
+        return self._cursor.close()
@@ -0,0 +1,135 @@
+import re
+import sys
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger("result_cache")
+
+# Tables a SELECT reads from; good enough for the SQL this application writes
+TABLE_REF_RE = re.compile(r"\b(?:FROM|JOIN)\s+`?(\w+)`?", re.IGNORECASE)
+# Table a data-modifying statement writes to
+WRITE_TABLE_RE = re.compile(
+    r"^\s*(?:INSERT\s+(?:IGNORE\s+)?INTO|REPLACE\s+INTO|UPDATE|DELETE\s+FROM|LOAD\s+DATA.*?\bINTO\s+TABLE)\s+`?(\w+)`?",
+    re.IGNORECASE | re.DOTALL
+)
+WHITESPACE_RE = re.compile(r"\s+")
+
+def normalize_sql(query):
+    """Collapse whitespace so formatting differences share a cache entry"""
+    return WHITESPACE_RE.sub(" ", query).strip()
+
+def tables_read(query):
+    """Lower-case names of the tables a SELECT depends on"""
+    return {name.lower() for name in TABLE_REF_RE.findall(query)}
+
+def table_written(query):
+    """Name of the table a write statement modifies, or None"""
+    match = WRITE_TABLE_RE.match(query)
+    return match.group(1) if match else None
+
+def is_cacheable(query):
+    return query.lstrip()[:6].upper() == "SELECT"
+
+def _row_size(row):
+    return sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row)
+
+class ResultCache:
+    """LRU cache of SELECT results keyed by normalized SQL and parameters
+
+    Each entry records the tables it was read from so a write to a table
+    drops every result that depends on it. Bounded by entry count and by
+    an estimate of the memory held by the rows.
+    """
+
+    def __init__(self, max_entries=0, max_bytes=16 * 1024 * 1024):
+        """
+        Args:
+            max_entries: Number of results to keep; 0 disables the cache
+            max_bytes: Approximate memory limit for all cached rows
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> (rows, size, tables)
+        self.by_table = {}            # table -> set of keys
+        self.bytes = 0
+        # Bumped on every invalidation so a read that raced with a write
+        # does not store rows that are already stale
+        self.generation = 0
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def make_key(self, query, params=None):
+        return (normalize_sql(query), tuple(params) if params else ())
+
+    def get(self, key):
+        """Return a copy of the cached rows, or None on a miss"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return list(entry[0])
+
+    def put(self, key, rows, tables, generation):
+        """Store rows read while the cache was at the given generation"""
+        rows = tuple(rows)
+        size = sum(_row_size(row) for row in rows)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if generation != self.generation:
+                return
+            self._remove(key)
+            self.entries[key] = (rows, size, tables)
+            self.bytes += size
+            for table in tables:
+                self.by_table.setdefault(table, set()).add(key)
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                oldest = next(iter(self.entries))
+                self._remove(oldest)
+                self.stats["evictions"] += 1
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        self.bytes -= entry[1]
+        for table in entry[2]:
+            keys = self.by_table.get(table)
+            if keys:
+                keys.discard(key)
+                if not keys:
+                    del self.by_table[table]
+
+    def invalidate_table(self, table):
+        """Drop every result that read from table"""
+        with self.lock:
+            self.generation += 1
+            keys = self.by_table.pop(str(table).lower(), set())
+            for key in keys:
+                self._remove(key)
+            self.stats["invalidations"] += len(keys)
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+            self.by_table.clear()
+            self.bytes = 0
+
+    def get_stats(self):
+        with self.lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return dict(
+                self.stats,
+                entries=len(self.entries),
+                bytes=self.bytes,
+                hit_rate=self.stats["hits"] / lookups if lookups else 0.0,
+            )
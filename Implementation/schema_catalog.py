@@ -0,0 +1,244 @@
+import os
+import json
+import logging
+import threading
+
+logger = logging.getLogger("schema_catalog")
+
+# Bumped when the column dicts change shape, so older snapshots reload
+SNAPSHOT_FORMAT = 2
+
+# A cheap stamp that changes whenever a table, column or index is added,
+# dropped or rebuilt. Used to decide whether an on-disk snapshot is current.
+SCHEMA_VERSION_QUERY = """
+SELECT CONCAT(
+    (SELECT COUNT(*) FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE()), '-',
+    (SELECT IFNULL(SUM(CRC32(CONCAT(TABLE_NAME, ':', IFNULL(CREATE_TIME, '')))), 0)
+     FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE()), '-',
+    (SELECT IFNULL(SUM(CRC32(CONCAT(TABLE_NAME, ':', COLUMN_NAME, ':', COLUMN_TYPE, ':', IS_NULLABLE))), 0)
+     FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE()), '-',
+    (SELECT IFNULL(SUM(CRC32(CONCAT(TABLE_NAME, ':', INDEX_NAME, ':', COLUMN_NAME))), 0)
+     FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE())
+)
+"""
+
+# Everything the application needs to know about the schema in one round
+# trip. Each row starts with its kind; unused positions are NULL. Text
+# columns are converted to one character set so the UNION cannot fail on
+# the mixed collations information_schema uses.
+def _u(column):
+    return f"CONVERT({column} USING utf8mb4)"
+
+CATALOG_QUERY = f"""
+SELECT 'column', {_u('TABLE_NAME')}, {_u('COLUMN_NAME')}, ORDINAL_POSITION,
+       {_u('DATA_TYPE')}, {_u('COLUMN_TYPE')}, {_u('IS_NULLABLE')}, {_u('COLUMN_KEY')},
+       {_u('EXTRA')}, CHARACTER_MAXIMUM_LENGTH, NUMERIC_PRECISION, NUMERIC_SCALE,
+       {_u('COLLATION_NAME')}, NULL
+FROM information_schema.COLUMNS
+WHERE TABLE_SCHEMA = DATABASE()
+UNION ALL
+SELECT 'foreign_key', {_u('TABLE_NAME')}, {_u('COLUMN_NAME')}, ORDINAL_POSITION,
+       NULL, NULL, NULL, NULL, NULL, NULL, NULL, NULL,
+       {_u('REFERENCED_TABLE_NAME')}, {_u('REFERENCED_COLUMN_NAME')}
+FROM information_schema.KEY_COLUMN_USAGE
+WHERE TABLE_SCHEMA = DATABASE() AND REFERENCED_TABLE_NAME IS NOT NULL
+UNION ALL
+SELECT 'index', {_u('TABLE_NAME')}, {_u('COLUMN_NAME')}, SEQ_IN_INDEX,
+       {_u('INDEX_TYPE')}, NULL, NULL, NULL, NULL, NON_UNIQUE, NULL, NULL,
+       {_u('INDEX_NAME')}, NULL
+FROM information_schema.STATISTICS
+WHERE TABLE_SCHEMA = DATABASE()
+UNION ALL
+SELECT 'version', NULL, CONVERT(({SCHEMA_VERSION_QUERY}) USING utf8mb4), NULL,
+       NULL, NULL, NULL, NULL, NULL, NULL, NULL, NULL, NULL, NULL
+"""
+
+def _text(value):
+    """information_schema values may come back as bytes on some drivers"""
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode("utf-8")
+    return value
+
+class SchemaCatalog:
+    """In-memory copy of the schema metadata of the current database
+
+    Loaded from information_schema in a single query and shared by every
+    module, so no code path needs SHOW COLUMNS or DESCRIBE. All access is
+    thread-safe. Call invalidate() after DDL to reload on next use.
+    """
+
+    def __init__(self, connection_factory, snapshot_path=None):
+        """
+        Args:
+            connection_factory: Callable returning a database connection
+            snapshot_path: Optional JSON file used to skip the full load
+                when the schema version stamp has not changed
+        """
+        self.connection_factory = connection_factory
+        self.snapshot_path = snapshot_path
+        self.lock = threading.RLock()
+        self.version = None
+        self.tables = None
+        self.lower_names = {}
+
+    def _run(self, query):
+        conn = None
+        try:
+            conn = self.connection_factory()
+            cursor = conn.cursor()
+            cursor.execute(query)
+            return cursor.fetchall()
+        finally:
+            if conn:
+                conn.close()
+
+    def load(self, force=False):
+        """Load the catalog if it is not loaded yet (or always, if force)"""
+        with self.lock:
+            if self.tables is not None and not force:
+                return
+
+            if not force and self._load_snapshot():
+                return
+
+            rows = self._run(CATALOG_QUERY)
+            tables = {}
+            version = None
+            for row in rows:
+                kind = _text(row[0])
+                if kind == "version":
+                    version = _text(row[2])
+                    continue
+
+                table = tables.setdefault(_text(row[1]), {
+                    "columns": [], "foreign_keys": [], "indexes": {}
+                })
+                if kind == "column":
+                    table["columns"].append({
+                        "name": _text(row[2]),
+                        "position": int(row[3]),
+                        "data_type": _text(row[4]).lower(),
+                        "column_type": _text(row[5]).lower(),
+                        "nullable": _text(row[6]) == "YES",
+                        "key": _text(row[7]) or "",
+                        "extra": _text(row[8]) or "",
+                        "max_length": int(row[9]) if row[9] is not None else None,
+                        "precision": int(row[10]) if row[10] is not None else None,
+                        "scale": int(row[11]) if row[11] is not None else None,
+                        "collation": _text(row[12]) or None,
+                    })
+                elif kind == "foreign_key":
+                    table["foreign_keys"].append({
+                        "column": _text(row[2]),
+                        "position": int(row[3]),
+                        "ref_table": _text(row[12]),
+                        "ref_column": _text(row[13]),
+                    })
+                elif kind == "index":
+                    index = table["indexes"].setdefault(_text(row[12]), {
+                        "columns": [],
+                        "unique": int(row[9]) == 0,
+                        "type": _text(row[4]),
+                    })
+                    index["columns"].append((int(row[3]), _text(row[2])))
+
+            for table in tables.values():
+                table["columns"].sort(key=lambda c: c["position"])
+                for index in table["indexes"].values():
+                    index["columns"] = [name for _, name in sorted(index["columns"])]
+
+            self._set(tables, version)
+            logger.info(f"Schema catalog loaded: {len(tables)} tables (version {version})")
+            self._save_snapshot()
+
+    def _set(self, tables, version):
+        self.tables = tables
+        self.version = version
+        self.lower_names = {name.lower(): name for name in tables}
+
+    def _load_snapshot(self):
+        """Use the on-disk snapshot if its version matches the server"""
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return False
+        try:
+            with open(self.snapshot_path, "r") as f:
+                snapshot = json.load(f)
+            current = _text(self._run(SCHEMA_VERSION_QUERY)[0][0])
+            if snapshot.get("format") != SNAPSHOT_FORMAT or snapshot.get("version") != current:
+                logger.info("Schema snapshot is out of date, reloading")
+                return False
+            self._set(snapshot["tables"], current)
+            logger.info(f"Schema catalog loaded from snapshot {self.snapshot_path}")
+            return True
+        except Exception as e:
+            logger.error(f"Error reading schema snapshot: {e}")
+            return False
+
+    def _save_snapshot(self):
+        if not self.snapshot_path:
+            return
+        try:
+            with open(self.snapshot_path, "w") as f:
+                json.dump({"format": SNAPSHOT_FORMAT, "version": self.version, "tables": self.tables}, f)
+        except Exception as e:
+            logger.error(f"Error writing schema snapshot: {e}")
+
+    def invalidate(self):
+        """Drop the loaded catalog so the next lookup reloads it"""
+        with self.lock:
+            self.tables = None
+            self.version = None
+            self.lower_names = {}
+
+    def table(self, table_name):
+        """Return the metadata dict of a table, or None if it does not exist"""
+        with self.lock:
+            self.load()
+            name = table_name if table_name in self.tables else self.lower_names.get(str(table_name).lower())
+            return self.tables.get(name) if name else None
+
+    def table_name(self, table_name):
+        """Return the table name as stored in the schema, or None"""
+        with self.lock:
+            self.load()
+            if table_name in self.tables:
+                return table_name
+            return self.lower_names.get(str(table_name).lower())
+
+    def table_names(self):
+        with self.lock:
+            self.load()
+            return list(self.tables)
+
+    def has_table(self, table_name):
+        return self.table(table_name) is not None
+
+    def columns(self, table_name):
+        """Column metadata dicts of a table in ordinal order"""
+        table = self.table(table_name)
+        return table["columns"] if table else []
+
+    def column_names(self, table_name):
+        return [col["name"] for col in self.columns(table_name)]
+
+    def column(self, table_name, column_name):
+        for col in self.columns(table_name):
+            if col["name"] == column_name:
+                return col
+        return None
+
+    def primary_key(self, table_name):
+        table = self.table(table_name)
+        if not table or "PRIMARY" not in table["indexes"]:
+            return []
+        return list(table["indexes"]["PRIMARY"]["columns"])
+
+    def foreign_keys(self, table_name):
+        """Foreign key column dicts: column, ref_table, ref_column"""
+        table = self.table(table_name)
+        return table["foreign_keys"] if table else []
+
+    def indexes(self, table_name):
+        """{index name: {"columns": [...], "unique": bool, "type": str}}"""
+        table = self.table(table_name)
+        return table["indexes"] if table else {}
@@ -0,0 +1,255 @@
+import re
+import logging
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+import fulltext_search
+
+logger = logging.getLogger("search_predicates")
+
+INTEGER_TYPES = ("tinyint", "smallint", "mediumint", "int", "integer", "bigint", "year", "bit")
+DECIMAL_TYPES = ("decimal", "numeric", "float", "double", "real")
+DATE_TYPES = ("date",)
+DATETIME_TYPES = ("datetime", "timestamp")
+
+# Search syntax understood in an advanced search field:
+#   42          equals (numbers, IDs); the whole day, month or year for dates
+#   1, 2, 3     any of the values (numbers and dates)
+#   a | b       either alternative, each using this same syntax
+#   10..20      between, inclusive; either end may be left out
+#   >5 >=5 <5 <=5 !=5
+#   abc*        starts with (text)
+#   =abc        exactly (text)
+#   NULL        empty; !NULL not empty
+#   abc         contains (text), as before
+SYNTAX_HELP = ("Numbers and dates match exactly (2024-03 is the whole month). "
+               "Use 10..20 for ranges, >, <, >=, <=, != to compare, a | b for either, "
+               "abc* for starts with, =abc for exactly, NULL for empty; other text matches anywhere.")
+
+COMPARISON_RE = re.compile(r"^(>=|<=|!=|<>|>|<)\s*(.+)$")
+DATE_RE = re.compile(r"^(\d{4})(?:-(\d{1,2})(?:-(\d{1,2})(?:[ T](\d{1,2}):(\d{2})(?::(\d{2}))?)?)?)?$")
+BOOLEAN_WORDS = {"yes": 1, "true": 1, "y": 1, "no": 0, "false": 0, "n": 0}
+
+class PredicateError(ValueError):
+    """A search value does not fit the type of its column"""
+
+class Predicate:
+    """A SQL condition with its parameters"""
+
+    def __init__(self, sql, params=(), plain_text=False, ranks=(), terms=()):
+        self.sql = sql
+        self.params = list(params)
+        self.plain_text = plain_text  # a LIKE '%value%' search on a text column
+        self.ranks = list(ranks)      # (MATCH expression, params) to order by relevance
+        self.terms = list(terms)      # (column, term) searched with LIKE '%term%'
+
+    def __repr__(self):
+        return f"Predicate({self.sql!r}, {self.params!r})"
+
+def escape_like(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def kind_of(column):
+    """integer, decimal, date, datetime, boolean or text for a catalog column"""
+    data_type = column.get("data_type", "")
+    if column.get("column_type", "").startswith("tinyint(1)"):
+        return "boolean"
+    if data_type in INTEGER_TYPES:
+        return "integer"
+    if data_type in DECIMAL_TYPES:
+        return "decimal"
+    if data_type in DATE_TYPES:
+        return "date"
+    if data_type in DATETIME_TYPES:
+        return "datetime"
+    return "text"
+
+def parse_period(text):
+    """Return (start, end) of the year, month, day or moment written in
+    text, end exclusive; raises ValueError"""
+    match = DATE_RE.match(text.strip())
+    if not match:
+        raise ValueError(text)
+    year, month, day, hour, minute, second = match.groups()
+    year = int(year)
+    if month is None:
+        return datetime(year, 1, 1), datetime(year + 1, 1, 1)
+    month = int(month)
+    if day is None:
+        start = datetime(year, month, 1)
+        return start, datetime(year + (month == 12), month % 12 + 1, 1)
+    start = datetime(year, month, int(day))
+    if hour is None:
+        return start, start + timedelta(days=1)
+    moment = start.replace(hour=int(hour), minute=int(minute), second=int(second or 0))
+    return moment, moment + timedelta(seconds=1)
+
+def combine(parts, joiner, plain_text=False):
+    """Join predicates with AND or OR"""
+    if len(parts) == 1:
+        return parts[0]
+    return Predicate("(" + joiner.join(part.sql for part in parts) + ")",
+                     [param for part in parts for param in part.params],
+                     plain_text, [rank for part in parts for rank in part.ranks],
+                     [term for part in parts for term in part.terms])
+
+class PredicateBuilder:
+    """Turns advanced search values into sargable conditions
+
+    The column type from the schema catalog decides how a value is read:
+    numbers and IDs compare with =, IN and ranges instead of LIKE, and
+    dates become half-open ranges on the column itself, so the optimizer
+    can use an index on the column for any of them.
+    """
+
+    def __init__(self, columns, fulltext_columns=()):
+        """
+        Args:
+            columns: {column name: catalog column dict} of the table
+            fulltext_columns: Columns searched with MATCH ... AGAINST
+                instead of LIKE '%value%'
+        """
+        self.columns = columns
+        self.fulltext_columns = set(fulltext_columns)
+
+    def build(self, criteria, match_any=False):
+        """Return a Predicate combining (column, value) criteria with AND
+        (or OR if match_any); raises PredicateError for a bad value"""
+        parts = [self.criterion(column, value) for column, value in criteria
+                 if value is not None and str(value).strip()]
+        if not parts:
+            return Predicate("1 = 1")
+        return combine(parts, " OR " if match_any else " AND ",
+                       plain_text=all(part.plain_text for part in parts) and not match_any)
+
+    def criterion(self, column, value):
+        """Predicate for one search field"""
+        meta = self.columns.get(column)
+        if meta is None:
+            raise PredicateError(f"Unknown column: {column}")
+        kind = kind_of(meta)
+        text = str(value).strip()
+
+        alternatives = [alt.strip() for alt in text.split("|") if alt.strip()]
+        if kind != "text":
+            # A comma also separates values where it cannot be part of one
+            alternatives = [part.strip() for alt in alternatives for part in alt.split(",") if part.strip()]
+        if len(alternatives) > 1:
+            parts = [self.single(column, kind, alt) for alt in alternatives]
+            equal = [p for p in parts if p.sql == f"{column} = %s"]
+            rest = [p for p in parts if p.sql != f"{column} = %s"]
+            if len(equal) > 1:
+                placeholders = ", ".join(["%s"] * len(equal))
+                rest.insert(0, Predicate(f"{column} IN ({placeholders})", [p.params[0] for p in equal]))
+            else:
+                rest = parts
+            return combine(rest, " OR ")
+        return self.single(column, kind, text)
+
+    def single(self, column, kind, text):
+        upper = text.upper()
+        if upper in ("NULL", "EMPTY"):
+            return Predicate(f"{column} IS NULL")
+        if upper in ("!NULL", "NOT NULL", "!EMPTY"):
+            return Predicate(f"{column} IS NOT NULL")
+
+        if ".." in text:
+            low, high = (part.strip() for part in text.split("..", 1))
+            return self.between(column, kind, low, high)
+
+        match = COMPARISON_RE.match(text)
+        if match:
+            operator, operand = match.groups()
+            return self.compare(column, kind, "!=" if operator == "<>" else operator, operand.strip())
+
+        if kind == "text":
+            if text.startswith("="):
+                return Predicate(f"{column} = %s", [text[1:].strip()])
+            if text.endswith("*") and not text.startswith("*") and len(text) > 1:
+                # A prefix search can use an index on the column
+                return Predicate(f"{column} LIKE %s", [escape_like(text[:-1]) + "%"])
+            term = text.strip("*")
+            if fulltext_search.uses_fulltext(column, term, self.fulltext_columns):
+                match = f"MATCH({column}) AGAINST (%s IN BOOLEAN MODE)"
+                params = [fulltext_search.phrase(term)]
+                return Predicate(match, params, ranks=[(match, params)])
+            return Predicate(f"{column} LIKE %s", [f"%{escape_like(term)}%"], plain_text=True,
+                             terms=[(column, term)])
+
+        if kind in ("date", "datetime"):
+            start, end = self.period(column, text)
+            return self.date_range(column, kind, start, end)
+        return Predicate(f"{column} = %s", [self.value(column, kind, text)])
+
+    def between(self, column, kind, low, high):
+        if kind in ("date", "datetime"):
+            start = self.period(column, low)[0] if low else None
+            end = self.period(column, high)[1] if high else None
+            return self.date_range(column, kind, start, end)
+        low = self.value(column, kind, low) if low else None
+        high = self.value(column, kind, high) if high else None
+        if low is not None and high is not None:
+            return Predicate(f"{column} BETWEEN %s AND %s", [low, high])
+        if low is not None:
+            return Predicate(f"{column} >= %s", [low])
+        if high is not None:
+            return Predicate(f"{column} <= %s", [high])
+        raise PredicateError(f"Empty range for {column}")
+
+    def compare(self, column, kind, operator, operand):
+        if kind in ("date", "datetime"):
+            start, end = self.period(column, operand)
+            # Compare against the whole period: >2024-03 means after March
+            bound, operator = {
+                ">": (end, ">="), ">=": (start, ">="), "<": (start, "<"), "<=": (end, "<"),
+            }.get(operator, (None, operator))
+            if bound is None:
+                low, high = self.date_range(column, kind, start, end).params
+                return Predicate(f"({column} < %s OR {column} >= %s)", [low, self.next_bound(kind, high)])
+            return Predicate(f"{column} {operator} %s", [self.date_value(kind, bound)])
+        return Predicate(f"{column} {operator} %s", [self.value(column, kind, operand)])
+
+    def date_range(self, column, kind, start, end):
+        """Condition for start <= column < end on the bare column"""
+        if start is not None and end is not None:
+            if kind == "date":
+                return Predicate(f"{column} BETWEEN %s AND %s",
+                                 [start.date(), (end - timedelta(days=1)).date()])
+            return Predicate(f"({column} >= %s AND {column} < %s)", [start, end])
+        if start is not None:
+            return Predicate(f"{column} >= %s", [self.date_value(kind, start)])
+        if end is not None:
+            return Predicate(f"{column} < %s", [self.date_value(kind, end)])
+        raise PredicateError(f"Empty range for {column}")
+
+    def next_bound(self, kind, value):
+        return value + timedelta(days=1) if kind == "date" else value
+
+    def date_value(self, kind, moment):
+        return moment.date() if kind == "date" else moment
+
+    def period(self, column, text):
+        try:
+            start, end = parse_period(text)
+        except ValueError:
+            raise PredicateError(f"{column} expects a date like 2024-03-31, 2024-03 or 2024, not '{text}'") from None
+        if kind_of(self.columns[column]) == "date":
+            # A DATE column holds whole days: a moment matches its day
+            start = datetime.combine(start.date(), datetime.min.time())
+            if end.time() != datetime.min.time():
+                end = datetime.combine(end.date(), datetime.min.time()) + timedelta(days=1)
+        return start, end
+
+    def value(self, column, kind, text):
+        if kind == "boolean" and text.lower() in BOOLEAN_WORDS:
+            return BOOLEAN_WORDS[text.lower()]
+        if kind in ("integer", "boolean"):
+            try:
+                return int(text)
+            except ValueError:
+                raise PredicateError(f"{column} expects a whole number, not '{text}'") from None
+        if kind == "decimal":
+            try:
+                return Decimal(text)
+            except InvalidOperation:
+                raise PredicateError(f"{column} expects a number, not '{text}'") from None
+        return text
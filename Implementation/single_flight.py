@@ -0,0 +1,303 @@
+import os
+import json
+import stat
+import time
+import uuid
+import base64
+import hashlib
+import logging
+import threading
+from datetime import date, datetime, time as dt_time, timedelta
+from decimal import Decimal
+import cancellation
+
+logger = logging.getLogger("single_flight")
+
+class Flight:
+    """One in-progress call that other callers can wait for"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+class SingleFlight:
+    """Runs identical concurrent calls once and shares the result
+
+    The first caller for a key runs the function; callers arriving while
+    it runs wait for it and receive a copy of its rows. With shared_dir,
+    portals running as separate processes on the same machine also
+    coalesce: the leader holds a lock file in the directory and publishes
+    the rows there as JSON for the processes waiting on it. The directory
+    must be private to the user (mode 0700); otherwise coalescing stays
+    within this process.
+    """
+
+    def __init__(self, shared_dir=None, wait_timeout=30.0, stale_after=120.0):
+        """
+        Args:
+            shared_dir: Directory for cross-process coalescing, created
+                with mode 0700 if missing; None keeps coalescing within
+                this process
+            wait_timeout: Seconds a caller waits for another process before
+                running the query itself
+            stale_after: Age in seconds after which lock and result files
+                left behind by a crashed process are removed
+        """
+        self.lock = threading.Lock()
+        self.flights = {}
+        self.shared_dir = shared_dir
+        self.wait_timeout = wait_timeout
+        self.stale_after = stale_after
+        self.last_sweep = 0.0
+        self.last_write = 0.0
+        self.stats = {"leaders": 0, "shared": 0, "shared_across_processes": 0, "retries": 0}
+        if shared_dir and not _private_dir(shared_dir):
+            self.shared_dir = None
+
+    def note_write(self):
+        """Record that this process modified data; calls of other processes
+        that started earlier are no longer shared with it"""
+        self.last_write = time.time()
+
+    def do(self, key, func, shared_key=None):
+        """Return func(), or the result of an identical call already running
+
+        Args:
+            key: Identifies identical calls within this process
+            func: Produces the result
+            shared_key: Identifies identical calls across processes;
+                defaults to key
+        """
+        while True:
+            with self.lock:
+                flight = self.flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self.flights[key] = Flight()
+                    self.stats["leaders"] += 1
+                else:
+                    flight.waiters += 1
+
+            if leader:
+                return self._lead(key, flight, func, shared_key)
+
+            # Wait for the leader, giving up early if this caller is cancelled
+            while not flight.done.wait(0.05):
+                cancellation.check()
+            if isinstance(flight.error, cancellation.QueryCancelled):
+                # The leader was superseded, not this caller: try again
+                with self.lock:
+                    self.stats["retries"] += 1
+                continue
+            if flight.error is not None:
+                raise flight.error
+            with self.lock:
+                self.stats["shared"] += 1
+            return _copy(flight.result)
+
+    def _lead(self, key, flight, func, shared_key):
+        try:
+            if self.shared_dir:
+                flight.result = self._run_shared(key if shared_key is None else shared_key, func)
+            else:
+                flight.result = func()
+            return flight.result if not flight.waiters else _copy(flight.result)
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.done.set()
+
+    def _paths(self, key):
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        base = os.path.join(self.shared_dir, digest)
+        return base + ".lock", base
+
+    def _run_shared(self, key, func):
+        """Run func() unless another process is already running the same
+        call, in which case wait for and load its published result"""
+        lock_path, base = self._paths(key)
+        deadline = time.monotonic() + self.wait_timeout
+        self._sweep()
+
+        while True:
+            flight_id = uuid.uuid4().hex
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600)
+            except FileExistsError:
+                other = self._read_lock(lock_path)
+                if other is None:
+                    continue  # The other process just finished
+                if other[1] < self.last_write:
+                    # Started before our own write, so it may miss it
+                    return func()
+                rows = self._wait_for(lock_path, base, other[0], deadline)
+                if rows is not None:
+                    with self.lock:
+                        self.stats["shared_across_processes"] += 1
+                    return rows
+                if time.monotonic() >= deadline:
+                    # The other process is too slow or gone; run it here
+                    return func()
+                continue
+            except OSError as e:
+                logger.warning(f"Cross-process coalescing unavailable: {e}")
+                return func()
+
+            # This process leads: publish the rows under the flight id
+            try:
+                os.write(fd, f"{flight_id} {time.time()!r}".encode("ascii"))
+                os.close(fd)
+                rows = func()
+                self._publish(f"{base}.{flight_id}.result", rows)
+                return rows
+            finally:
+                try:
+                    os.remove(lock_path)
+                except OSError:
+                    pass
+
+    def _read_lock(self, lock_path):
+        """Return (flight id, start time) of a running call, None if it
+        has finished; the id is None while the lock is being written"""
+        try:
+            with open(lock_path, "r", encoding="ascii") as f:
+                flight_id, started = f.read().split()
+            return flight_id, float(started)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            return None, time.time()
+
+    def _wait_for(self, lock_path, base, flight_id, deadline):
+        """Wait until the lock is released and return the published rows,
+        or None if they are not available"""
+        while os.path.exists(lock_path):
+            cancellation.check()
+            if time.monotonic() >= deadline:
+                return None
+            try:
+                if time.time() - os.path.getmtime(lock_path) > self.stale_after:
+                    os.remove(lock_path)  # Left behind by a crashed process
+                    return None
+            except OSError:
+                pass
+            time.sleep(0.02)
+
+        if flight_id is None:
+            return None
+        try:
+            with open(f"{base}.{flight_id}.result", "r", encoding="utf-8") as f:
+                return _decode_rows(json.load(f))
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _publish(self, path, rows):
+        temp = f"{path}.{os.getpid()}.tmp"
+        try:
+            data = _encode_rows(rows)
+            fd = os.open(temp, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(temp, path)
+        except Exception as e:
+            logger.warning(f"Could not share query result: {e}")
+            try:
+                os.remove(temp)
+            except OSError:
+                pass
+
+    def _sweep(self):
+        """Remove result files other processes had time to read"""
+        now = time.time()
+        if now - self.last_sweep < 10:
+            return
+        self.last_sweep = now
+        try:
+            names = os.listdir(self.shared_dir)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.shared_dir, name)
+            try:
+                age = now - os.path.getmtime(path)
+                if (name.endswith((".result", ".tmp")) and age > self.wait_timeout) or \
+                        (name.endswith(".lock") and age > self.stale_after):
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats, in_flight=len(self.flights))
+
+def _private_dir(path):
+    """Create path for this user only, or check that an existing one is
+    a directory owned by this user and tighten it to 0700"""
+    try:
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        info = os.lstat(path)
+        if not stat.S_ISDIR(info.st_mode):
+            logger.warning(f"{path} is not a directory; coalescing within this process only")
+            return False
+        if hasattr(os, "getuid"):
+            if info.st_uid != os.getuid():
+                logger.warning(f"{path} belongs to another user; coalescing within this process only")
+                return False
+            if info.st_mode & 0o077:
+                os.chmod(path, 0o700)
+        return True
+    except OSError as e:
+        logger.warning(f"Cross-process coalescing unavailable: {e}")
+        return False
+
+# Column values JSON has no type for, as {"t": type, "v": value}
+ENCODERS = (
+    (Decimal, "decimal", str),
+    (datetime, "datetime", datetime.isoformat),
+    (date, "date", date.isoformat),
+    (dt_time, "time", dt_time.isoformat),
+    (timedelta, "timedelta", lambda v: [v.days, v.seconds, v.microseconds]),
+    ((bytes, bytearray), "bytes", lambda v: base64.b64encode(v).decode("ascii")),
+    ((set, frozenset), "set", sorted),
+)
+DECODERS = {
+    "decimal": Decimal,
+    "datetime": datetime.fromisoformat,
+    "date": date.fromisoformat,
+    "time": dt_time.fromisoformat,
+    "timedelta": lambda v: timedelta(days=v[0], seconds=v[1], microseconds=v[2]),
+    "bytes": base64.b64decode,
+    "set": set,
+}
+
+def _encode(value):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    for types, name, encode in ENCODERS:
+        if isinstance(value, types):
+            return {"t": name, "v": encode(value)}
+    raise TypeError(f"Cannot share a {type(value).__name__} value")
+
+def _decode(value):
+    return DECODERS[value["t"]](value["v"]) if isinstance(value, dict) else value
+
+def _encode_rows(rows):
+    """JSON-safe form of a result: None or a list of row tuples"""
+    if rows is None:
+        return {"rows": None}
+    if not isinstance(rows, list):
+        raise TypeError(f"Cannot share a {type(rows).__name__} result")
+    return {"rows": [[_encode(value) for value in row] for row in rows]}
+
+def _decode_rows(data):
+    rows = data["rows"]
+    return None if rows is None else [tuple(_decode(value) for value in row) for row in rows]
+
+def _copy(rows):
+    """Give each caller its own list so callers cannot affect each other"""
+    return list(rows) if isinstance(rows, list) else rows
@@ -0,0 +1,366 @@
+import os
+import sys
+import time
+import heapq
+import queue
+import logging
+import itertools
+import threading
+import tkinter as tk
+import metrics
+import cancellation
+import query_budget
+
+logger = logging.getLogger("task_runner")
+
+# Task priorities; lower numbers run first
+INTERACTIVE = 0   # refreshes and searches the user is waiting for
+NORMAL = 10       # reports
+BULK = 20         # exports, imports and refreshing every tab
+
+def budget_for(priority):
+    """Query budget of a task: interactive work gets the tightest limits,
+    bulk work the loosest"""
+    if priority <= INTERACTIVE:
+        return query_budget.get("interactive")
+    if priority < BULK:
+        return query_budget.get("report")
+    return query_budget.get("export")
+
+class TaskQueueFull(RuntimeError):
+    """Too many tasks are already waiting for a worker"""
+
+class Task:
+    """A unit of work queued on a TaskRunner"""
+
+    def __init__(self, func, args, kwargs, priority, key, on_success, on_error, module,
+                 view=None, on_cancel=None, budget=None):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.key = key
+        # (on_success, on_error, on_cancel) of every caller sharing the task
+        self.callbacks = [(on_success, on_error, on_cancel)]
+        self.module = module
+        self.view = view
+        self.budget = budget or budget_for(priority)
+        self.token = cancellation.CancelToken()
+        self.state = "queued"
+        self.result = None
+        self.error = None
+        self.submitted = time.monotonic()
+        self.started = None
+        self.finished = None
+
+    def add_callbacks(self, on_success=None, on_error=None, on_cancel=None):
+        """Also notify a caller whose submit was coalesced into this task"""
+        self.callbacks.append((on_success, on_error, on_cancel))
+
+    def cancel(self):
+        """Drop the task if it has not started yet, otherwise cancel its
+        token (killing its running query); its callbacks will not run"""
+        if self.state == "queued":
+            self.state = "cancelled"
+        if self.state in ("queued", "cancelled", "running"):
+            return self.token.cancel()
+        return False
+
+    @property
+    def done(self):
+        return self.state in ("done", "failed", "cancelled")
+
+class TaskRunner:
+    """Shared pool of worker threads running tasks by priority
+
+    Replaces a thread per click: at most max_workers tasks run at once and
+    the rest wait in a priority queue (FIFO within a priority). A task
+    submitted with the key of a task that is still queued is coalesced
+    into it, so repeated clicks do not pile up work; every caller's
+    callbacks still run. A task submitted for
+    a view cancels the previous task of that view, whose late result is
+    then dropped. on_success and on_error callbacks run on the Tk thread
+    through the UI dispatcher.
+    """
+
+    def __init__(self, max_workers=4, max_queue=200, idle_timeout=60.0, dispatcher=None):
+        """
+        Args:
+            max_workers: Worker threads that may run at the same time
+            max_queue: Queued tasks before submit() raises TaskQueueFull
+            idle_timeout: Seconds an idle worker waits before exiting
+            dispatcher: UIDispatcher receiving the task callbacks
+        """
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max_queue
+        self.idle_timeout = idle_timeout
+        self.dispatcher = dispatcher
+        self.cond = threading.Condition()
+        self.heap = []  # (priority, sequence, task)
+        self.sequence = itertools.count()
+        self.queued_keys = {}
+        self.workers = 0
+        self.idle_workers = 0
+        self.running = 0
+        self.module_priorities = {}
+        self.view_tasks = {}  # view -> latest task submitted for it
+        self.counters = {"submitted": 0, "completed": 0, "failed": 0,
+                         "cancelled": 0, "coalesced": 0, "rejected": 0, "superseded": 0}
+        self.total_wait = 0.0
+
+    def set_module_priority(self, module, priority):
+        """Default priority for tasks submitted from module (by __name__)"""
+        self.module_priorities[module] = priority
+
+    def submit(self, func, *args, priority=None, key=None, view=None,
+               on_success=None, on_error=None, on_cancel=None, budget=None, **kwargs):
+        """Queue func(*args, **kwargs) and return its Task
+
+        Args:
+            priority: INTERACTIVE, NORMAL, BULK or any int; defaults to the
+                priority set for the calling module, else NORMAL
+            key: Identifies repeatable work, e.g. ("refresh", table); while
+                a task with the same key is queued it is returned instead,
+                with these callbacks added to it. Include whatever makes
+                two calls different (a directory, a search value) in it.
+            view: Identifies what the result is shown in; the previous
+                task for the same view is cancelled
+            on_success: Called with the result on the Tk thread
+            on_error: Called with the exception on the Tk thread
+            on_cancel: Called on the Tk thread instead of on_success or
+                on_error when the task was cancelled
+            budget: query_budget.Budget (or its name) limiting the task's
+                queries; defaults to the budget of its priority
+        """
+        module = sys._getframe(1).f_globals.get("__name__", "")
+        if priority is None:
+            priority = self.module_priorities.get(module, NORMAL)
+
+        dropped = []
+        try:
+            with self.cond:
+                if key is not None:
+                    queued = self.queued_keys.get(key)
+                    if queued is not None and queued.state == "queued":
+                        queued.add_callbacks(on_success, on_error, on_cancel)
+                        self.counters["coalesced"] += 1
+                        return queued
+                if len(self.heap) >= self.max_queue:
+                    dropped = self._prune()
+                    if len(self.heap) >= self.max_queue:
+                        self.counters["rejected"] += 1
+                        raise TaskQueueFull(f"{len(self.heap)} background tasks are already waiting")
+                return self._queue(func, args, kwargs, priority, key, view, on_success, on_error,
+                                   on_cancel, budget, module)
+        finally:
+            self._dispatch_cancelled(dropped)
+
+    def _queue(self, func, args, kwargs, priority, key, view, on_success, on_error,
+               on_cancel, budget, module):
+        """Add a new task to the queue and wake or start a worker (lock held)"""
+        if isinstance(budget, str):
+            budget = query_budget.get(budget)
+        task = Task(func, args, kwargs, priority, key, on_success, on_error, module,
+                    view, on_cancel, budget)
+        heapq.heappush(self.heap, (priority, next(self.sequence), task))
+        if key is not None:
+            self.queued_keys[key] = task
+        if view is not None:
+            previous = self.view_tasks.get(view)
+            self.view_tasks[view] = task
+            if previous is not None and not previous.done and previous.cancel():
+                self.counters["superseded"] += 1
+        self.counters["submitted"] += 1
+
+        if self.idle_workers:
+            self.cond.notify()
+        elif self.workers < self.max_workers:
+            self.workers += 1
+            threading.Thread(target=self._work, name=f"task-{self.workers}", daemon=True).start()
+        return task
+
+    def _prune(self):
+        """Drop cancelled tasks from the queue and return them (lock held)"""
+        dropped = [entry[2] for entry in self.heap if entry[2].state != "queued"]
+        self.heap = [entry for entry in self.heap if entry[2].state == "queued"]
+        heapq.heapify(self.heap)
+        for task in dropped:
+            self._drop(task)
+        return dropped
+
+    def _drop(self, task):
+        """Account for a task cancelled while queued (lock held)"""
+        if self.queued_keys.get(task.key) is task:
+            del self.queued_keys[task.key]
+        self.counters["cancelled"] += 1
+        self._forget_view(task)
+
+    def _dispatch_cancelled(self, dropped):
+        """Tell the callers of tasks dropped from the queue"""
+        for task in dropped:
+            self._dispatch(task, 2, cancellation.QueryCancelled("Cancelled before it started"))
+
+    def _next_task(self, dropped):
+        """Wait for the next runnable task, or return None when idle too long;
+        tasks cancelled while queued are added to dropped"""
+        with self.cond:
+            deadline = time.monotonic() + self.idle_timeout
+            while True:
+                while self.heap:
+                    task = heapq.heappop(self.heap)[2]
+                    if task.state == "cancelled":
+                        self._drop(task)
+                        dropped.append(task)
+                        continue
+                    if self.queued_keys.get(task.key) is task:
+                        del self.queued_keys[task.key]
+                    task.state = "running"
+                    task.started = time.monotonic()
+                    self.total_wait += task.started - task.submitted
+                    self.running += 1
+                    return task
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.workers -= 1
+                    return None
+                self.idle_workers += 1
+                self.cond.wait(remaining)
+                self.idle_workers -= 1
+
+    def _forget_view(self, task):
+        """Stop tracking a finished task as the latest of its view (lock held)"""
+        if task.view is not None and self.view_tasks.get(task.view) is task:
+            del self.view_tasks[task.view]
+
+    def _dispatch(self, task, which, value):
+        """Run callback number which (0 success, 1 error, 2 cancel) of
+        every caller of task with value"""
+        for callbacks in task.callbacks:
+            callback = callbacks[which]
+            if callback is None:
+                continue
+            if self.dispatcher is not None:
+                self.dispatcher.call(callback, value)
+            else:
+                callback(value)
+
+    def _work(self):
+        while True:
+            dropped = []
+            task = self._next_task(dropped)
+            self._dispatch_cancelled(dropped)
+            if task is None:
+                return
+            token = cancellation.current_token.set(task.token)
+            budget = query_budget.current_budget.set(task.budget)
+            try:
+                task.result = task.func(*task.args, **task.kwargs)
+                task.state = "done"
+            except Exception as e:
+                # Tasks with an error callback report the error themselves
+                quiet = any(callbacks[1] for callbacks in task.callbacks) or task.token.cancelled
+                log = logger.debug if quiet else logger.error
+                log(f"Background task {getattr(task.func, '__name__', task.func)} failed: {e}")
+                task.error = e
+                task.state = "failed"
+            finally:
+                cancellation.current_token.reset(token)
+                query_budget.current_budget.reset(budget)
+            task.finished = time.monotonic()
+
+            with self.cond:
+                self.running -= 1
+                self._forget_view(task)
+                if task.token.cancelled:
+                    # A newer request owns the view; drop the late result
+                    self.counters["cancelled"] += 1
+                else:
+                    self.counters["completed" if task.state == "done" else "failed"] += 1
+
+            if task.token.cancelled:
+                self._dispatch(task, 2, cancellation.QueryCancelled("Superseded by a newer request"))
+            elif task.state == "done":
+                self._dispatch(task, 0, task.result)
+            else:
+                self._dispatch(task, 1, task.error)
+
+    def queue_depth(self):
+        with self.cond:
+            return sum(1 for entry in self.heap if entry[2].state == "queued")
+
+    def get_stats(self):
+        with self.cond:
+            started = self.counters["completed"] + self.counters["failed"] + self.running
+            return dict(
+                self.counters,
+                queued=sum(1 for entry in self.heap if entry[2].state == "queued"),
+                running=self.running,
+                workers=self.workers,
+                max_workers=self.max_workers,
+                avg_queue_wait_ms=self.total_wait * 1000 / started if started else 0.0,
+            )
+
+class UIDispatcher:
+    """Runs callbacks from worker threads on the Tk thread
+
+    Workers only put callables on a thread-safe queue; the Tk thread
+    drains it every interval_ms with root.after, for at most budget_ms per
+    pass so a burst of updates cannot freeze the window.
+    """
+
+    def __init__(self, interval_ms=20, budget_ms=30):
+        self.interval_ms = interval_ms
+        self.budget = budget_ms / 1000
+        self.queue = queue.SimpleQueue()
+        self.root = None
+        self.thread = None
+
+    def attach(self, widget):
+        """Start draining on the event loop of widget's Tk root; call from
+        the Tk thread. Attaching again is harmless."""
+        if self.root is not None:
+            return
+        self.root = widget.nametowidget(".")
+        self.thread = threading.current_thread()
+        self.root.after(self.interval_ms, self._drain)
+
+    def call(self, func, *args):
+        """Run func(*args) on the Tk thread"""
+        self.queue.put((func, args))
+
+    def _drain(self):
+        deadline = time.perf_counter() + self.budget
+        while time.perf_counter() < deadline:
+            try:
+                func, args = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                func(*args)
+            except tk.TclError as e:
+                # The widget was destroyed while the task was running
+                logger.debug(f"Dropped UI update for a closed widget: {e}")
+            except Exception as e:
+                logger.error(f"Error in UI callback: {e}")
+        try:
+            self.root.after(self.interval_ms, self._drain)
+        except (RuntimeError, tk.TclError):
+            self.root = None  # The window was closed
+
+    def pending(self):
+        return self.queue.qsize()
+
+ui = UIDispatcher()
+runner = TaskRunner(
+    max_workers=int(os.getenv("TASK_WORKERS", "4")),
+    max_queue=int(os.getenv("TASK_QUEUE_SIZE", "200")),
+    dispatcher=ui
+)
+
+submit = runner.submit
+
+metrics.registry.register_gauge("task_queue_depth", "Background tasks waiting for a worker", runner.queue_depth)
+metrics.registry.register_gauge("task_running", "Background tasks running", lambda: runner.running)
+metrics.registry.register_gauge("task_workers", "Background worker threads", lambda: runner.workers)
+metrics.registry.register_gauge("ui_dispatch_pending", "UI updates waiting for the Tk thread", ui.pending)
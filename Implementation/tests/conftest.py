@@ -0,0 +1,136 @@
+import os
+import sys
+import pytest
+
+# The application modules live flat in Implementation/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from connection_pool import ConnectionPool
+
+def column(name, data_type, column_type=None, nullable=True, key="", extra="", max_length=None,
+           collation=None, position=0):
+    return {"name": name, "position": position, "data_type": data_type,
+            "column_type": column_type or data_type, "nullable": nullable, "key": key,
+            "extra": extra, "max_length": max_length, "precision": None, "scale": None,
+            "collation": collation}
+
+# A small schema for the tests that go through database_connection
+SCHEMA = {
+    "Driver": {
+        "columns": [
+            column("Driver_ID", "int", nullable=False, key="PRI", extra="auto_increment", position=1),
+            column("Driver_Name", "varchar", "varchar(50)", nullable=False, max_length=50,
+                   collation="utf8mb4_0900_ai_ci", position=2),
+            column("License_Expiration_Date", "date", position=3),
+        ],
+        "foreign_keys": [],
+        "indexes": {"PRIMARY": {"columns": ["Driver_ID"], "unique": True, "type": "BTREE"},
+                    "ft_driver_name": {"columns": ["Driver_Name"], "unique": False, "type": "FULLTEXT"}},
+    },
+}
+
+class FakeServer:
+    """Answers statements with handler(sql, params) -> rows (None for
+    statements without a result) and remembers what was executed"""
+
+    def __init__(self):
+        self.executed = []
+        self.handler = lambda sql, params: [] if sql.lstrip().upper().startswith("SELECT") else None
+
+    def run(self, sql, params, prepared):
+        self.executed.append((sql, params, prepared))
+        return self.handler(sql, params)
+
+class FakeCursor:
+    def __init__(self, server, prepared=False, **kwargs):
+        self.server = server
+        self.prepared = prepared
+        self.rows = []
+        self.rowcount = -1
+        self.with_rows = False
+        self.description = None
+
+    def execute(self, sql, params=None):
+        rows = self.server.run(sql, params, self.prepared)
+        self.with_rows = rows is not None
+        self.rows = list(rows or [])
+        self.rowcount = len(self.rows) if self.with_rows else 1
+        self.description = [("c",)] if self.with_rows else None
+
+    def executemany(self, sql, seq):
+        for params in seq:
+            self.execute(sql, params)
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def fetchmany(self, size=1):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def fetchone(self):
+        return self.fetchmany(1)[0] if self.rows else None
+
+    def close(self):
+        pass
+
+class FakeConnection:
+    unread_result = False
+    in_transaction = False
+    connection_id = 42
+
+    def __init__(self, server):
+        self.server = server
+
+    def cursor(self, *args, **kwargs):
+        return FakeCursor(self.server, **kwargs)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def consume_results(self):
+        pass
+
+    def ping(self, reconnect=False):
+        pass
+
+    def is_connected(self):
+        return True
+
+    def close(self):
+        pass
+
+@pytest.fixture(scope="session")
+def db_module(tmp_path_factory):
+    """database_connection, imported with its log files in a temp dir"""
+    workdir = tmp_path_factory.mktemp("db")
+    cwd = os.getcwd()
+    os.environ.setdefault("SLOW_QUERY_LOG", str(workdir / "slow_queries.log"))
+    os.chdir(workdir)
+    try:
+        import database_connection
+    finally:
+        os.chdir(cwd)
+    return database_connection
+
+@pytest.fixture
+def server():
+    return FakeServer()
+
+@pytest.fixture
+def db(db_module, server, monkeypatch):
+    """database_connection talking to a FakeServer with SCHEMA loaded"""
+    pool = ConnectionPool(lambda: FakeConnection(server), cursor_wrapper=db_module._instrument_cursor)
+    monkeypatch.setattr(db_module, "connection_pool", pool)
+    for cache in (db_module.sql_cache, db_module.prepared_statements, db_module.count_cache,
+                  db_module.validator_cache, db_module.fk_option_cache):
+        cache.clear()
+    db_module.query_recorder.reset()
+    db_module.schema._set({name: dict(table) for name, table in SCHEMA.items()}, "test")
+    yield db_module
+    db_module.schema.invalidate()
+    pool.close_idle()
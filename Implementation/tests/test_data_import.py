@@ -0,0 +1,92 @@
+import csv
+import pytest
+from conftest import FakeConnection
+
+@pytest.fixture
+def data_import(db):
+    import data_import
+    return data_import
+
+def write(path, text):
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+def read_rejects(path):
+    with open(path, newline="") as f:
+        return list(csv.reader(f))[1:]
+
+def inserted(server):
+    return [params for sql, params, _ in server.executed if sql.startswith("INSERT")]
+
+def test_batched_import_rejects_rows_that_fail_validation(data_import, server, tmp_path):
+    filename = write(tmp_path / "drivers.csv",
+                     "Driver_Name,License_Expiration_Date\nAnn,2025-01-01\nBob,2025-02-30\n,2025-03-01\n")
+    rejects = str(tmp_path / "rejects.csv")
+    summary = data_import.import_file("Driver", filename, use_load_data=False, reject_filename=rejects)
+    assert (summary["method"], summary["processed"], summary["imported"], summary["rejected"]) == \
+        ("batched", 3, 1, 2)
+    assert [row[:2] for row in read_rejects(rejects)] == [
+        ["3", "License_Expiration_Date must be a valid date (YYYY-MM-DD)"],
+        ["4", "Driver_Name is required"],
+    ]
+    assert any("Ann" in str(params) for params in inserted(server))
+
+def test_batched_import_rejects_existing_keys(data_import, server, tmp_path):
+    server.handler = lambda sql, params: [(1,)] if "WHERE Driver_ID IN" in sql else (
+        [] if sql.startswith("SELECT") else None)
+    filename = write(tmp_path / "drivers.csv", "Driver_ID,Driver_Name\n1,Ann\n2,Bob\n")
+    rejects = str(tmp_path / "rejects.csv")
+    summary = data_import.import_file("Driver", filename, use_load_data=False, reject_filename=rejects)
+    assert (summary["imported"], summary["rejected"]) == (1, 1)
+    assert read_rejects(rejects)[0][:2] == ["2", "Driver_ID 1 already exists"]
+
+def test_dry_run_writes_nothing(data_import, server, tmp_path):
+    filename = write(tmp_path / "drivers.csv", "Driver_Name\nAnn\nBob\n")
+    summary = data_import.import_file("Driver", filename, dry_run=True)
+    assert (summary["method"], summary["imported"]) == ("dry_run", 2)
+    assert inserted(server) == []
+
+def test_jsonl_records_with_different_keys(data_import, server, tmp_path):
+    filename = write(tmp_path / "drivers.jsonl",
+                     '{"Driver_Name": "Ann"}\n{"Driver_Name": "Bob", "License_Expiration_Date": "2025-01-01"}\n'
+                     'not json\n')
+    summary = data_import.import_file("Driver", filename)
+    assert (summary["processed"], summary["imported"], summary["rejected"]) == (3, 2, 1)
+
+def test_load_data_checks_types_only_and_counts_skipped_rows(data_import, db, monkeypatch, tmp_path):
+    loaded = []
+    monkeypatch.setattr(data_import, "server_allows_local_infile", lambda: True)
+    monkeypatch.setattr(data_import, "load_data_infile",
+                        lambda table, filename, mapping, reject_file: loaded.append(mapping) or (2, 1))
+
+    def no_lookups(*args, **kwargs):
+        raise AssertionError("key checks are left to the server")
+
+    monkeypatch.setattr(db, "find_existing_keys", no_lookups)
+    filename = write(tmp_path / "drivers.csv", "Driver_ID,Driver_Name\n1,Ann\n2,Bob\n3,Cy\n")
+    summary = data_import.import_file("Driver", filename)
+    assert loaded == [["Driver_ID", "Driver_Name"]]
+    assert (summary["method"], summary["processed"], summary["imported"], summary["rejected"],
+            summary["warnings"]) == ("load_data", 3, 2, 1, 1)
+
+def test_load_data_is_skipped_when_a_row_fails_types(data_import, monkeypatch, tmp_path):
+    monkeypatch.setattr(data_import, "server_allows_local_infile", lambda: True)
+    monkeypatch.setattr(data_import, "load_data_infile",
+                        lambda *args: pytest.fail("LOAD DATA used for an invalid file"))
+    filename = write(tmp_path / "drivers.csv", "Driver_ID,Driver_Name\n1,Ann\nx,Bob\n")
+    summary = data_import.import_file("Driver", filename)
+    assert (summary["method"], summary["imported"], summary["rejected"]) == ("batched", 1, 1)
+
+def test_load_data_infile_writes_server_warnings(data_import, db, server, monkeypatch, tmp_path):
+    server.handler = lambda sql, params: (
+        [("Warning", 1062, "Duplicate entry '1' for key 'PRIMARY'")] if sql == "SHOW WARNINGS" else None)
+    monkeypatch.setattr(db, "get_direct_connection", lambda **kwargs: FakeConnection(server))
+    filename = write(tmp_path / "drivers.csv", "Driver_ID,Extra,Driver_Name\n1,x,Ann\n")
+    with open(tmp_path / "rejects.csv", "w", newline="") as reject_file:
+        loaded, warnings = data_import.load_data_infile("Driver", filename, ["Driver_ID", None, "Driver_Name"],
+                                                        reject_file)
+    assert warnings == 1
+    sql = server.executed[0][0]
+    assert "LOAD DATA LOCAL INFILE" in sql and "(@c0, @c1, @c2)" in sql
+    assert "SET Driver_ID = NULLIF(@c0, ''), Driver_Name = NULLIF(@c2, '')" in sql
+    assert read_rejects(tmp_path / "rejects.csv") == [["Warning", "1062", "Duplicate entry '1' for key 'PRIMARY'"]]
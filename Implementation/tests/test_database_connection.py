@@ -0,0 +1,44 @@
+def stats_for(db, prefix):
+    return [s for s in db.get_query_stats() if s["fingerprint"].startswith(prefix)]
+
+def test_prepared_statement_is_recorded_once_per_execution(db, server):
+    db.insert_data("Driver", ["Driver_Name"], ["Ann"])
+    db.insert_data("Driver", ["Driver_Name"], ["Bob"])
+    assert [prepared for sql, _, prepared in server.executed if sql.startswith("INSERT")] == [True, True]
+    stats = stats_for(db, "INSERT INTO Driver")
+    assert len(stats) == 1 and stats[0]["count"] == 2
+
+def test_plain_cursor_is_recorded_once(db, server):
+    db.execute_query("SELECT * FROM Driver WHERE Driver_Name = %s", ("Ann",), use_cache=False)
+    stats = stats_for(db, "SELECT * FROM Driver")
+    assert len(stats) == 1 and stats[0]["count"] == 1
+
+def ranked_driver_server(server, matches):
+    """Answer ranked searches on Driver from a list of matching rows"""
+    def handler(sql, params):
+        if "MATCH(Driver_Name)" in sql:
+            limit, offset = params[-2], params[-1]
+            return matches[offset:offset + limit]
+        return [] if sql.lstrip().upper().startswith("SELECT") else None
+    server.handler = handler
+
+def test_fulltext_search_with_a_cap_flags_truncation(db, server):
+    ranked_driver_server(server, [(n, "Ann") for n in range(30)])
+    rows = db._fulltext_search("Driver", [("Driver_Name", "Ann")], 10)
+    assert len(rows) == 10 and rows.truncated
+
+def test_uncapped_fulltext_search_returns_every_match(db, server, monkeypatch):
+    monkeypatch.setattr(db, "SEARCH_PAGE_SIZE", 7)
+    matches = [(n, "Ann") for n in range(30)]
+    ranked_driver_server(server, matches)
+    rows = db._fulltext_search("Driver", [("Driver_Name", "Ann")], 0)
+    assert list(rows) == matches and not rows.truncated
+
+def test_advanced_search_gives_the_index_the_like_terms(db, server, monkeypatch):
+    monkeypatch.setattr(db, "FULLTEXT_SEARCH", False)
+    searched = []
+    monkeypatch.setattr(db.search_indexes, "search", lambda table, criteria: searched.append(criteria))
+    db.advanced_search_data("Driver", [("Driver_Name", "*ann*")])
+    assert searched == [[("Driver_Name", "ann")]]
+    like = [params for sql, params, _ in server.executed if "LIKE" in sql]
+    assert like and like[0][0] == "%ann%"
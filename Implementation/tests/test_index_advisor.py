@@ -0,0 +1,167 @@
+import os
+import re
+import pytest
+import index_advisor as ia
+from query_stats import fingerprint
+
+SCHEMA_FILE = os.path.join(os.path.dirname(__file__), "..", "..", "Database Creation & Data insertion",
+                           "NewBCNFDatabaseCreator.txt")
+
+TABLES = {
+    "Driver": {"Driver_ID": "int", "Driver_Name": "varchar", "License_Expiration_Date": "date"},
+    "Vehicle_Driver_Assignment": {"Assignment_ID": "int", "Vehicle_ID": "int", "Driver_ID": "int",
+                                  "Is_Current": "tinyint", "Assignment_Start_Date": "date"},
+    "Vehicle": {"Vehicle_ID": "int", "License_Plate": "varchar"},
+    "Maintenance": {"Maintenance_ID": "int", "Vehicle_ID": "int", "Next_Service_Date": "date",
+                    "Description": "text"},
+    "Vehicle_Load": {"Load_ID": "int", "Delivery_Status_ID": "int", "Scheduled_Departure": "datetime"},
+}
+KEYS = {"Driver": "Driver_ID", "Vehicle_Driver_Assignment": "Assignment_ID", "Vehicle": "Vehicle_ID",
+        "Maintenance": "Maintenance_ID", "Vehicle_Load": "Load_ID"}
+
+class Catalog:
+    """Just enough of SchemaCatalog for the advisor"""
+
+    def __init__(self, indexes=None):
+        self.extra_indexes = indexes or {}
+
+    def table_name(self, name):
+        return next((table for table in TABLES if table.lower() == name.lower()), None)
+
+    def columns(self, table):
+        return [{"name": column, "data_type": data_type} for column, data_type in TABLES[table].items()]
+
+    def column_names(self, table):
+        return list(TABLES[table])
+
+    def primary_key(self, table):
+        return [KEYS[table]]
+
+    def indexes(self, table):
+        return {"PRIMARY": {"columns": [KEYS[table]]}, **self.extra_indexes.get(table, {})}
+
+def stats(*statements):
+    return [{"fingerprint": fingerprint(sql), "count": count, "total_ms": total_ms}
+            for sql, count, total_ms in statements]
+
+def usage(sql):
+    return {u.table: u for u in ia.analyze(fingerprint(sql), ia.Schema(Catalog()))}
+
+def test_analyze_where_and_order():
+    found = usage("SELECT * FROM Maintenance WHERE Next_Service_Date BETWEEN %s AND %s "
+                  "ORDER BY Maintenance_ID LIMIT %s")["Maintenance"]
+    assert found.range == ["Next_Service_Date"]
+    assert found.order == ["Maintenance_ID"]
+    assert found.selected == {"*"}
+
+def test_analyze_joins_attribute_lookup_columns_to_the_joined_table():
+    found = usage("SELECT d.Driver_Name, v.License_Plate FROM Driver d "
+                  "JOIN Vehicle_Driver_Assignment vda ON d.Driver_ID = vda.Driver_ID "
+                  "JOIN Vehicle v ON vda.Vehicle_ID = v.Vehicle_ID WHERE vda.Is_Current = 1")
+    assert found["Vehicle_Driver_Assignment"].eq == ["Is_Current", "Driver_ID"]
+    assert "Vehicle_ID" in found["Vehicle_Driver_Assignment"].selected
+    assert found["Vehicle"].eq == ["Vehicle_ID"]
+    assert found["Driver"].eq == []
+
+def test_or_groups_are_not_used():
+    found = usage("SELECT * FROM Vehicle_Load WHERE Delivery_Status_ID = 1 OR Load_ID = 3")["Vehicle_Load"]
+    assert found.eq == [] and found.range == []
+
+def test_candidate_puts_equality_before_range():
+    found = usage("SELECT * FROM Vehicle_Load WHERE Scheduled_Departure >= %s AND Delivery_Status_ID = %s")
+    assert ia.candidate(found["Vehicle_Load"], ia.Schema(Catalog())) == \
+        (["Delivery_Status_ID", "Scheduled_Departure"], "composite")
+
+def test_candidate_skips_primary_key_lookups_and_text_columns():
+    schema = ia.Schema(Catalog())
+    assert ia.candidate(usage("SELECT * FROM Vehicle WHERE Vehicle_ID = %s")["Vehicle"], schema) is None
+    assert ia.candidate(usage("SELECT * FROM Maintenance WHERE Description = %s")["Maintenance"], schema) is None
+
+def test_candidate_covering():
+    found = usage("SELECT Driver_ID, Driver_Name FROM Driver ORDER BY Driver_Name")["Driver"]
+    assert ia.candidate(found, ia.Schema(Catalog())) == (["Driver_Name"], "single")
+    found = usage("SELECT Driver_Name, License_Expiration_Date FROM Driver "
+                  "WHERE Driver_Name = %s")["Driver"]
+    assert ia.candidate(found, ia.Schema(Catalog())) == (["Driver_Name", "License_Expiration_Date"], "covering")
+
+def test_advise_ranks_and_merges_prefixes():
+    proposals = ia.advise(stats(
+        ("SELECT * FROM Vehicle_Load WHERE Delivery_Status_ID = %s AND Scheduled_Departure >= %s", 10, 2000),
+        ("SELECT * FROM Vehicle_Load WHERE Delivery_Status_ID = %s", 10, 500),
+        ("SELECT * FROM Maintenance WHERE Next_Service_Date < %s", 50, 4000),
+        ("UPDATE Vehicle_Load SET Delivery_Status_ID = %s WHERE Load_ID = %s", 1000, 100),
+    ), Catalog(), {"vehicle_load": 100000, "maintenance": 200000})
+    assert [(p.table, p.columns) for p in proposals] == [
+        ("Maintenance", ["Next_Service_Date"]),
+        ("Vehicle_Load", ["Delivery_Status_ID", "Scheduled_Departure"]),
+    ]
+    load = proposals[1]
+    assert load.queries == 20 and len(load.fingerprints) == 2
+    assert load.write_cost_ms == pytest.approx(1000 * ia.WRITE_COST_MS)
+
+def test_advise_skips_existing_indexes_and_small_tables():
+    catalog = Catalog({"Maintenance": {"idx": {"columns": ["Next_Service_Date", "Vehicle_ID"]}}})
+    statements = stats(("SELECT * FROM Maintenance WHERE Next_Service_Date < %s", 50, 4000))
+    assert ia.advise(statements, catalog, {"maintenance": 200000}) == []
+    small = ia.advise(statements, Catalog(), {"maintenance": 10})[0]
+    large = ia.advise(statements, Catalog(), {"maintenance": 200000})[0]
+    assert small.benefit_ms < large.benefit_ms / 10
+
+def test_index_name_fits_mysql_limit():
+    name = ia.index_name("Vehicle_Driver_Assignment", ["Is_Current", "Driver_ID", "Vehicle_ID", "Assignment_Start_Date"])
+    assert len(name) <= 64 and name.startswith("idx_vehicle_driver_assignment_")
+
+def test_seed_migrations_match_the_schema():
+    with open(SCHEMA_FILE) as f:
+        text = f.read()
+    tables = {name: body for name, body in re.findall(r"CREATE TABLE (\w+) \((.*?)\n\);", text, re.DOTALL)}
+    for migration in ia.SEED_MIGRATIONS:
+        columns = re.findall(r"^\s*(\w+)\s", tables[migration.table], re.MULTILINE)
+        assert set(migration.columns) <= set(columns), migration.version
+
+class Cursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.rows = []
+
+    def execute(self, sql, params=None):
+        self.conn.log.append(sql)
+        if sql.startswith("SELECT Version"):
+            self.rows = [(version, *row) for version, row in sorted(self.conn.migrations.items())]
+        elif sql.startswith("INSERT INTO schema_migrations"):
+            self.conn.migrations[params[0]] = (params[1], params[2], params[3], "now")
+        elif sql.startswith("DELETE FROM schema_migrations"):
+            del self.conn.migrations[params[0]]
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+class Connection:
+    def __init__(self):
+        self.migrations = {}
+        self.log = []
+
+    def cursor(self):
+        return Cursor(self)
+
+    def commit(self):
+        pass
+
+def test_migrations_apply_once_and_revert():
+    conn = Connection()
+    existing = ia.index_name("Driver", ["License_Expiration_Date"])
+    catalog = Catalog({"Driver": {existing: {"columns": ["License_Expiration_Date"]}}})
+    missing = ia.IndexMigration("0099_missing", "Driver", ["Nope"])
+    applied, skipped = ia.apply_migrations(conn, ia.SEED_MIGRATIONS + [missing], catalog)
+    assert applied == [m.version for m in ia.SEED_MIGRATIONS] and skipped == ["0099_missing"]
+    alters = [sql for sql in conn.log if sql.startswith("ALTER")]
+    assert len(alters) == len(ia.SEED_MIGRATIONS) - 1  # the existing index is only recorded
+    assert ia.apply_migrations(conn, ia.SEED_MIGRATIONS, catalog) == ([], [])
+
+    version = ia.SEED_MIGRATIONS[0].version
+    assert ia.revert_migration(conn, version)
+    assert conn.log[-2] == ia.SEED_MIGRATIONS[0].down
+    assert not ia.revert_migration(conn, version)
@@ -0,0 +1,88 @@
+import re
+import pytest
+
+DRIVERS = [(n, f"Driver {n}", None) for n in range(1, 8)]
+
+@pytest.fixture
+def drivers(server):
+    """Answer keyset queries on Driver from DRIVERS, ordered by Driver_ID"""
+    def handler(sql, params):
+        if sql.startswith("SELECT COUNT(*)"):
+            return [(len(DRIVERS),)]
+        if not sql.startswith("SELECT"):
+            return None
+        rows = list(DRIVERS)
+        seek = re.search(r"Driver_ID (>=|>|<) %s", sql)
+        if seek:
+            key = params[0]
+            test = {">": lambda k: k > key, ">=": lambda k: k >= key, "<": lambda k: k < key}[seek.group(1)]
+            rows = [r for r in rows if test(r[0])]
+        if "DESC" in sql:
+            rows.reverse()
+        if sql.startswith("SELECT 1"):
+            return [(1,)] if rows else []
+        return rows[:params[-1]]
+    server.handler = handler
+    return DRIVERS
+
+@pytest.fixture
+def form_utils(db, monkeypatch):
+    import form_utils
+    monkeypatch.setattr(form_utils, "PAGE_SIZE", 3)
+    return form_utils
+
+class FakeTree:
+    pass
+
+def ids(rows):
+    return [r[0] for r in rows]
+
+def test_fetch_page_walks_forward_and_back(db, drivers):
+    rows, info = db.fetch_page("Driver", page_size=3)
+    assert ids(rows) == [1, 2, 3] and info["has_next"] and not info["has_prev"]
+    rows, info = db.fetch_page("Driver", info["last_key"], "next", 3)
+    assert ids(rows) == [4, 5, 6] and info["has_next"] and info["has_prev"]
+    rows, info = db.fetch_page("Driver", info["last_key"], "next", 3)
+    assert ids(rows) == [7] and not info["has_next"] and info["has_prev"]
+    rows, info = db.fetch_page("Driver", info["first_key"], "prev", 3)
+    assert ids(rows) == [4, 5, 6] and info["has_next"] and info["has_prev"]
+
+def test_reloading_the_first_page_has_no_previous_page(db, drivers):
+    rows, info = db.fetch_page("Driver", (1,), "at", 3)
+    assert ids(rows) == [1, 2, 3] and not info["has_prev"]
+    rows, info = db.fetch_page("Driver", (4,), "at", 3)
+    assert ids(rows) == [4, 5, 6] and info["has_prev"]
+
+def test_tree_pages_through_a_table(form_utils, drivers):
+    tree = FakeTree()
+    assert ids(form_utils.fetch_tree_page(tree, "Driver")) == [1, 2, 3]
+    assert tree.page_info["total"] == len(drivers)
+    assert ids(form_utils.fetch_tree_page(tree, "Driver", "next")) == [4, 5, 6]
+    assert ids(form_utils.fetch_tree_page(tree, "Driver")) == [4, 5, 6]
+    assert ids(form_utils.fetch_tree_page(tree, "Driver", "first")) == [1, 2, 3]
+    assert not tree.page_info["has_prev"]
+
+def test_tree_stays_put_at_either_end(form_utils, drivers):
+    tree = FakeTree()
+    form_utils.fetch_tree_page(tree, "Driver")
+    assert ids(form_utils.fetch_tree_page(tree, "Driver", "prev")) == [1, 2, 3]
+    form_utils.fetch_tree_page(tree, "Driver", "next")
+    assert ids(form_utils.fetch_tree_page(tree, "Driver", "next")) == [7]
+    assert ids(form_utils.fetch_tree_page(tree, "Driver", "next")) == [7]
+
+def test_reloaded_first_page_disables_previous(form_utils, drivers):
+    tree = FakeTree()
+    form_utils.fetch_tree_page(tree, "Driver")
+    form_utils.fetch_tree_page(tree, "Driver")
+    assert not tree.page_info["has_prev"]
+
+def test_unknown_direction_is_rejected(form_utils, drivers):
+    with pytest.raises(ValueError):
+        form_utils.fetch_tree_page(FakeTree(), "Driver", "last")
+
+def test_search_results_drop_the_page_position(form_utils, drivers):
+    tree = FakeTree()
+    form_utils.fetch_tree_page(tree, "Driver", "next")
+    form_utils.update_search_label(tree, drivers[:2])
+    assert tree.page_info is None
+    assert ids(form_utils.fetch_tree_page(tree, "Driver")) == [1, 2, 3]
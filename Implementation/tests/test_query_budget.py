@@ -0,0 +1,44 @@
+import pytest
+import query_budget
+from query_budget import Budget, Rows
+
+def test_hint_added_to_select_only():
+    budget = Budget("interactive", timeout_ms=500)
+    assert query_budget.apply_hint("SELECT * FROM Driver", budget) == \
+        "SELECT /*+ MAX_EXECUTION_TIME(500) */ * FROM Driver"
+    assert query_budget.apply_hint("UPDATE Driver SET x = 1", budget) == "UPDATE Driver SET x = 1"
+    assert query_budget.apply_hint("SELECT 1", Budget("export")) == "SELECT 1"
+
+def test_rewrites_return_the_same_object():
+    # Prepared cursors are reused only for the identical str object
+    budget = Budget("interactive", timeout_ms=500)
+    query = "SELECT * FROM Driver WHERE Driver_Name LIKE %s"
+    limited = query_budget.limit_query(query, 100)
+    assert limited is query_budget.limit_query("".join(["SELECT * FROM Driver ", "WHERE Driver_Name LIKE %s"]), 100)
+    assert query_budget.apply_hint(limited, budget) is query_budget.apply_hint(limited, budget)
+    assert query_budget.limit_query(query, 100) is not query_budget.limit_query(query, 200)
+
+def test_limit_query():
+    assert query_budget.limit_query("SELECT * FROM Driver;", 10) == "SELECT * FROM Driver LIMIT 11"
+    assert query_budget.limit_query("SELECT * FROM Driver LIMIT %s", 10) == "SELECT * FROM Driver LIMIT %s"
+    assert query_budget.limit_query("SELECT * FROM Driver", 0) == "SELECT * FROM Driver"
+
+def test_cap_and_truncation_note():
+    rows = query_budget.cap([(i,) for i in range(11)], 10)
+    assert len(rows) == 10 and rows.truncated
+    assert "first 10" in query_budget.truncation_note(rows)
+    assert query_budget.truncation_note(query_budget.cap([(1,)], 10)) == ""
+    assert "3 of 42" in query_budget.truncation_note(Rows([1, 2, 3], True, 3, total=42))
+
+def test_use_overrides_current_budget():
+    assert query_budget.current().name == "interactive"
+    with query_budget.use("report", max_rows=7) as budget:
+        assert query_budget.current() is budget and budget.max_rows == 7
+    assert query_budget.current().name == "interactive"
+
+def test_server_timeout_becomes_query_timeout():
+    class ServerError(Exception):
+        errno = query_budget.ER_QUERY_TIMEOUT
+    with pytest.raises(query_budget.QueryTimeout):
+        with query_budget.enforced():
+            raise ServerError("maximum statement execution time exceeded")
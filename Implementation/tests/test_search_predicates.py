@@ -0,0 +1,67 @@
+from datetime import date, datetime
+from decimal import Decimal
+import pytest
+import search_predicates as sp
+
+COLUMNS = {
+    "Load_ID": {"data_type": "int", "column_type": "int"},
+    "Weight": {"data_type": "decimal", "column_type": "decimal(10,2)"},
+    "Is_Current": {"data_type": "tinyint", "column_type": "tinyint(1)"},
+    "Hire_Date": {"data_type": "date", "column_type": "date"},
+    "Departure": {"data_type": "datetime", "column_type": "datetime"},
+    "Name": {"data_type": "varchar", "column_type": "varchar(50)"},
+}
+
+def build(column, value):
+    predicate = sp.PredicateBuilder(COLUMNS).build([(column, value)])
+    return predicate.sql, predicate.params
+
+def test_numbers_compare_with_equality_in_and_ranges():
+    assert build("Load_ID", "42") == ("Load_ID = %s", [42])
+    assert build("Load_ID", "1, 2, 3") == ("Load_ID IN (%s, %s, %s)", [1, 2, 3])
+    assert build("Load_ID", "10..20") == ("Load_ID BETWEEN %s AND %s", [10, 20])
+    assert build("Weight", ">=2.5") == ("Weight >= %s", [Decimal("2.5")])
+    assert build("Is_Current", "yes") == ("Is_Current = %s", [1])
+
+def test_text_prefix_exact_and_contains():
+    assert build("Name", "ab_c*") == ("Name LIKE %s", ["ab\\_c%"])
+    assert build("Name", "=Ann") == ("Name = %s", ["Ann"])
+    assert build("Name", "nn") == ("Name LIKE %s", ["%nn%"])
+
+def test_null_checks():
+    assert build("Name", "NULL") == ("Name IS NULL", [])
+    assert build("Hire_Date", "!NULL") == ("Hire_Date IS NOT NULL", [])
+
+def test_date_periods():
+    assert build("Hire_Date", "2024-03") == ("Hire_Date BETWEEN %s AND %s", [date(2024, 3, 1), date(2024, 3, 31)])
+    assert build("Departure", "2024") == ("(Departure >= %s AND Departure < %s)",
+                                          [datetime(2024, 1, 1), datetime(2025, 1, 1)])
+
+def test_datetime_literal_on_date_column_matches_its_day():
+    assert build("Hire_Date", "2024-03-05 10:30") == ("Hire_Date BETWEEN %s AND %s",
+                                                      [date(2024, 3, 5), date(2024, 3, 5)])
+    assert build("Hire_Date", "2024-03-05 10:30..2024-03-07 08:00") == (
+        "Hire_Date BETWEEN %s AND %s", [date(2024, 3, 5), date(2024, 3, 7)])
+    assert build("Hire_Date", "<=2024-03-05 10:30") == ("Hire_Date < %s", [date(2024, 3, 6)])
+    assert build("Hire_Date", ">2024-03-05 10:30") == ("Hire_Date >= %s", [date(2024, 3, 6)])
+    assert build("Hire_Date", "!=2024-03-05 10:30") == ("(Hire_Date < %s OR Hire_Date >= %s)",
+                                                        [date(2024, 3, 5), date(2024, 3, 6)])
+
+def test_datetime_literal_on_datetime_column_is_one_second():
+    assert build("Departure", "2024-03-05 10:30") == (
+        "(Departure >= %s AND Departure < %s)", [datetime(2024, 3, 5, 10, 30), datetime(2024, 3, 5, 10, 30, 1)])
+
+def test_bad_values_raise_predicate_error():
+    with pytest.raises(sp.PredicateError):
+        build("Load_ID", "abc")
+    with pytest.raises(sp.PredicateError):
+        build("Hire_Date", "March")
+    with pytest.raises(sp.PredicateError):
+        build("Missing", "1")
+
+def test_plain_text_terms_drop_the_wildcard_marks():
+    builder = sp.PredicateBuilder(COLUMNS)
+    assert builder.build([("Name", "*abc*")]).terms == [("Name", "abc")]
+    predicate = builder.build([("Name", "*abc"), ("Load_ID", "3")])
+    assert predicate.terms == [("Name", "abc")] and not predicate.plain_text
+    assert builder.build([("Name", "abc*")]).terms == []
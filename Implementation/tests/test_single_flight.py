@@ -0,0 +1,122 @@
+import os
+import json
+import stat
+import threading
+import time
+from datetime import date, datetime, time as dt_time, timedelta
+from decimal import Decimal
+import pytest
+import single_flight
+from single_flight import SingleFlight
+
+ROWS = [
+    (1, "Ann", Decimal("12.50"), date(2024, 3, 5), datetime(2024, 3, 5, 10, 30, 1, 250),
+     dt_time(8, 15), timedelta(hours=26, microseconds=5), b"\x00\xff", {"a", "b"}, None, True, 1.5),
+]
+
+def run_together(flight, key, func, callers=4):
+    """Call flight.do from several threads while func is running; a
+    caller's result is its rows or the exception it got"""
+    started = threading.Event()
+    results = []
+
+    def slow():
+        started.set()
+        time.sleep(0.2)
+        return func()
+
+    def call(f):
+        try:
+            results.append(flight.do(key, f))
+        except Exception as e:
+            results.append(e)
+
+    threads = [threading.Thread(target=call, args=(slow,))]
+    threads[0].start()
+    started.wait()
+    threads += [threading.Thread(target=call, args=(func,)) for _ in range(callers - 1)]
+    for thread in threads[1:]:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def test_identical_calls_run_once():
+    flight = SingleFlight()
+    calls = []
+    results = run_together(flight, "q", lambda: calls.append(1) or [(1,), (2,)])
+    assert len(calls) == 1
+    assert results == [[(1,), (2,)]] * 4
+    assert len({id(rows) for rows in results}) == 4  # each caller has its own list
+    assert flight.get_stats()["shared"] == 3
+
+def test_errors_reach_every_caller():
+    flight = SingleFlight()
+
+    def fail():
+        raise RuntimeError("server gone")
+
+    results = run_together(flight, "q", fail)
+    assert [str(e) for e in results] == ["server gone"] * 4
+    assert all(isinstance(e, RuntimeError) for e in results)
+    assert flight.get_stats()["in_flight"] == 0
+
+def test_rows_survive_json_round_trip():
+    data = json.loads(json.dumps(single_flight._encode_rows(ROWS)))
+    assert single_flight._decode_rows(data) == ROWS
+    assert single_flight._decode_rows(single_flight._encode_rows(None)) is None
+
+def test_unsupported_values_are_not_encoded():
+    with pytest.raises(TypeError):
+        single_flight._encode_rows([(object(),)])
+    with pytest.raises(TypeError):
+        single_flight._encode_rows("rows")
+
+@pytest.mark.skipif(not hasattr(os, "getuid"), reason="POSIX permissions")
+def test_shared_dir_is_private(tmp_path):
+    shared = tmp_path / "flights"
+    SingleFlight(shared_dir=str(shared))
+    assert stat.S_IMODE(os.stat(shared).st_mode) == 0o700
+
+    loose = tmp_path / "loose"
+    loose.mkdir(mode=0o755)
+    os.chmod(loose, 0o755)
+    assert SingleFlight(shared_dir=str(loose)).shared_dir == str(loose)
+    assert stat.S_IMODE(os.stat(loose).st_mode) == 0o700
+
+def test_shared_dir_must_be_a_directory(tmp_path):
+    target = tmp_path / "real"
+    target.mkdir()
+    link = tmp_path / "link"
+    link.symlink_to(target)
+    assert SingleFlight(shared_dir=str(link)).shared_dir is None
+
+def test_rows_are_shared_across_processes_as_json(tmp_path):
+    # Two instances stand in for two portal processes sharing the directory
+    leader, follower = SingleFlight(shared_dir=str(tmp_path)), SingleFlight(shared_dir=str(tmp_path))
+    published = []
+    original = leader._publish
+
+    def publish(path, rows):
+        original(path, rows)
+        with open(path, encoding="utf-8") as f:
+            published.append(json.load(f))
+        assert stat.S_IMODE(os.stat(path).st_mode) & 0o077 == 0
+
+    leader._publish = publish
+    started = threading.Event()
+
+    def slow():
+        started.set()
+        time.sleep(0.3)
+        return list(ROWS)
+
+    results = []
+    thread = threading.Thread(target=lambda: results.append(leader.do("q", slow)))
+    thread.start()
+    started.wait()
+    shared = follower.do("q", lambda: pytest.fail("ran the query twice"))
+    thread.join()
+    assert shared == ROWS and results == [ROWS]
+    assert published and published[0]["rows"][0][0] == 1
+    assert follower.get_stats()["shared_across_processes"] == 1
@@ -0,0 +1,78 @@
+import threading
+import task_runner
+from task_runner import TaskRunner
+
+def busy_runner(max_queue=200):
+    """A one-worker runner whose worker is held until release is set"""
+    runner = TaskRunner(max_workers=1, max_queue=max_queue)
+    started, release = threading.Event(), threading.Event()
+    runner.submit(lambda: (started.set(), release.wait(5)))
+    started.wait(5)
+    return runner, release
+
+def wait_for(task):
+    for _ in range(500):
+        if task.done:
+            return
+        threading.Event().wait(0.01)
+    raise AssertionError("task did not finish")
+
+def test_coalesced_calls_all_get_the_result():
+    runner, release = busy_runner()
+    calls, results = [], []
+    first = runner.submit(lambda: calls.append(1) or "rows", key="export", on_success=results.append)
+    second = runner.submit(lambda: calls.append(2) or "other", key="export", on_success=results.append)
+    assert second is first
+    release.set()
+    wait_for(first)
+    assert calls == [1] and results == ["rows", "rows"]
+    assert runner.get_stats()["coalesced"] == 1
+
+def test_coalesced_calls_all_get_the_error():
+    runner, release = busy_runner()
+    errors = []
+
+    def fail():
+        raise RuntimeError("disk full")
+
+    task = runner.submit(fail, key="export", on_error=errors.append)
+    runner.submit(fail, key="export", on_error=errors.append)
+    release.set()
+    wait_for(task)
+    assert [str(e) for e in errors] == ["disk full", "disk full"]
+
+def test_different_keys_run_separately():
+    runner, release = busy_runner()
+    results = []
+    a = runner.submit(lambda: "a", key=("export_all", "/tmp/a"), on_success=results.append)
+    b = runner.submit(lambda: "b", key=("export_all", "/tmp/b"), on_success=results.append)
+    assert a is not b
+    release.set()
+    wait_for(a)
+    wait_for(b)
+    assert sorted(results) == ["a", "b"]
+
+def test_superseded_queued_task_reports_cancel():
+    runner, release = busy_runner()
+    cancelled, results = [], []
+    old = runner.submit(lambda: "old", view="tree", on_success=results.append, on_cancel=cancelled.append)
+    new = runner.submit(lambda: "new", view="tree", on_success=results.append)
+    release.set()
+    wait_for(new)
+    assert old.state == "cancelled" and results == ["new"] and len(cancelled) == 1
+
+def test_pruned_tasks_report_cancel():
+    runner, release = busy_runner(max_queue=2)
+    cancelled = []
+    for _ in range(2):
+        runner.submit(lambda: None, view="tree", on_cancel=cancelled.append)
+    # The queue is full of one live and one cancelled task; pruning frees room
+    runner.submit(lambda: None)
+    assert len(cancelled) == 1
+    assert isinstance(cancelled[0], task_runner.cancellation.QueryCancelled)
+    release.set()
+
+def test_budget_follows_priority():
+    assert task_runner.budget_for(task_runner.INTERACTIVE).name == "interactive"
+    assert task_runner.budget_for(task_runner.NORMAL).name == "report"
+    assert task_runner.budget_for(task_runner.BULK).name == "export"
@@ -0,0 +1,68 @@
+from trigram_index import TrigramIndex, SearchIndexes, RowChange, fold
+
+ROWS = [(1, "Alice Smith"), (2, "Bob Jones"), (3, "Ålice Brown")]
+
+def make_indexes(rows=ROWS):
+    def describe(table):
+        return "Driver_ID", ["Driver_Name"], True
+
+    def load(table, key_column, columns, after=None):
+        return [row for row in rows if after is None or row[0] > after]
+
+    return SearchIndexes(describe, load, tables=["Driver"], refresh_after=0)
+
+def built(indexes, table="Driver"):
+    """Start the build of table's index and wait for it"""
+    assert indexes.search(table, [("Driver_Name", "x")]) is None
+    worker = indexes.entries[table.lower()].worker
+    if worker is not None:
+        worker.join()
+    return indexes
+
+def test_fold_ignores_case_and_accents():
+    assert fold("ÅLICE") == "alice"
+
+def test_index_search_is_exact():
+    index = TrigramIndex("id", ["name"])
+    index.add(1, {"name": "Alice Smith"})
+    index.add(2, {"name": "Bob Jones"})
+    assert index.search("name", "smi") == {1}
+    assert index.search("name", "li") == {1}
+    assert index.search("name", "ice smith") == {1}
+    assert index.search("name", "zzz") == set()
+
+def test_remove_drops_postings():
+    index = TrigramIndex("id", ["name"])
+    index.add(1, {"name": "Alice"})
+    index.remove(1)
+    assert index.search("name", "ali") == set()
+    assert index.trigram_count() == 0
+
+def test_search_after_build():
+    indexes = built(make_indexes())
+    assert indexes.search("Driver", [("Driver_Name", "ali")]) == [1, 3]
+    assert indexes.search("Driver", [("Driver_Name", "50%")]) is None
+
+def test_update_and_delete_follow_writes():
+    indexes = built(make_indexes())
+    indexes.on_change("Driver", RowChange("update", "Driver_ID", 1, {"Driver_Name": "Zed Zulu"}))
+    assert indexes.search("Driver", [("Driver_Name", "ali")]) == [3]
+    assert indexes.search("Driver", [("Driver_Name", "zul")]) == [1]
+    indexes.on_change("Driver", RowChange("delete", "Driver_ID", 3, None))
+    assert indexes.search("Driver", [("Driver_Name", "ali")]) == []
+
+def test_unknown_key_marks_index_dirty():
+    # A key the index does not hold (here a string for an int key) must
+    # not be ignored: the stale index stops answering until rebuilt
+    indexes = built(make_indexes())
+    indexes.on_change("Driver", RowChange("update", "Driver_ID", "1", {"Driver_Name": "Zed Zulu"}))
+    assert indexes.entries["driver"].dirty
+    assert indexes.search("Driver", [("Driver_Name", "ali")]) is None
+
+def test_generated_key_insert_loads_new_rows():
+    rows = list(ROWS)
+    indexes = built(make_indexes(rows))
+    rows.append((4, "Alina Gray"))
+    indexes.on_change("Driver", RowChange("insert", None, None, {"Driver_Name": "Alina Gray"}))
+    indexes.entries["driver"].worker.join()
+    assert indexes.search("Driver", [("Driver_Name", "ali")]) == [1, 3, 4]
@@ -0,0 +1,131 @@
+import validators
+
+def column(name, data_type, column_type=None, nullable=True, extra="", max_length=None, collation=None):
+    return {"name": name, "data_type": data_type, "column_type": column_type or data_type,
+            "nullable": nullable, "extra": extra, "max_length": max_length,
+            "precision": None, "scale": None, "collation": collation}
+
+COLUMNS = [
+    column("Driver_ID", "int", nullable=False, extra="auto_increment"),
+    column("Driver_Name", "varchar", nullable=False, max_length=20, collation="utf8mb4_0900_ai_ci"),
+    column("License_Number", "varchar", max_length=20, collation="utf8mb4_0900_ai_ci"),
+    column("Badge", "varchar", max_length=20, collation="utf8mb4_bin"),
+    column("Depot_ID", "int"),
+    column("Hired", "date"),
+    column("Region_Code", "varchar", max_length=5, collation="utf8mb4_0900_ai_ci"),
+]
+
+# Referenced columns of the foreign keys
+REFERENCED = {
+    ("Depot", "Depot_ID"): column("Depot_ID", "int"),
+    ("Region", "Region_Code"): column("Region_Code", "varchar", max_length=5, collation="utf8mb4_0900_ai_ci"),
+}
+
+class Catalog:
+    """Just enough of SchemaCatalog for compile_validator"""
+
+    def columns(self, table):
+        return COLUMNS
+
+    def primary_key(self, table):
+        return ["Driver_ID"]
+
+    def indexes(self, table):
+        return {
+            "PRIMARY": {"columns": ["Driver_ID"], "unique": True, "type": "BTREE"},
+            "uq_license": {"columns": ["License_Number"], "unique": True, "type": "BTREE"},
+            "uq_badge": {"columns": ["Badge"], "unique": True, "type": "BTREE"},
+        }
+
+    def column(self, table, name):
+        return REFERENCED.get((table, name))
+
+    def foreign_keys(self, table):
+        return [{"column": "Depot_ID", "ref_table": "Depot", "ref_column": "Depot_ID"},
+                {"column": "Region_Code", "ref_table": "Region", "ref_column": "Region_Code"}]
+
+# Rows already in the database: Driver_ID -> (License_Number, Badge)
+DRIVERS = {1: ("ABC123", "B-1"), 2: ("XYZ789", "B-2")}
+DEPOTS = {10}
+REGIONS = {"NORTH"}
+
+def lookup(table, col, values, extra_column=None):
+    # The server converts "07" to 7 for an INT column and ignores case
+    # in a _ci column, and returns the stored values
+    if table == "Depot":
+        return [(d,) for d in DEPOTS if d in {int(str(v).strip()) for v in values}]
+    if table == "Region":
+        return [(r,) for r in REGIONS if r.casefold() in {str(v).casefold() for v in values}]
+    rows = []
+    for driver_id, (license_number, badge) in DRIVERS.items():
+        stored = {"Driver_ID": driver_id, "License_Number": license_number, "Badge": badge}[col]
+        # The server compares with the column's collation
+        if col == "Driver_ID":
+            matches, key = {int(v) for v in values}, stored
+        elif col == "Badge":
+            matches, key = {str(v) for v in values}, str(stored)
+        else:
+            matches, key = {str(v).casefold() for v in values}, str(stored).casefold()
+        if key in matches:
+            rows.append((stored, driver_id) if extra_column else (stored,))
+    return rows
+
+COLS = ["Driver_ID", "Driver_Name", "License_Number", "Badge", "Depot_ID"]
+
+def validator():
+    return validators.compile_validator(Catalog(), "Driver")
+
+def test_primary_key_is_not_a_unique_column():
+    v = validator()
+    assert "Driver_ID" not in v.unique_columns
+    assert set(v.unique_columns) == {"License_Number", "Badge"}
+
+def test_type_and_required_checks():
+    errors = validator().validate({"Driver_ID": "", "Driver_Name": "", "Depot_ID": "ten", "Hired": "2024-02-30"})
+    assert errors == ["Driver_Name is required", "Depot_ID must be a number",
+                      "Hired must be a valid date (YYYY-MM-DD)"]
+
+def test_duplicate_primary_key_on_insert():
+    failures = validator().check_keys(COLS, [[1, "Ann", "NEW1", "B-9", 10]], lookup)
+    assert failures == {0: ["Driver_ID 1 already exists"]}
+
+def test_duplicate_primary_key_within_batch():
+    rows = [[5, "Ann", "N1", "B-5", 10], [5, "Bob", "N2", "B-6", 10]]
+    assert validator().check_keys(COLS, rows, lookup) == {1: ["Driver_ID 5 already exists"]}
+
+def test_edit_keeps_its_own_key_and_unique_values():
+    row = [1, "Ann", "ABC123", "B-1", 10]
+    assert validator().check_keys(COLS, [row], lookup, ["1"]) == {}
+
+def test_edit_to_another_rows_key():
+    row = [2, "Ann", "ABC123", "B-1", 10]
+    assert validator().check_keys(COLS, [row], lookup, [1]) == {0: ["Driver_ID 2 already exists"]}
+
+def test_edit_to_another_rows_unique_value():
+    row = [1, "Ann", "XYZ789", "B-1", 10]
+    assert validator().check_keys(COLS, [row], lookup, [1]) == {0: ["License_Number XYZ789 already exists"]}
+
+def test_case_insensitive_collation_clashes_regardless_of_case():
+    failures = validator().check_keys(COLS, [[None, "Ann", "abc123", "B-9", 10]], lookup)
+    assert failures == {0: ["License_Number abc123 already exists"]}
+    rows = [[None, "Ann", "new1", "B-8", 10], [None, "Bob", "NEW1", "B-9", 10]]
+    assert validator().check_keys(COLS, rows, lookup) == {1: ["License_Number NEW1 already exists"]}
+
+def test_binary_collation_is_case_sensitive():
+    assert validator().check_keys(COLS, [[None, "Ann", "N1", "b-1", 10]], lookup) == {}
+
+def test_missing_foreign_key():
+    failures = validator().check_keys(COLS, [[None, "Ann", "N1", "B-9", 11]], lookup)
+    assert failures == {0: ["Depot_ID 11 does not exist in Depot"]}
+
+def test_foreign_key_values_compare_like_the_referenced_column():
+    cols = COLS + ["Region_Code"]
+    rows = [[None, "Ann", "N1", "B-7", "010", "north"], [None, "Bob", "N2", "B-8", " 10", "North"]]
+    assert validator().check_keys(cols, rows, lookup) == {}
+    failures = validator().check_keys(cols, [[None, "Ann", "N1", "B-7", "10", "south"]], lookup)
+    assert failures == {0: ["Region_Code south does not exist in Region"]}
+
+def test_numeric_primary_key_compares_by_value():
+    assert validator().check_keys(COLS, [["01", "Ann", "N1", "B-9", 10]], lookup) == {
+        0: ["Driver_ID 01 already exists"]}
+    assert validator().check_keys(COLS, [["01", "Ann", "ABC123", "B-1", 10]], lookup, [1]) == {}
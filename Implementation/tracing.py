@@ -0,0 +1,228 @@
+import json
+import time
+import uuid
+import logging
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger("tracing")
+
+# Span names summed into the database and Tk parts of an action
+DB_SPANS = ("pool_wait", "query.execute", "query.fetch")
+UI_SPANS = ("tree.populate", "render")
+
+# Span of the current thread; background threads pick it up through bind()
+current_span = contextvars.ContextVar("current_span", default=None)
+
+class Span:
+    """One timed step of a traced action"""
+
+    __slots__ = ("trace", "name", "span_id", "parent_id", "thread",
+                 "start", "end", "attrs", "error")
+
+    def __init__(self, trace, name, parent_id=None, attrs=None):
+        self.trace = trace
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.thread = threading.current_thread().name
+        self.start = time.perf_counter()
+        self.end = None
+        self.attrs = attrs or {}
+        self.error = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def child(self, name, **attrs):
+        """Start a child span, or return None once the trace is full"""
+        return self.trace.add_span(name, self.span_id, attrs)
+
+    def finish(self, error=None):
+        if self.end is not None:
+            return
+        self.end = time.perf_counter()
+        if error is not None:
+            self.error = str(error)
+        if self is self.trace.root:
+            self.trace.tracer.complete(self.trace)
+
+    @property
+    def duration_ms(self):
+        end = self.end if self.end is not None else time.perf_counter()
+        return (end - self.start) * 1000
+
+    def to_dict(self):
+        entry = {
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "thread": self.thread,
+            "start_ms": round((self.start - self.trace.root.start) * 1000, 3),
+            "duration_ms": round(self.duration_ms, 3),
+            "attrs": self.attrs,
+        }
+        if self.end is None:
+            entry["unfinished"] = True
+        if self.error is not None:
+            entry["error"] = self.error
+        return entry
+
+class Trace:
+    """All spans of one user action"""
+
+    def __init__(self, tracer, name, attrs):
+        self.tracer = tracer
+        self.trace_id = uuid.uuid4().hex
+        self.started_at = time.time()
+        self.lock = threading.Lock()
+        self.spans = []
+        self.dropped = 0
+        self.root = Span(self, name, attrs=attrs)
+        self.spans.append(self.root)
+
+    def add_span(self, name, parent_id, attrs):
+        with self.lock:
+            if len(self.spans) >= self.tracer.max_spans:
+                self.dropped += 1
+                return None
+            span = Span(self, name, parent_id, attrs)
+            self.spans.append(span)
+            return span
+
+    def to_dict(self):
+        with self.lock:
+            spans = list(self.spans)
+        db_ms = sum(s.duration_ms for s in spans if s.name in DB_SPANS)
+        ui_ms = sum(s.duration_ms for s in spans if s.name in UI_SPANS)
+        return {
+            "trace_id": self.trace_id,
+            "action": self.root.name,
+            "started_at": self.started_at,
+            "duration_ms": round(self.root.duration_ms, 3),
+            "db_ms": round(db_ms, 3),
+            "ui_ms": round(ui_ms, 3),
+            "error": self.root.error,
+            "dropped_spans": self.dropped,
+            "spans": [span.to_dict() for span in spans],
+        }
+
+class Tracer:
+    """Keeps the most recent finished traces and optionally appends each
+    one to a JSON lines file"""
+
+    def __init__(self, enabled=True, keep=100, max_spans=500, trace_file=None):
+        """
+        Args:
+            enabled: Create traces at all; when False every call is a no-op
+            keep: Number of finished traces kept in memory
+            max_spans: Spans recorded per trace before further ones are dropped
+            trace_file: JSON lines file receiving every finished trace
+        """
+        self.configure(enabled, keep, max_spans, trace_file)
+
+    def configure(self, enabled=True, keep=100, max_spans=500, trace_file=None):
+        self.enabled = enabled
+        self.max_spans = max_spans
+        self.trace_file = trace_file
+        self.traces = deque(maxlen=keep)
+        self.lock = threading.Lock()
+
+    def start_action(self, name, **attrs):
+        """Start the root span of a user action; finish() it when the
+        result is on screen"""
+        if not self.enabled:
+            return None
+        return Trace(self, name, attrs).root
+
+    def complete(self, trace):
+        with self.lock:
+            self.traces.append(trace)
+        if self.trace_file:
+            try:
+                with open(self.trace_file, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(trace.to_dict(), default=str) + "\n")
+            except OSError as e:
+                logger.error(f"Error writing trace file: {e}")
+        logger.debug(f"Trace {trace.root.name} took {trace.root.duration_ms:.1f}ms")
+
+    def get_traces(self, action=None):
+        """Finished traces as dicts, most recent last"""
+        with self.lock:
+            traces = list(self.traces)
+        return [t.to_dict() for t in traces if action is None or t.root.name == action]
+
+    def export_json(self, filename=None, action=None):
+        """Return the finished traces as JSON, also writing them to filename"""
+        data = json.dumps(self.get_traces(action), indent=2, default=str)
+        if filename:
+            with open(filename, "w", encoding="utf-8") as f:
+                f.write(data)
+        return data
+
+    def clear(self):
+        with self.lock:
+            self.traces.clear()
+
+tracer = Tracer()
+
+start_action = tracer.start_action
+get_traces = tracer.get_traces
+export_json = tracer.export_json
+
+@contextmanager
+def activate(span):
+    """Make span the parent of spans started in this block"""
+    if span is None:
+        yield None
+        return
+    token = current_span.set(span)
+    try:
+        yield span
+    finally:
+        current_span.reset(token)
+
+@contextmanager
+def span(name, **attrs):
+    """Time a child of the current span; a no-op outside a traced action"""
+    parent = current_span.get()
+    child = parent.child(name, **attrs) if parent is not None else None
+    if child is None:
+        yield None
+        return
+    token = current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.finish(e)
+        raise
+    finally:
+        current_span.reset(token)
+        child.finish()
+
+def bind(action, func):
+    """Wrap func so it runs with action as its current span, e.g. as the
+    target of a background thread"""
+    if action is None:
+        return func
+
+    def run(*args, **kwargs):
+        with activate(action):
+            return func(*args, **kwargs)
+    return run
+
+def finish_action(action, widget=None, error=None, **attrs):
+    """Finish an action on the Tk thread, timing the redraw of widget first"""
+    if action is None:
+        return
+    action.set(**attrs)
+    if widget is not None and error is None:
+        render = action.child("render")
+        try:
+            widget.update_idletasks()
+        finally:
+            if render is not None:
+                render.finish()
+    action.finish(error)
@@ -0,0 +1,323 @@
+import time
+import logging
+import threading
+import unicodedata
+from collections import namedtuple
+
+logger = logging.getLogger("trigram_index")
+
+# A row written by insert_data, update_data or delete_data. op is insert,
+# update or delete; values holds the written columns (None for a delete)
+# and key_value is None for an insert whose key the server generated.
+RowChange = namedtuple("RowChange", "op key_column key_value values")
+
+def fold(text):
+    """Lower-case text and drop accents, like the server's default
+    case- and accent-insensitive collation"""
+    text = str(text)
+    if text.isascii():
+        return text.lower()
+    text = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in text if not unicodedata.combining(c)).casefold()
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+class TrigramIndex:
+    """Substring index over the text columns of one table
+
+    Each column maps every three-character sequence of its folded values
+    to the keys of the rows containing it. A search intersects the posting
+    sets of the trigrams of the search term and confirms each candidate
+    against the stored value, so the answer is exact.
+    """
+
+    def __init__(self, key_column, columns):
+        self.key_column = key_column
+        self.columns = list(columns)
+        self.texts = {column: {} for column in self.columns}     # column -> {key: folded text}
+        self.postings = {column: {} for column in self.columns}  # column -> {trigram: {keys}}
+        self.keys = set()
+        self.max_key = None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, key, values):
+        """Index a row; values maps column names to their values"""
+        self.remove(key)
+        self.keys.add(key)
+        if isinstance(key, int) and (self.max_key is None or key > self.max_key):
+            self.max_key = key
+        for column in self.columns:
+            value = values.get(column)
+            if value is None:
+                continue
+            text = fold(value)
+            self.texts[column][key] = text
+            postings = self.postings[column]
+            for gram in trigrams(text):
+                postings.setdefault(gram, set()).add(key)
+
+    def remove(self, key):
+        if key not in self.keys:
+            return
+        self.keys.discard(key)
+        for column in self.columns:
+            text = self.texts[column].pop(key, None)
+            if text is None:
+                continue
+            postings = self.postings[column]
+            for gram in trigrams(text):
+                keys = postings.get(gram)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del postings[gram]
+
+    def values(self, key):
+        """The indexed values of a row (folded), for merging an update"""
+        return {column: self.texts[column].get(key) for column in self.columns}
+
+    def search(self, column, term):
+        """Keys of the rows whose column contains term"""
+        term = fold(term)
+        texts = self.texts[column]
+        if len(term) < 3:
+            # Too short for trigrams; the stored values are scanned instead
+            return {key for key, text in texts.items() if term in text}
+
+        postings = self.postings[column]
+        sets = sorted((postings.get(gram, ()) for gram in trigrams(term)), key=len)
+        if not sets or not sets[0]:
+            return set()
+        candidates = set(sets[0]).intersection(*sets[1:])
+        return {key for key in candidates if term in texts[key]}
+
+    def trigram_count(self):
+        return sum(len(postings) for postings in self.postings.values())
+
+class Entry:
+    """Index of one table and its build state"""
+
+    def __init__(self):
+        self.index = None
+        self.state = "new"  # new, building, updating, ready, stale, unavailable
+        self.pending = []   # changes that arrived while building
+        self.dirty = False  # rows changed in a way the index could not follow
+        self.worker = None
+        self.built_at = 0.0
+
+class SearchIndexes:
+    """Trigram indexes of the searchable tables, built in the background
+
+    A table's index is built the first time it is searched, from rows
+    streamed by load(); until then search() returns None and callers run
+    their SQL search. Writes made through the write helpers are applied
+    to the index as they happen. Other writes, including those of other
+    processes, are picked up by a rebuild: at once when this process
+    made them, otherwise after refresh_after seconds.
+    """
+
+    def __init__(self, describe, load, tables=(), max_rows=200000, refresh_after=300):
+        """
+        Args:
+            describe: describe(table) -> (key column, text columns,
+                auto_increment) or None if the table cannot be indexed
+            load: load(table, key column, columns, after=None) -> rows of
+                (key, *values), only keys greater than after if given
+            tables: Table names to index, or ["*"] for every table
+            max_rows: Tables with more rows are not indexed
+            refresh_after: Seconds after which an index is rebuilt to pick
+                up writes made by other processes; 0 never rebuilds
+        """
+        self.describe = describe
+        self.load = load
+        self.tables = {table.lower() for table in tables}
+        self.max_rows = max_rows
+        self.refresh_after = refresh_after
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.stats = {"searches": 0, "answered": 0, "fallbacks": 0, "builds": 0, "build_errors": 0}
+
+    def enabled(self, table):
+        return bool(self.tables) and ("*" in self.tables or str(table).lower() in self.tables)
+
+    def search(self, table, criteria):
+        """Sorted keys of the rows matching every (column, term) pair, or
+        None when the index cannot answer (not built yet, a column is not
+        indexed or a term uses LIKE wildcards)"""
+        if not self.enabled(table):
+            return None
+        criteria = [(column, term) for column, term in criteria if term]
+        with self.lock:
+            self.stats["searches"] += 1
+            entry = self._entry(table)
+            index = entry.index if entry.state in ("ready", "stale") and not entry.dirty else None
+            usable = index is not None and criteria and all(
+                column in index.texts and not any(c in str(term) for c in "%_\\")
+                for column, term in criteria
+            )
+            if not usable:
+                self.stats["fallbacks"] += 1
+                return None
+
+            keys = None
+            for column, term in criteria:
+                found = index.search(column, str(term))
+                keys = found if keys is None else keys & found
+                if not keys:
+                    break
+            self.stats["answered"] += 1
+        try:
+            return sorted(keys)
+        except TypeError:
+            return sorted(keys, key=str)
+
+    def key_column(self, table):
+        with self.lock:
+            entry = self.entries.get(str(table).lower())
+            return entry.index.key_column if entry and entry.index else None
+
+    def _entry(self, table):
+        """Entry of a table, starting a build when needed (lock held)"""
+        name = str(table).lower()
+        entry = self.entries.get(name)
+        if entry is None:
+            entry = self.entries[name] = Entry()
+        if entry.worker is None:
+            if entry.state == "new" or entry.dirty:
+                self._start(table, entry, "building")
+            elif entry.state == "ready" and self.refresh_after and \
+                    time.monotonic() - entry.built_at > self.refresh_after:
+                self._start(table, entry, "stale")  # still answers while it is rebuilt
+        return entry
+
+    def _start(self, table, entry, state, after=None):
+        """Build the index in the background (lock held); state is building
+        or stale for a full build, updating to load the rows after a key"""
+        full = state != "updating"
+        entry.state = state
+        entry.pending = []
+        entry.dirty = False
+        entry.worker = threading.Thread(target=self._build, args=(table, entry, full, after),
+                                        name=f"index-{table}", daemon=True)
+        entry.worker.start()
+
+    def _build(self, table, entry, full, after):
+        start = time.perf_counter()
+        try:
+            described = self.describe(table)
+            if not described or not described[1]:
+                with self.lock:
+                    entry.state = "unavailable"
+                    entry.worker = None
+                logger.info(f"Table {table} has no single-column key or text columns to index")
+                return
+            key_column, columns, auto_increment = described
+            index = TrigramIndex(key_column, columns) if full else None
+            rows = []
+            for row in self.load(table, key_column, columns, after=after):
+                if full:
+                    index.add(row[0], dict(zip(columns, row[1:])))
+                    if len(index) > self.max_rows:
+                        raise OverflowError(f"more than {self.max_rows} rows")
+                else:
+                    rows.append(row)
+        except OverflowError as e:
+            with self.lock:
+                entry.index = None
+                entry.state = "unavailable"
+                entry.worker = None
+            logger.info(f"Not indexing {table}: {e}")
+            return
+        except Exception as e:
+            with self.lock:
+                self.stats["build_errors"] += 1
+                entry.index = None
+                entry.state = "new"  # retried on the next search
+                entry.worker = None
+            logger.error(f"Error building search index for {table}: {e}")
+            return
+
+        with self.lock:
+            if full:
+                entry.index = index
+                entry.built_at = time.monotonic()
+                self.stats["builds"] += 1
+            else:
+                for row in rows:
+                    entry.index.add(row[0], dict(zip(columns, row[1:])))
+            entry.state = "ready"
+            entry.worker = None
+            pending, entry.pending = entry.pending, []
+            for change in pending:
+                self._apply(table, entry, change)
+        logger.info(f"Search index for {table} {'built' if full else 'updated'}: "
+                    f"{len(entry.index)} rows in {(time.perf_counter() - start) * 1000:.0f}ms")
+
+    def on_change(self, table, row):
+        """Apply a write to the index of table; row is a RowChange, or
+        None when unknown rows were modified"""
+        if not self.enabled(table):
+            return
+        with self.lock:
+            entry = self.entries.get(str(table).lower())
+            if entry is None or entry.state in ("new", "unavailable"):
+                return
+            if entry.worker is not None:
+                entry.pending.append(row)
+                return
+            self._apply(table, entry, row)
+
+    def _apply(self, table, entry, row):
+        """Apply one change (lock held); falls back to a rebuild"""
+        index = entry.index
+        if index is None:
+            return
+        if row is None:
+            entry.dirty = True
+            return
+
+        if row.key_column != index.key_column:
+            if row.op == "insert" and row.key_value is None:
+                # Generated key: load the rows added after the highest known one
+                if index.max_key is not None:
+                    self._start(table, entry, "updating", after=index.max_key)
+                    return
+            entry.dirty = True
+            return
+
+        if row.op == "insert":
+            index.add(row.key_value, row.values or {})
+        elif row.key_value not in index.keys:
+            # An unknown key (a row added elsewhere, or a key of another
+            # type) must not leave stale hits behind
+            entry.dirty = True
+        elif row.op == "delete":
+            index.remove(row.key_value)
+        else:
+            values = index.values(row.key_value)
+            values.update(row.values or {})
+            key = (row.values or {}).get(index.key_column, row.key_value)
+            index.remove(row.key_value)
+            index.add(key, values)
+
+    def invalidate(self, table=None):
+        """Rebuild the index of table (or every index) on its next search"""
+        with self.lock:
+            for name, entry in self.entries.items():
+                if table is None or name == str(table).lower():
+                    entry.dirty = True
+
+    def get_stats(self):
+        with self.lock:
+            tables = {
+                name: {
+                    "state": "dirty" if entry.dirty else entry.state,
+                    "rows": len(entry.index) if entry.index else 0,
+                    "trigrams": entry.index.trigram_count() if entry.index else 0,
+                }
+                for name, entry in self.entries.items()
+            }
+            return dict(self.stats, tables=tables)
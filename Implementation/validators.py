@@ -0,0 +1,353 @@
+import re
+import logging
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+logger = logging.getLogger("validators")
+
+# Signed ranges of the MySQL integer types
+INT_RANGES = {
+    "tinyint": (-2**7, 2**7 - 1),
+    "smallint": (-2**15, 2**15 - 1),
+    "mediumint": (-2**23, 2**23 - 1),
+    "int": (-2**31, 2**31 - 1),
+    "integer": (-2**31, 2**31 - 1),
+    "bigint": (-2**63, 2**63 - 1),
+}
+
+DATE_RE = re.compile(r"^(\d{4})-(\d{2})-(\d{2})$")
+DATETIME_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d")
+
+def _is_empty(value):
+    return value is None or value == ""
+
+def _int_check(col):
+    low, high = INT_RANGES[col["data_type"]]
+    if "unsigned" in col["column_type"]:
+        low, high = 0, high * 2 + 1
+    name = col["name"]
+
+    def check(value):
+        if isinstance(value, bool):
+            value = int(value)
+        if not isinstance(value, int):
+            text = str(value).strip()
+            if not text.lstrip("-").isdigit():
+                return f"{name} must be a number"
+            value = int(text)
+        if value < low or value > high:
+            return f"{name} must be between {low} and {high}"
+        return None
+    return check
+
+def _decimal_check(col):
+    precision = col["precision"] or 10
+    scale = col["scale"] or 0
+    max_whole_digits = precision - scale
+    unsigned = "unsigned" in col["column_type"]
+    name = col["name"]
+
+    def check(value):
+        try:
+            number = value if isinstance(value, Decimal) else Decimal(str(value).strip())
+        except InvalidOperation:
+            return f"{name} must be a number"
+        if not number.is_finite():
+            return f"{name} must be a number"
+        if unsigned and number < 0:
+            return f"{name} cannot be negative"
+        sign, digits, exponent = number.as_tuple()
+        decimals = max(-exponent, 0)
+        whole_digits = max(len(digits) + exponent, 0) if number else 0
+        if whole_digits > max_whole_digits:
+            return f"{name} must have at most {max_whole_digits} digits before the decimal point"
+        if decimals > scale:
+            return f"{name} must have at most {scale} decimal places"
+        return None
+    return check
+
+def _float_check(col):
+    name = col["name"]
+
+    def check(value):
+        try:
+            float(value)
+        except (TypeError, ValueError):
+            return f"{name} must be a number"
+        return None
+    return check
+
+def _length_check(col):
+    max_length = col["max_length"]
+    name = col["name"]
+
+    def check(value):
+        if len(str(value)) > max_length:
+            return f"{name} must be at most {max_length} characters"
+        return None
+    return check
+
+def _date_check(col):
+    name = col["name"]
+
+    def check(value):
+        if isinstance(value, date):
+            return None
+        # A regex and date() are much faster than strptime for bulk imports
+        match = DATE_RE.match(str(value).strip())
+        try:
+            if match:
+                date(*map(int, match.groups()))
+                return None
+        except ValueError:
+            pass
+        return f"{name} must be a valid date (YYYY-MM-DD)"
+
+    return check
+
+def _datetime_check(col):
+    name = col["name"]
+
+    def check(value):
+        if isinstance(value, (date, datetime)):
+            return None
+        text = str(value).strip()
+        for fmt in DATETIME_FORMATS:
+            try:
+                datetime.strptime(text, fmt)
+                return None
+            except ValueError:
+                pass
+        return f"{name} must be a valid date and time (YYYY-MM-DD HH:MM:SS)"
+    return check
+
+def _time_check(col):
+    name = col["name"]
+
+    def check(value):
+        text = str(value).strip()
+        for fmt in ("%H:%M:%S", "%H:%M"):
+            try:
+                datetime.strptime(text, fmt)
+                return None
+            except ValueError:
+                pass
+        return f"{name} must be a valid time (HH:MM:SS)"
+    return check
+
+def key_normalizer(col):
+    """Return a function giving a value as the server compares it in col:
+    numbers by value ("07" is 7) and text of _ci collations ignoring case"""
+    data_type = (col or {}).get("data_type")
+    if data_type in INT_RANGES:
+        def normalize(value):
+            try:
+                return int(str(value).strip())
+            except ValueError:
+                return str(value)
+    elif data_type in ("decimal", "numeric"):
+        def normalize(value):
+            try:
+                return Decimal(str(value).strip())
+            except InvalidOperation:
+                return str(value)
+    elif ((col or {}).get("collation") or "").endswith("_ci"):
+        def normalize(value):
+            return str(value).casefold()
+    else:
+        normalize = str
+    return normalize
+
+def compile_column_checks(col):
+    """Build the list of value checks for one column's metadata"""
+    data_type = col["data_type"]
+    checks = []
+    if data_type in INT_RANGES:
+        checks.append(_int_check(col))
+    elif data_type in ("decimal", "numeric"):
+        checks.append(_decimal_check(col))
+    elif data_type in ("float", "double", "real"):
+        checks.append(_float_check(col))
+    elif data_type == "date":
+        checks.append(_date_check(col))
+    elif data_type in ("datetime", "timestamp"):
+        checks.append(_datetime_check(col))
+    elif data_type == "time":
+        checks.append(_time_check(col))
+    elif col["max_length"] and data_type in ("char", "varchar", "tinytext", "text"):
+        checks.append(_length_check(col))
+    return checks
+
+class TableValidator:
+    """Validates rows for one table using cached column metadata
+
+    Type, range, length and NOT NULL checks run entirely in-process.
+    UNIQUE and foreign key checks need the database and are done in
+    batches by check_keys().
+    """
+
+    def __init__(self, table, columns, primary_key=(), unique_columns=(), foreign_keys=()):
+        self.table = table
+        self.primary_key = list(primary_key)
+        self.unique_columns = list(unique_columns)
+        # Key values are compared as the server compares them, e.g.
+        # regardless of case for a case-insensitive collation
+        self.normalizers = {col["name"]: key_normalizer(col) for col in columns}
+        # A foreign key may carry ref_meta, the catalog dict of the
+        # referenced column, so its values compare the same way
+        self.foreign_keys = {
+            fk["column"]: (fk["ref_table"], fk["ref_column"], key_normalizer(fk.get("ref_meta")))
+            for fk in foreign_keys
+        }
+        self.checks = {}
+        self.required = set()
+        for col in columns:
+            self.checks[col["name"]] = compile_column_checks(col)
+            if not col["nullable"] and "auto_increment" not in col["extra"]:
+                self.required.add(col["name"])
+
+    def validate(self, data_dict):
+        """Return a list of error messages for one row given as {column: value}"""
+        errors = []
+        for col_name, value in data_dict.items():
+            if _is_empty(value):
+                if col_name in self.required:
+                    errors.append(f"{col_name} is required")
+                continue
+            for check in self.checks.get(col_name, ()):
+                error = check(value)
+                if error:
+                    errors.append(error)
+                    break
+        return errors
+
+    def validate_many(self, columns, rows):
+        """Validate rows given as sequences in the order of columns
+
+        Returns {row index: [errors]} for the rows that failed.
+        """
+        checks = [self.checks.get(col, ()) for col in columns]
+        required = [col in self.required for col in columns]
+        failures = {}
+        for i, row in enumerate(rows):
+            errors = []
+            for col_name, col_checks, is_required, value in zip(columns, checks, required, row):
+                if _is_empty(value):
+                    if is_required:
+                        errors.append(f"{col_name} is required")
+                    continue
+                for check in col_checks:
+                    error = check(value)
+                    if error:
+                        errors.append(error)
+                        break
+            if errors:
+                failures[i] = errors
+        return failures
+
+    def _key(self, col, value):
+        """A value as the server compares it in col"""
+        return self.normalizers.get(col, str)(value)
+
+    def check_keys(self, columns, rows, lookup, original_keys=None):
+        """Pre-check primary key, UNIQUE and foreign key constraints for a
+        batch of rows
+
+        Args:
+            columns: Column names in row order
+            rows: Row sequences
+            lookup: Callable lookup(table, column, values, extra_column=None)
+                returning rows of (value,) or (value, extra) for the values
+                that exist in table.column
+            original_keys: Primary key each row has in the table when it is
+                being edited, None for a new row; all rows are new if omitted
+
+        Returns {row index: [errors]} for the rows that would fail.
+        """
+        failures = {}
+        position = {col: i for i, col in enumerate(columns)}
+        pk_column = self.primary_key[0] if len(self.primary_key) == 1 else None
+        original_keys = list(original_keys or [None] * len(rows))
+
+        # Foreign keys: every referenced value must exist
+        for col, (ref_table, ref_column, normalize) in self.foreign_keys.items():
+            if col not in position:
+                continue
+            i = position[col]
+            values = {row[i] for row in rows if not _is_empty(row[i])}
+            if not values:
+                continue
+            existing = {normalize(r[0]) for r in lookup(ref_table, ref_column, values)}
+            for n, row in enumerate(rows):
+                if not _is_empty(row[i]) and normalize(row[i]) not in existing:
+                    failures.setdefault(n, []).append(f"{col} {row[i]} does not exist in {ref_table}")
+
+        # Primary key: a new row, or an edited row given a new key, must
+        # not take the key of another row
+        if pk_column in position:
+            i = position[pk_column]
+            changed = [
+                n for n, row in enumerate(rows)
+                if not _is_empty(row[i]) and (original_keys[n] is None
+                                              or self._key(pk_column, row[i]) != self._key(pk_column, original_keys[n]))
+            ]
+            if changed:
+                existing = {self._key(pk_column, r[0])
+                            for r in lookup(self.table, pk_column, {rows[n][i] for n in changed})}
+                seen = set()
+                for n in changed:
+                    key = self._key(pk_column, rows[n][i])
+                    if key in existing or key in seen:
+                        failures.setdefault(n, []).append(f"{pk_column} {rows[n][i]} already exists")
+                    seen.add(key)
+
+        # Unique columns: no other row may hold the value already
+        for col in self.unique_columns:
+            if col not in position:
+                continue
+            i = position[col]
+            values = {row[i] for row in rows if not _is_empty(row[i])}
+            if not values:
+                continue
+            owners = {}
+            for r in lookup(self.table, col, values, pk_column):
+                owners.setdefault(self._key(col, r[0]), set()).add(
+                    self._key(pk_column, r[1]) if len(r) > 1 else None)
+            seen = set()
+            for n, row in enumerate(rows):
+                value = row[i]
+                if _is_empty(value):
+                    continue
+                key = self._key(col, value)
+                # The row being edited may keep its own value
+                own_key = self._key(pk_column, original_keys[n]) if original_keys[n] is not None else None
+                holders = owners.get(key, set()) - {own_key}
+                if holders or key in seen:
+                    failures.setdefault(n, []).append(f"{col} {value} already exists")
+                seen.add(key)
+        return failures
+
+def compile_validator(catalog, table):
+    """Build a TableValidator from the schema catalog"""
+    columns = catalog.columns(table)
+    if not columns:
+        raise ValueError(f"Unknown table: {table}")
+
+    # The primary key is checked on its own by check_keys
+    primary_key = catalog.primary_key(table)
+    unique_columns = [
+        index["columns"][0]
+        for name, index in catalog.indexes(table).items()
+        if index["unique"] and len(index["columns"]) == 1 and index["columns"][0] not in primary_key
+    ]
+    foreign_keys = [
+        dict(fk, ref_meta=catalog.column(fk["ref_table"], fk["ref_column"]))
+        for fk in catalog.foreign_keys(table)
+    ]
+    return TableValidator(
+        table,
+        columns,
+        primary_key=primary_key,
+        unique_columns=unique_columns,
+        foreign_keys=foreign_keys,
+    )